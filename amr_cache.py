@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# amr_cache.py
+# On-disk AMR parse cache shared by the parse_amr_sentences*.py scripts, test_parser.py
+# and the inline AMR step of openAI_generator_parsing_test_3.5.py. Entries map
+# (AMR model id, normalized sentence) -> penman graph, so a sentence is parsed once per
+# model no matter which script or run meets it again. Same SQLite store as
+# llm_cache.ResponseCache (rollback journal), so parallel Slurm tasks on any node can
+# share one file.
+#
+# The model is only loaded when something misses: re-running the role detectors after a
+# rule change over already parsed sentences never touches AMR3-structbart-L.
+#
+# Bypass with --no-amr-cache, or AMR_CACHE=off.
+import os
+import json
+import time
+import hashlib
+import unicodedata
+
+from llm_cache import ResponseCache
+from amr_parsing import AMRGraph
+
+DEFAULT_AMR_CACHE_PATH = os.getenv(
+    "AMR_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "amr_parse_cache.sqlite")
+)
+DEFAULT_AMR_MAX_MB = 256
+
+
+def normalize_sentence(sentence):
+    """NFC, whitespace collapsed. Case and punctuation are kept: the parser reads both."""
+    return " ".join(unicodedata.normalize("NFC", sentence).split())
+
+
+def parse_key(model_id, sentence):
+    raw = json.dumps([model_id, normalize_sentence(sentence)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ParseCache(ResponseCache):
+    """(model id, normalized sentence) -> penman store; size cap, LRU eviction and hit stats as in ResponseCache."""
+
+    def __init__(self, path=DEFAULT_AMR_CACHE_PATH, max_mb=DEFAULT_AMR_MAX_MB, enabled=None):
+        if enabled is None:
+            enabled = os.getenv("AMR_CACHE", "on").lower() not in ("0", "off", "false", "no")
+        # A graph only depends on the model and the sentence: entries never expire by age
+        super().__init__(path=path, max_mb=max_mb, max_age_days=0, enabled=enabled)
+
+    def get(self, model_id, sentence):
+        found = self.get_many(model_id, [sentence])
+        return found.get(normalize_sentence(sentence))
+
+    def get_many(self, model_id, sentences):
+        """{normalized sentence: penman} for the cached ones; one hit or miss per distinct sentence."""
+        if not self.enabled:
+            return {}
+        keys = {}
+        for sentence in sentences:
+            norm = normalize_sentence(sentence)
+            keys.setdefault(parse_key(model_id, norm), norm)
+        found = {}
+        key_list = list(keys)
+        with self.lock:
+            for j in range(0, len(key_list), 500):  # stay under SQLite's bound-variable limit
+                chunk = key_list[j:j + 500]
+                rows = self.db.execute(
+                    "SELECT key, response FROM responses WHERE key IN ({})".format(",".join("?" * len(chunk))), chunk
+                ).fetchall()
+                for key, penman in rows:
+                    found[keys[key]] = penman
+            self.touch(parse_key(model_id, norm) for norm in found)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, model_id, sentence, penman):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (parse_key(model_id, sentence), model_id, penman, len(penman.encode("utf-8")), now, now),
+            )
+            self.db.commit()
+
+    def report(self):
+        """Print the end-of-run hit/miss summary."""
+        if not self.enabled:
+            print("[AMR-CACHE] disabled (--no-amr-cache / AMR_CACHE=off)")
+            return
+        s = self.stats()
+        print("[AMR-CACHE] hits: {}, misses: {}, hit rate: {:.1%}, graphs: {}, size: {:.1f} MB ({})".format(
+            s["hits"], s["misses"], s["hit_rate"], s["entries"], s["bytes"] / 1e6, self.path))
+
+
+def parse_cached(cache, sentences, parse, model_id, graphs=False):
+    """
+    Yield (index, penman, error) for every sentence in INPUT order, like
+    amr_parsing.parse_batched. Cached graphs are served without the model; the distinct
+    missing sentences (normalized) are handed to `parse(missing)` in a single call,
+    which must yield (index, penman, error) over them in order -- parse_batched or
+    ParsePool.parse. It isn't called at all when everything hits, so load the parser
+    inside it. New graphs are stored as they arrive; errors are not cached.
+
+    graphs=True yields AMRGraphs: cached text is decoded, and `parse` may yield
+    AMRGraphs too (AMRClient.parse(missing, graphs=True)), serialized only for the cache.
+    """
+    norms = [normalize_sentence(s) for s in sentences]
+    done = {norm: (penman, None) for norm, penman in cache.get_many(model_id, norms).items()}
+    missing = list(dict.fromkeys(norm for norm in norms if norm not in done))
+    results = parse(missing) if missing else iter(())
+    for i, norm in enumerate(norms):
+        while norm not in done:
+            j, penman, error = next(results)
+            done[missing[j]] = (penman, error)
+            if error is None:
+                cache.put(model_id, missing[j], penman if isinstance(penman, str) else penman.penman)
+        if graphs and isinstance(done[norm][0], str):
+            try:
+                done[norm] = (AMRGraph.from_penman(done[norm][0]), None)  # repeated sentences decode once
+            except Exception as e:
+                done[norm] = (None, e)
+        yield (i,) + done[norm]
+
+
+def add_amr_cache_args(parser):
+    """Add the --no-amr-cache / --amr-cache-path / --amr-cache-max-mb flags."""
+    parser.add_argument("--no-amr-cache", action="store_true",
+                        help="Bypass the on-disk AMR parse cache (always run the parser).")
+    parser.add_argument("--amr-cache-path", default=DEFAULT_AMR_CACHE_PATH,
+                        help="SQLite file for the AMR parse cache.")
+    parser.add_argument("--amr-cache-max-mb", type=float, default=DEFAULT_AMR_MAX_MB,
+                        help="Evict least-recently-used graphs above this size.")
+    return parser
+
+
+def amr_cache_from_args(args):
+    return ParseCache(
+        path=args.amr_cache_path,
+        max_mb=args.amr_cache_max_mb,
+        enabled=False if args.no_amr_cache else None,
+    )
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+# amr_parsing.py
+# Batched AMR parsing for the parse_amr_sentences*.py scripts. Instead of
+# tokenize + parse_sentence per sentence (the model at batch size 1), every sentence is
+# tokenized up front, sentences of similar token length are parsed together through
+# the parser's batch API, and results come back in input order.
+#
+# A batch that raises is split in halves and retried, down to single sentences, so one
+# sentence the parser chokes on costs only its own result, not its whole batch.
+#
+# ParsePool parallelises that across processes without a model copy per process: the
+# parser is loaded once in the parent and workers are forked afterwards, so they share
+# its weights copy-on-write.
+#
+# AMRClient is what the scripts parse through: it sends sentences to a running
+# amr_server.py when one answers, and only otherwise loads the parser in-process.
+#
+# AMRGraph gives the role detectors concepts and edges read straight from the parser's
+# AMR object, so in-process parses skip the to_penman -> penman.decode round trip; text
+# only gets decoded when it is all there is (cached graphs, the daemon, pool workers).
+import os
+import gc
+import re
+import sys
+import json
+import time
+import multiprocessing
+import urllib.error
+import urllib.request
+
+DEFAULT_MODEL = "AMR3-structbart-L"
+DEFAULT_SERVER = os.getenv("AMR_SERVER", "http://127.0.0.1:8091")
+
+
+def load_parser(model_id=DEFAULT_MODEL):
+    from transition_amr_parser.parse import AMRParser
+
+    return AMRParser.from_pretrained(model_id)
+
+
+def to_penman(machine):
+    return machine.get_amr().to_penman(jamr=False, isi=True)
+
+
+def to_graph(machine):
+    return AMRGraph.from_amr(machine.get_amr())
+
+
+def tokenize_all(parser, sentences):
+    """[(tokens, None) | (None, error)] for every sentence."""
+    out = []
+    for sentence in sentences:
+        try:
+            tokens, _ = parser.tokenize(sentence)
+            out.append((tokens, None) if tokens else (None, ValueError("no tokens")))
+        except Exception as e:
+            out.append((None, e))
+    return out
+
+
+def length_buckets(token_lists, indices, batch_size, window=8):
+    """
+    Batches of `indices` with similar token counts (less padding per batch). Sorting
+    happens within windows of `window` batches, so early sentences aren't held back
+    until the end of the run.
+    """
+    span = max(1, batch_size) * max(1, window)
+    batches = []
+    for w in range(0, len(indices), span):
+        order = sorted(indices[w:w + span], key=lambda i: -len(token_lists[i]))
+        batches.extend(order[j:j + batch_size] for j in range(0, len(order), batch_size))
+    return batches
+
+
+def _parse_isolating(parser, token_lists, batch, convert=to_penman):
+    """{index: (convert(machine), error)} for one batch; a failing batch is bisected to isolate the bad sentences."""
+    try:
+        _, machines = parser.parse_sentences([token_lists[i] for i in batch], batch_size=len(batch))
+        results = {}
+        for i, machine in zip(batch, machines):
+            try:
+                results[i] = (convert(machine), None)
+            except Exception as e:
+                results[i] = (None, e)
+        return results
+    except Exception as e:
+        if len(batch) == 1:
+            return {batch[0]: (None, e)}
+        half = len(batch) // 2
+        results = _parse_isolating(parser, token_lists, batch[:half], convert)
+        results.update(_parse_isolating(parser, token_lists, batch[half:], convert))
+        return results
+
+
+def parse_batched(parser, sentences, batch_size=32, window=8, convert=to_penman):
+    """
+    Yield (index, penman, error) for every sentence in INPUT order; exactly one of
+    penman / error is None. Parsing runs length-bucketed batches of `batch_size`.
+    convert=to_graph yields AMRGraphs instead of penman text.
+    """
+    tokenized = tokenize_all(parser, sentences)
+    token_lists = [tokens for tokens, _ in tokenized]
+    ok = [i for i, (tokens, _) in enumerate(tokenized) if tokens is not None]
+    done = {i: (None, err) for i, (tokens, err) in enumerate(tokenized) if tokens is None}
+    nxt = 0
+    for batch in length_buckets(token_lists, ok, max(1, batch_size), window):
+        done.update(_parse_isolating(parser, token_lists, batch, convert))
+        while nxt in done:
+            yield (nxt,) + done.pop(nxt)
+            nxt += 1
+    while nxt in done:
+        yield (nxt,) + done.pop(nxt)
+        nxt += 1
+
+
+class ParseStats:
+    """sentences/sec for the end-of-run [AMR] line."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.parsed = 0
+        self.failed = 0
+
+    def add(self, error):
+        if error is None:
+            self.parsed += 1
+        else:
+            self.failed += 1
+
+    def report(self, batch_size):
+        dt = time.perf_counter() - self.t0
+        n = self.parsed + self.failed
+        print("[AMR] {} sentences in {:.1f}s ({:.2f} sentences/s, batch size {}); {} failed".format(
+            n, dt, n / dt if dt else 0.0, batch_size, self.failed))
+        sys.stdout.flush()
+
+
+# ==== Graphs without the penman round trip ====
+ROLE_EDGES = {"Agent": ":ARG0", "Patient": ":ARG1", "Instrument": ":instrument", "Location": ":location"}
+_NUMBER_RE = re.compile(r"^-?[0-9][0-9.:/]*$")
+
+
+def _is_constant(concept):
+    return concept.startswith('"') or concept in ("-", "+") or bool(_NUMBER_RE.match(concept))
+
+
+class AMRGraph:
+    """
+    One parse as `concepts` {variable: concept} and `edges` [(source, role, target)]:
+    the triples penman.decode gives for the serialized graph, i.e. inverted roles
+    (:ARG1-of) turned around and constants ("Bob", 5, -) as literal targets. Built from
+    the parser's AMR object without serializing (from_amr), or from penman text
+    (from_penman). `penman` serializes on first use, so only for output.
+    """
+
+    def __init__(self, concepts, edges, top, amr=None, penman=None):
+        self.concepts = concepts
+        self.edges = edges
+        self.top = top
+        self._amr = amr
+        self._penman = penman
+
+    @classmethod
+    def from_amr(cls, amr):
+        sources = {s for s, _, _ in amr.edges}
+        # leaf strings / numbers / polarity are written as attributes, not as variables
+        constants = {n for n, c in amr.nodes.items() if n not in sources and n != amr.root and _is_constant(c)}
+        edges = []
+        for s, role, t in amr.edges:
+            role = role if role.startswith(":") else ":" + role
+            if t in constants:
+                edges.append((s, role, amr.nodes[t]))
+            elif role.endswith("-of"):
+                edges.append((t, role[:-3], s))
+            else:
+                edges.append((s, role, t))
+        concepts = {n: c for n, c in amr.nodes.items() if n not in constants}
+        return cls(concepts, edges, amr.root, amr=amr)
+
+    @classmethod
+    def from_penman(cls, text):
+        import penman
+
+        g = penman.decode(text)
+        concepts = {s: t for s, r, t in g.triples if r == ":instance"}
+        edges = [(s, r, t) for s, r, t in g.triples if r != ":instance"]
+        return cls(concepts, edges, g.top, penman=text)
+
+    @property
+    def penman(self):
+        if self._penman is None:
+            self._penman = self._amr.to_penman(jamr=False, isi=True)
+        return self._penman
+
+    def roles(self):
+        """{role: bool} -- an :ARG0 / :ARG1 / :instrument / :location edge anywhere in the graph."""
+        found = {r for _, r, _ in self.edges}
+        return {name: edge in found for name, edge in ROLE_EDGES.items()}
+
+
+def as_graphs(results):
+    """(index, penman text, error) -> (index, AMRGraph, error); unparseable text becomes the error."""
+    for i, penman, error in results:
+        if error is None and isinstance(penman, str):
+            try:
+                penman = AMRGraph.from_penman(penman)
+            except Exception as e:
+                penman, error = None, e
+        yield i, penman, error
+
+
+# ==== Fork-after-load worker pool ====
+_WORKER_PARSER = None  # set in the parent before forking; the children inherit it
+
+
+def _cpu_count():
+    if os.environ.get("SLURM_CPUS_PER_TASK"):
+        return int(os.environ["SLURM_CPUS_PER_TASK"])
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def _init_worker(threads):
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def _parse_chunk(job):
+    sentences, batch_size = job
+    # Exceptions travel back as text: not every parser exception pickles
+    return [(penman, None if err is None else "{}: {}".format(type(err).__name__, err))
+            for _, penman, err in parse_batched(_WORKER_PARSER, sentences, batch_size)]
+
+
+def _memory_mb(pid):
+    """(RSS, PSS) of one process in MB. PSS splits shared pages between the processes sharing them."""
+    values = {}
+    try:
+        with open("/proc/{}/smaps_rollup".format(pid)) as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] in ("Rss:", "Pss:"):
+                    values[parts[0]] = int(parts[1]) / 1024
+    except OSError:
+        pass
+    return values.get("Rss:", 0.0), values.get("Pss:", 0.0)
+
+
+class ParsePool:
+    """
+    Workers forked after the parser is loaded. Sentences go out in chunks of
+    `chunk_size` and come back in input order; each worker parses its chunk with
+    parse_batched. Torch threads are split between workers (threads per worker =
+    allocated CPUs // workers unless given). Load the parser but don't parse in the
+    parent before creating the pool: forking after torch has started its thread pool
+    can hang the children.
+    """
+
+    def __init__(self, parser, workers, threads=None):
+        global _WORKER_PARSER
+        _WORKER_PARSER = parser
+        self.workers = workers
+        self.threads = threads or max(1, _cpu_count() // workers)
+        # Objects that exist at fork time leave the GC's bookkeeping, so collections in
+        # the children don't write to (and copy) the pages holding the model
+        gc.collect()
+        gc.freeze()
+        self.pool = multiprocessing.get_context("fork").Pool(workers, _init_worker, (self.threads,))
+
+    def parse(self, sentences, chunk_size=16, batch_size=1):
+        """Yield (index, penman, error) in input order, like parse_batched."""
+        jobs = [(sentences[j:j + chunk_size], batch_size) for j in range(0, len(sentences), chunk_size)]
+        for k, results in enumerate(self.pool.imap(_parse_chunk, jobs)):
+            for j, (penman, err) in enumerate(results):
+                yield k * chunk_size + j, penman, None if err is None else RuntimeError(err)
+
+    def memory(self):
+        """(total RSS, total PSS) in MB over the parent and its workers."""
+        pids = [os.getpid()] + [p.pid for p in self.pool._pool]
+        usage = [_memory_mb(pid) for pid in pids]
+        return sum(r for r, _ in usage), sum(p for _, p in usage)
+
+    def report(self):
+        rss, pss = self.memory()
+        print("[POOL] {} workers x {} threads; memory over parent + workers: RSS {:.0f} MB summed, "
+              "PSS {:.0f} MB (shared weights counted once)".format(self.workers, self.threads, rss, pss))
+        sys.stdout.flush()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        gc.unfreeze()
+
+
+# ==== Daemon client ====
+def find_server(url=DEFAULT_SERVER, model_id=DEFAULT_MODEL, timeout=2.0):
+    """`url` if an amr_server.py with `model_id` loaded answers there, else None."""
+    if not url:
+        return None
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/health", timeout=timeout) as resp:
+            health = json.loads(resp.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    return url if health.get("ok") and health.get("model") == model_id else None
+
+
+def parse_remote(url, sentences, batch_size=64, timeout=3600):
+    """
+    Same (index, penman, error) stream as parse_batched, parsed by the amr_server.py at
+    `url`; sends `batch_size` sentences per request.
+    """
+    step = max(1, batch_size)
+    for j in range(0, len(sentences), step):
+        chunk = sentences[j:j + step]
+        req = urllib.request.Request(url.rstrip("/") + "/parse", data=json.dumps({"sentences": chunk}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                body = json.loads(resp.read())
+            graphs, errors = body["graphs"], [None if e is None else RuntimeError(e) for e in body["errors"]]
+        except urllib.error.HTTPError as e:
+            err = RuntimeError(f"server error {e.code}: {e.read().decode('utf-8', 'replace')}")
+            graphs, errors = [None] * len(chunk), [err] * len(chunk)
+        except (urllib.error.URLError, OSError) as e:
+            graphs, errors = [None] * len(chunk), [e] * len(chunk)
+        for k in range(len(chunk)):
+            yield j + k, graphs[k], errors[k]
+
+
+class AMRClient:
+    """
+    Parses through the amr_server.py at `server` when one with `model_id` is running,
+    otherwise loads the parser in this process (with a ParsePool when workers > 1).
+    Nothing is contacted or loaded until the first parse().
+    """
+
+    def __init__(self, model_id=DEFAULT_MODEL, server=DEFAULT_SERVER, batch_size=32, workers=1, chunk_size=16):
+        self.model_id = model_id
+        self.server = server
+        self.batch_size = batch_size
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.url = None
+        self.parser = None
+        self.pool = None
+
+    def connect(self):
+        if self.url is None and self.parser is None:
+            self.url = find_server(self.server, self.model_id)
+            if self.url is not None:
+                print("[AMR] parsing through the daemon at {}".format(self.url))
+            else:
+                print("[AMR] no daemon at {}; loading {} in this process ...".format(self.server, self.model_id))
+                self.parser = load_parser(self.model_id)
+                if self.workers > 1:
+                    self.pool = ParsePool(self.parser, self.workers)
+            sys.stdout.flush()
+
+    def parse(self, sentences, graphs=False):
+        """
+        Yield (index, penman, error) for every sentence in input order; graphs=True
+        yields AMRGraphs, read off the parser's objects when parsing in this process.
+        """
+        self.connect()
+        if self.url is not None:
+            # the daemon buckets by length across clients: send bigger requests than one batch
+            results = parse_remote(self.url, sentences, batch_size=max(64, self.batch_size))
+        elif self.pool is not None:
+            results = self.pool.parse(sentences, chunk_size=self.chunk_size, batch_size=self.batch_size)
+        else:
+            return parse_batched(self.parser, sentences, batch_size=self.batch_size,
+                                 convert=to_graph if graphs else to_penman)
+        return as_graphs(results) if graphs else results
+
+    def parse_one(self, sentence, graphs=False):
+        """Penman graph (or AMRGraph) of one sentence; raises the parse error."""
+        _, penman, error = next(self.parse([sentence], graphs))
+        if error is not None:
+            raise error
+        return penman
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.report()
+            self.pool.close()
+            self.pool = None
+
+
+def add_server_args(parser):
+    """Add the shared --amr-server / --no-amr-server flags."""
+    parser.add_argument("--amr-server", default=DEFAULT_SERVER,
+                        help="amr_server.py to parse through when it is running (env AMR_SERVER).")
+    parser.add_argument("--no-amr-server", action="store_true",
+                        help="Always load the parser in this process.")
+    return parser
+
+
+def client_from_args(args, model_id=DEFAULT_MODEL, **kwargs):
+    return AMRClient(model_id, server=None if args.no_amr_server else args.amr_server, **kwargs)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# amr_server.py
+# Long-lived AMR parsing daemon: load AMR3-structbart-L once and serve every
+# parse_amr_sentences*.py run, test_parser.py check and openAI_generator_parsing_test_3.5.py
+# job over local HTTP, instead of each of them paying the model load.
+#
+#   python amr_server.py --port 8091 &
+#   python parse_amr_sentences_v2.py extracted_sentences_with_verbs.txt   # finds it on AMR_SERVER
+#
+# Requests go into one queue drained by a single worker thread that owns the parser;
+# sentences from all clients waiting at the same time are parsed together
+# (length-bucketed batches of --max-batch). Clients fall back to loading the parser
+# themselves when no daemon answers (amr_parsing.AMRClient).
+#
+#   POST /parse {"sentences": [...]}
+#   -> {"graphs": [...], "errors": [...]}   (per sentence: a penman graph, or null and an error)
+#   GET  /health, GET /stats
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_snapshot import peak_rss_gb
+from amr_parsing import DEFAULT_MODEL, load_parser, parse_batched
+
+
+class ParseJob:
+    def __init__(self, sentences):
+        self.sentences = sentences
+        self.graphs = None
+        self.errors = None
+        self.done = threading.Event()
+
+
+class ParseWorker:
+    """Owns the parser; parses everything queued at the time in one length-bucketed run."""
+
+    def __init__(self, parser, max_batch=32):
+        self.parser = parser
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.stats = {"jobs": 0, "sentences": 0, "failed": 0, "runs": 0, "busy_s": 0.0}
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def submit(self, job):
+        self.queue.put(job)
+        job.done.wait()
+        return job
+
+    def loop(self):
+        while True:
+            jobs = [self.queue.get()]
+            while True:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.run(jobs)
+
+    def run(self, jobs):
+        t0 = time.perf_counter()
+        items = [s for job in jobs for s in job.sentences]
+        graphs = [None] * len(items)
+        errors = [None] * len(items)
+        try:
+            for i, penman, err in parse_batched(self.parser, items, batch_size=self.max_batch):
+                graphs[i], errors[i] = penman, None if err is None else "{}: {}".format(type(err).__name__, err)
+        except Exception as e:
+            errors = ["{}: {}".format(type(e).__name__, e)] * len(items)
+        pos = 0
+        for job in jobs:
+            n = len(job.sentences)
+            job.graphs, job.errors = graphs[pos:pos + n], errors[pos:pos + n]
+            pos += n
+            job.done.set()
+        self.stats["jobs"] += len(jobs)
+        self.stats["sentences"] += len(items)
+        self.stats["failed"] += sum(e is not None for e in errors)
+        self.stats["runs"] += 1
+        self.stats["busy_s"] += time.perf_counter() - t0
+
+
+class AMRHandler(BaseHTTPRequestHandler):
+    worker = None
+    info = {}
+
+    def log_message(self, fmt, *a):
+        pass
+
+    def send_json(self, code, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self.send_json(200, {"ok": True, "model": self.info.get("model")})
+        if self.path == "/stats":
+            return self.send_json(200, dict(self.info, queued=self.worker.queue.qsize(),
+                                            uptime_s=round(time.time() - self.info["started"], 1),
+                                            **self.worker.stats))
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/parse":
+            return self.send_json(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job = ParseJob([str(s) for s in body["sentences"]])
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {"error": f"bad request: {e}"})
+        self.worker.submit(job)
+        self.send_json(200, {"graphs": job.graphs, "errors": job.errors})
+
+
+def start_server(parser, host="127.0.0.1", port=8091, max_batch=32, info=None):
+    """Serve in a daemon thread. Returns (server, url)."""
+    handler = type("ConfiguredAMRHandler", (AMRHandler,), {
+        "worker": ParseWorker(parser, max_batch=max_batch),
+        "info": dict(info or {}, started=time.time()),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Keep the AMR parser loaded and serve parsing over local HTTP.")
+    ap.add_argument("--model", default=DEFAULT_MODEL, help="Pretrained AMR parser name or path.")
+    ap.add_argument("--host", default="127.0.0.1", help="Use 0.0.0.0 to accept clients from other nodes.")
+    ap.add_argument("--port", type=int, default=8091)
+    ap.add_argument("--max-batch", type=int, default=32, help="Sentences per parse_sentences() call.")
+    ap.add_argument("--threads", type=int, default=0, help="Torch CPU threads (0 = torch default).")
+    a = ap.parse_args()
+
+    if a.threads:
+        import torch
+
+        torch.set_num_threads(a.threads)
+    t0 = time.perf_counter()
+    parser = load_parser(a.model)
+    load_s = time.perf_counter() - t0
+    server, url = start_server(parser, a.host, a.port, a.max_batch,
+                               info={"model": a.model, "load_s": round(load_s, 1)})
+    print(f"[SERVER] {a.model} loaded in {load_s:.1f}s (peak RSS {peak_rss_gb():.2f} GB); "
+          f"serving on {url} (max batch {a.max_batch})")
+    sys.stdout.flush()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# batch_api.py
+# Offline OpenAI Batch API support. The generators / gpt_role_detector.py write every
+# prompt as one line of a batch request JSONL (--write-batch) and turn the downloaded
+# result JSONL back into their usual output files (--ingest-batch). custom_ids are
+# stable (dataset + verb index + verb, or scenario index + sentence hash), so a results
+# file always maps back to the right verb even if lines come back out of order.
+#
+#   python openAI_generator.py --write-batch batch_gen.jsonl
+#   python batch_api.py submit batch_gen.jsonl          # -> prints batch id
+#   python batch_api.py download <batch_id> batch_gen_results.jsonl
+#   python openAI_generator.py --ingest-batch batch_gen_results.jsonl
+#
+# For local checks, fabricate a results file from a request file:
+#   python batch_api.py fabricate batch_gen.jsonl fake_results.jsonl --fail-every 7
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+CHAT_URL = "/v1/chat/completions"
+
+
+def generation_custom_id(dataset_key, index, verb):
+    """Stable ID for one verb of one dataset; `index` is the verb's position in the CSV."""
+    return f"gen:{dataset_key}:{index:04d}:{verb}"
+
+
+def detector_custom_id(index, scenario):
+    """Stable ID for one detector scenario (1-based line index + sentence hash)."""
+    digest = hashlib.sha1(scenario.encode("utf-8")).hexdigest()[:10]
+    return f"det:{index:05d}:{digest}"
+
+
+def request_line(custom_id, prompt, model="gpt-3.5-turbo", max_tokens=800, temperature=0.7, n=1):
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": CHAT_URL,
+        "body": {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "n": n,
+        },
+    }
+
+
+def write_requests(path, lines, force=False):
+    if os.path.exists(path) and not force:
+        sys.exit(f"Refusing to overwrite {path}; pass --force or pick another --write-batch path.")
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    print(f"[BATCH] Wrote {len(lines)} requests to {path}")
+
+
+def load_results(path):
+    """
+    Parse a Batch API output (or error) file into {custom_id: (text, error)}.
+    Exactly one of text / error is None.
+    """
+    results = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            if not raw.strip():
+                continue
+            rec = json.loads(raw)
+            cid = rec.get("custom_id")
+            resp = rec.get("response") or {}
+            body = resp.get("body") or {}
+            if rec.get("error"):
+                err = rec["error"]
+                results[cid] = (None, err.get("message", str(err)) if isinstance(err, dict) else str(err))
+            elif resp.get("status_code") != 200:
+                err = body.get("error") or {}
+                results[cid] = (None, "HTTP {}: {}".format(resp.get("status_code"), err.get("message", body)))
+            else:
+                try:
+                    results[cid] = (body["choices"][0]["message"]["content"].strip(), None)
+                except (KeyError, IndexError, TypeError) as e:
+                    results[cid] = (None, f"malformed result body: {e}")
+    return results
+
+
+# ==== CLI: fabricate / submit / download ====
+def fabricate(requests_path, results_path, fail_every=0):
+    """Write a results file shaped like the Batch API's, using the stub's fake completions."""
+    from stub_openai_server import fake_completion
+
+    n = 0
+    with open(requests_path, "r", encoding="utf-8") as fin, open(results_path, "w", encoding="utf-8") as fout:
+        lines = [json.loads(l) for l in fin if l.strip()]
+        for i, req in enumerate(reversed(lines), start=1):  # out of order on purpose
+            prompt = req["body"]["messages"][0]["content"]
+            if fail_every and i % fail_every == 0:
+                rec = {"id": f"batch_req_{i}", "custom_id": req["custom_id"], "response": None,
+                       "error": {"code": "server_error", "message": "fabricated failure"}}
+            else:
+                rec = {"id": f"batch_req_{i}", "custom_id": req["custom_id"], "error": None,
+                       "response": {"status_code": 200, "request_id": f"req_{i}", "body": {
+                           "object": "chat.completion", "model": req["body"]["model"],
+                           "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                               "role": "assistant", "content": fake_completion(prompt)}}]}}}
+            fout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            n += 1
+    print(f"[BATCH] Fabricated {n} results -> {results_path}")
+
+
+def _api(method, path, **kw):
+    import requests
+
+    base = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+    headers = {"Authorization": "Bearer " + os.environ["OPENAI_API_KEY"]}
+    r = requests.request(method, base + path, headers=headers, timeout=300, **kw)
+    r.raise_for_status()
+    return r
+
+
+def submit(requests_path, window="24h"):
+    with open(requests_path, "rb") as f:
+        file_id = _api("post", "/files", files={"file": f}, data={"purpose": "batch"}).json()["id"]
+    batch = _api("post", "/batches", json={
+        "input_file_id": file_id, "endpoint": CHAT_URL, "completion_window": window,
+    }).json()
+    print(f"[BATCH] Submitted {requests_path}: batch id {batch['id']} (status {batch['status']})")
+
+
+def download(batch_id, results_path):
+    batch = _api("get", f"/batches/{batch_id}").json()
+    print(f"[BATCH] {batch_id}: status {batch['status']}, counts {batch.get('request_counts')}")
+    if batch["status"] != "completed":
+        return
+    with open(results_path, "w", encoding="utf-8") as f:
+        # failed requests live in a separate error file; ingest expects them in the same file
+        for key in ("output_file_id", "error_file_id"):
+            if batch.get(key):
+                f.write(_api("get", f"/files/{batch[key]}/content").text.rstrip("\n") + "\n")
+    print(f"[BATCH] Results saved to {results_path}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="OpenAI Batch API helpers.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("fabricate", help="Make a fake results file from a request file (local testing).")
+    p.add_argument("requests")
+    p.add_argument("results")
+    p.add_argument("--fail-every", type=int, default=0, help="Mark every Nth result as failed.")
+    p = sub.add_parser("submit", help="Upload a request file and create a batch.")
+    p.add_argument("requests")
+    p = sub.add_parser("download", help="Check a batch and save its results when completed.")
+    p.add_argument("batch_id")
+    p.add_argument("results")
+    a = ap.parse_args()
+
+    if a.cmd == "fabricate":
+        fabricate(a.requests, a.results, a.fail_every)
+    elif a.cmd == "submit":
+        submit(a.requests)
+    else:
+        download(a.batch_id, a.results)
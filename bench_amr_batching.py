@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# bench_amr_batching.py
+# One-at-a-time AMR parsing (tokenize + parse_sentence per sentence, as the
+# parse_amr_sentences*.py scripts did) vs amr_parsing.parse_batched at several batch
+# sizes, on the repo's generated sentences. Needs the transition_amr_parser
+# environment (see README, "AMR Parser Installation"). Batched graphs are checked
+# against the one-at-a-time ones.
+#
+#   python bench_amr_batching.py --sentences 200 --batch-sizes 8 32 64
+import time
+import argparse
+
+from amr_parsing import load_parser, parse_batched, to_penman
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sequential vs batched AMR parsing.")
+    ap.add_argument("--file", default="generated_sentences_copy.txt")
+    ap.add_argument("--sentences", type=int, default=200)
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    a = ap.parse_args()
+
+    with open(a.file, encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()][:a.sentences]
+    parser = load_parser()
+
+    t0 = time.perf_counter()
+    expected = []
+    for sentence in sentences:
+        tokens, _ = parser.tokenize(sentence)
+        _, machine = parser.parse_sentence(tokens)
+        expected.append(to_penman(machine))
+    seq = time.perf_counter() - t0
+    print(f"one at a time : {seq:7.1f}s ({len(sentences) / seq:6.2f} sentences/s)")
+
+    for bs in a.batch_sizes:
+        t0 = time.perf_counter()
+        got = list(parse_batched(parser, sentences, batch_size=bs))
+        dt = time.perf_counter() - t0
+        assert [i for i, _, _ in got] == list(range(len(sentences))), "results out of input order"
+        same = sum(g == e for (_, g, _), e in zip(got, expected))
+        failed = sum(err is not None for _, _, err in got)
+        print(f"batch size {bs:3d}: {dt:7.1f}s ({len(sentences) / dt:6.2f} sentences/s, {seq / dt:4.1f}x); "
+              f"graphs identical {same}/{len(sentences)}, failed {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# bench_amr_cache.py
+# amr_cache.ParseCache under the access pattern of parallel Slurm tasks: several
+# processes storing and looking up graphs in one SQLite file at the same time (no lost
+# writes, no "database is locked"), the cost of serving a rerun from the cache, and
+# eviction down to the size cap. Uses the repo's sentences with synthetic graphs, so it
+# runs without the parser; --parse adds a cold vs warm run of parse_cached with
+# AMR3-structbart-L (needs the transition_amr_parser environment).
+#
+#   python bench_amr_cache.py --processes 8 --sentences 2000 [--parse 100]
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from amr_cache import ParseCache, parse_cached
+
+MODEL = "AMR3-structbart-L"
+
+
+def fake_graph(sentence):
+    words = sentence.split()
+    return "(p / {}-01\n   :ARG0 (x / {})\n   :ARG1 (y / {}))".format(words[0].lower(), words[-1], " ".join(words))
+
+
+def worker(job):
+    path, sentences, offset = job
+    cache = ParseCache(path)
+    # every process writes its share and reads everyone's, interleaved
+    stored = 0
+    for sentence in sentences[offset:] + sentences[:offset]:
+        if cache.get(MODEL, sentence) is None:
+            cache.put(MODEL, sentence, fake_graph(sentence))
+            stored += 1
+    cache.close()
+    return stored
+
+
+def main():
+    ap = argparse.ArgumentParser(description="AMR parse cache: concurrent use, rerun cost, size cap.")
+    ap.add_argument("--file", default="generated_sentences_copy.txt")
+    ap.add_argument("--sentences", type=int, default=2000)
+    ap.add_argument("--processes", type=int, default=8)
+    ap.add_argument("--parse", type=int, default=0, metavar="N", help="Also parse N sentences cold vs warm.")
+    a = ap.parse_args()
+
+    with open(a.file, encoding="utf-8") as f:
+        originals = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    sentences = (originals * (a.sentences // max(1, len(originals)) + 1))[:a.sentences]
+    sentences = ["{} ({})".format(s, k) for k, s in enumerate(sentences)]  # distinct keys
+    path = os.path.join(tempfile.mkdtemp(), "amr_cache.sqlite")
+
+    step = len(sentences) // a.processes
+    t0 = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(a.processes) as pool:
+        stored = pool.map(worker, [(path, sentences, p * step) for p in range(a.processes)])
+    dt = time.perf_counter() - t0
+    cache = ParseCache(path)
+    found = cache.get_many(MODEL, sentences)
+    wrong = sum(found.get(s) != fake_graph(s) for s in sentences)
+    print(f"{a.processes} processes sharing one file: {sum(stored)} graphs stored, "
+          f"{a.processes * len(sentences) - sum(stored)} served to the other processes, in {dt:.1f}s; "
+          f"cached afterwards {len(found)}/{len(sentences)}, wrong {wrong}")
+    cache.close()
+
+    cache = ParseCache(path)
+    t0 = time.perf_counter()
+    rerun = list(parse_cached(cache, sentences, lambda missing: iter(()), MODEL))
+    dt = time.perf_counter() - t0
+    s = cache.stats()
+    print(f"rerun of {len(sentences)} sentences from the cache: {dt * 1000:.0f} ms "
+          f"({len(sentences) / dt:,.0f} sentences/s), hit rate {s['hit_rate']:.0%}, parser never called: "
+          f"{all(err is None for _, _, err in rerun)}")
+
+    cap = s["bytes"] / 4 / 1024 ** 2
+    capped = ParseCache(path, max_mb=cap)  # evicts on open
+    print(f"size cap {cap:.2f} MB: {s['entries']} graphs -> {capped.stats()['entries']} "
+          f"({capped.stats()['bytes'] / 1024 ** 2:.2f} MB) after LRU eviction")
+    capped.close()
+    cache.close()
+
+    if a.parse:
+        from amr_parsing import load_parser, parse_batched
+
+        sample = originals[:a.parse]
+        cold = ParseCache(os.path.join(os.path.dirname(path), "parsed.sqlite"))
+        loaded = []
+
+        def parse_missing(missing):
+            loaded.append(load_parser(MODEL))
+            return parse_batched(loaded[0], missing, batch_size=16)
+
+        for name in ("cold", "warm"):
+            t0 = time.perf_counter()
+            got = list(parse_cached(cold, sample, parse_missing, MODEL))
+            print(f"{name}: {time.perf_counter() - t0:7.2f}s for {len(got)} sentences "
+                  f"(model loads so far: {len(loaded)})")
+        cold.report()
+        cold.close()
+
+
+if __name__ == "__main__":
+    main()
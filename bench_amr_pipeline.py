@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# bench_amr_pipeline.py
+# The generate-then-validate loop of openAI_generator_parsing_test_3.5.py, run one stage
+# after the other (as it used to) vs through pipeline.pipelined, against
+# stub_openai_server.py. The validation stage costs --parse-ms per sentence (a stand-in
+# for AMR3-structbart-L), or parses for real through amr_parsing.AMRClient with --amr
+# (a running amr_server.py, else the parser loaded here). Records are checked to come
+# out identical and in verb order.
+#
+#   python bench_amr_pipeline.py --verbs 40 --latency 0.4 --parse-ms 80 --depth 1 4
+import re
+import time
+import argparse
+
+import openai
+from llm_requests import chat_completion
+from pipeline import pipelined, PipelineStats
+from stub_openai_server import start_stub_server
+
+
+def sentences_of(text):
+    return [m.group(1) for m in re.finditer(r'Sentence:\s*"([^"]+)"', text)][:5]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sequential vs pipelined GPT generation + AMR validation.")
+    ap.add_argument("--verbs", type=int, default=40)
+    ap.add_argument("--latency", type=float, default=0.4, help="Stub latency per GPT request (s).")
+    ap.add_argument("--parse-ms", type=float, default=80.0, help="Simulated parse time per sentence.")
+    ap.add_argument("--amr", action="store_true", help="Parse with the real AMR parser instead.")
+    ap.add_argument("--depth", type=int, nargs="+", default=[1, 4])
+    a = ap.parse_args()
+
+    server, base = start_stub_server(latency=a.latency)
+    openai.api_base = base
+    openai.api_key = "stub"
+    verbs = [f"verb{i}" for i in range(a.verbs)]
+    if a.amr:
+        from amr_parsing import AMRClient
+
+        client = AMRClient(batch_size=8)
+        client.connect()  # load / connect outside the timed runs
+
+        def validate(sentences):
+            return [penman for _, penman, _ in client.parse(sentences)]
+    else:
+        def validate(sentences):
+            time.sleep(len(sentences) * a.parse_ms / 1000)
+            return [s.upper() for s in sentences]
+
+    def generate(verb):
+        return sentences_of(chat_completion(f'For the verb "{verb}", list exactly five distinct scenarios.'))
+
+    t0 = time.perf_counter()
+    gen_s = 0.0
+    expected = []
+    for verb in verbs:
+        t1 = time.perf_counter()
+        sentences = generate(verb)
+        gen_s += time.perf_counter() - t1
+        expected.append((verb, validate(sentences)))
+    seq = time.perf_counter() - t0
+    val_s = seq - gen_s
+    print(f"sequential : {seq:6.1f}s (generation {gen_s:.1f}s + validation {val_s:.1f}s; "
+          f"max of the two {max(gen_s, val_s):.1f}s)")
+
+    for depth in a.depth:
+        stats = PipelineStats()
+        t0 = time.perf_counter()
+        got = [(verb, validate(sentences)) for verb, sentences, err in pipelined(verbs, generate, depth, stats)]
+        dt = time.perf_counter() - t0
+        print(f"pipelined, depth {depth}: {dt:6.1f}s ({seq / dt:.2f}x); same records in order: {got == expected}")
+        stats.report()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
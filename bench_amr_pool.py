@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# bench_amr_pool.py
+# amr_parsing.ParsePool on a CPU node: sentences/sec and memory for 1..N workers forked
+# after one AMR3-structbart-L load, next to what N independently started processes
+# would take (N x the single process' RSS). Needs the transition_amr_parser
+# environment (see README, "AMR Parser Installation").
+#
+#   python bench_amr_pool.py --sentences 256 --workers 1 2 4 8
+import os
+import time
+import argparse
+
+from amr_parsing import load_parser, ParsePool, _memory_mb
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fork-after-load AMR worker pool: throughput and memory.")
+    ap.add_argument("--file", default="generated_sentences_copy.txt")
+    ap.add_argument("--sentences", type=int, default=256)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--chunk-size", type=int, default=16)
+    ap.add_argument("--batch-size", type=int, default=8)
+    a = ap.parse_args()
+
+    with open(a.file, encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()][:a.sentences]
+    parser = load_parser()
+    loaded_rss, _ = _memory_mb(os.getpid())
+    print(f"parser loaded: {loaded_rss:.0f} MB RSS in one process")
+
+    baseline = None
+    for n in a.workers:
+        pool = ParsePool(parser, n)
+        t0 = time.perf_counter()
+        got = list(pool.parse(sentences, chunk_size=a.chunk_size, batch_size=a.batch_size))
+        dt = time.perf_counter() - t0
+        rss, pss = pool.memory()
+        pool.close()
+        assert [i for i, _, _ in got] == list(range(len(sentences))), "results out of input order"
+        graphs = [g for _, g, _ in got]
+        baseline = baseline or graphs
+        print(f"{n:2d} workers x {pool.threads} threads: {len(sentences) / dt:6.2f} sentences/s; "
+              f"PSS {pss:6.0f} MB (RSS summed {rss:6.0f} MB) vs ~{n * loaded_rss:6.0f} MB for "
+              f"{n} separately loaded workers; graphs as with 1 worker: {graphs == baseline}")
+
+
+if __name__ == "__main__":
+    main()
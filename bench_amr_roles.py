@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# bench_amr_roles.py
+# Per-sentence cost of getting the roles out of a parse, on machines from real
+# AMR3-structbart-L parses of the repo's sentences (the parse itself isn't timed):
+#   round trip : to_penman() then penman.decode() -> AMRGraph (what the detectors did)
+#   direct     : AMRGraph.from_amr() on the parser's AMR object
+#   + output   : direct, plus the penman text the scripts still write out
+# and a check that both paths find the same roles, concepts and edges. Needs the
+# transition_amr_parser environment (see README, "AMR Parser Installation").
+#
+#   python bench_amr_roles.py --sentences 200 --repeat 20
+import time
+import argparse
+
+from amr_parsing import AMRGraph, load_parser, tokenize_all
+
+
+def per_sentence_us(fn, items, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for x in items:
+            fn(x)
+    return (time.perf_counter() - t0) / (repeat * len(items)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Roles via the penman round trip vs straight from the parser's graph.")
+    ap.add_argument("--file", default="generated_sentences_copy.txt")
+    ap.add_argument("--sentences", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=20)
+    a = ap.parse_args()
+
+    with open(a.file, encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()][:a.sentences]
+    parser = load_parser()
+    tokens = [t for t, _ in tokenize_all(parser, sentences) if t is not None]
+    _, machines = parser.parse_sentences(tokens, batch_size=16)
+    amrs = [m.get_amr() for m in machines]
+
+    def round_trip(amr):
+        return AMRGraph.from_penman(amr.to_penman(jamr=False, isi=True)).roles()
+
+    def direct(amr):
+        return AMRGraph.from_amr(amr).roles()
+
+    def direct_with_output(amr):
+        g = AMRGraph.from_amr(amr)
+        return g.roles(), g.penman
+
+    rt = per_sentence_us(round_trip, amrs, a.repeat)
+    d = per_sentence_us(direct, amrs, a.repeat)
+    out = per_sentence_us(direct_with_output, amrs, a.repeat)
+    print(f"{len(amrs)} parsed sentences, {a.repeat} repeats")
+    print(f"round trip : {rt:8.1f} us/sentence")
+    print(f"direct     : {d:8.1f} us/sentence ({rt / d:.1f}x less)")
+    print(f"+ output   : {out:8.1f} us/sentence (direct, plus penman text for the output file)")
+
+    same_roles = same_shape = 0
+    for amr in amrs:
+        x, y = AMRGraph.from_amr(amr), AMRGraph.from_penman(amr.to_penman(jamr=False, isi=True))
+        same_roles += x.roles() == y.roles()
+        # variable names differ (node ids vs penman letters): compare concepts and role labels
+        same_shape += (sorted(x.concepts.values()) == sorted(y.concepts.values())
+                       and sorted(r for _, r, _ in x.edges) == sorted(r for _, r, _ in y.edges))
+    print(f"same roles {same_roles}/{len(amrs)}, same concepts and edge labels {same_shape}/{len(amrs)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# bench_amr_server.py
+# Many short AMR jobs (the size of a test_parser.py check or one verb's sentences in
+# openAI_generator_parsing_test_3.5.py):
+#   per-job load : every job loads AMR3-structbart-L, then parses (today's scripts)
+#   daemon       : amr_server.py loads it once; jobs run concurrently as AMRClients
+# The daemon's graphs are checked against in-process parsing. Needs the
+# transition_amr_parser environment (see README, "AMR Parser Installation").
+#
+#   python bench_amr_server.py --jobs 6 --sentences-per-job 5
+import time
+import argparse
+import threading
+
+from amr_parsing import AMRClient, load_parser, parse_batched
+from amr_server import start_server
+
+
+def collect(results):
+    graphs = []
+    for _, penman, err in results:
+        if err is not None:
+            raise err
+        graphs.append(penman)
+    return graphs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-job AMR parser loading vs one long-lived amr_server.py.")
+    ap.add_argument("--file", default="generated_sentences_copy.txt")
+    ap.add_argument("--jobs", type=int, default=6)
+    ap.add_argument("--sentences-per-job", type=int, default=5)
+    a = ap.parse_args()
+
+    with open(a.file, encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()][:a.jobs * a.sentences_per_job]
+    jobs = [sentences[j::a.jobs] for j in range(a.jobs)]
+
+    # ---- every job loads the parser itself ----
+    t0 = time.perf_counter()
+    expected = []
+    for job in jobs:
+        expected.append(collect(parse_batched(load_parser(), job, batch_size=len(job))))
+    per_job = time.perf_counter() - t0
+    print(f"per-job load : {per_job:6.1f}s for {a.jobs} jobs")
+
+    # ---- one daemon, jobs as concurrent clients ----
+    t0 = time.perf_counter()
+    parser = load_parser()
+    load_s = time.perf_counter() - t0
+    server, url = start_server(parser, port=0, info={"model": "AMR3-structbart-L"})
+    got = [None] * a.jobs
+
+    def client(j):
+        got[j] = collect(AMRClient(server=url).parse(jobs[j]))
+
+    threads = [threading.Thread(target=client, args=(j,)) for j in range(a.jobs)]
+    t1 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    served = time.perf_counter() - t1
+    server.shutdown()
+    print(f"daemon       : {load_s:6.1f}s load once + {served:6.1f}s for {a.jobs} concurrent jobs "
+          f"({per_job / (load_s + served):.1f}x; {served / a.jobs:.2f}s/job once the daemon is up)")
+    print(f"graphs identical to in-process parsing: {got == expected}")
+
+
+if __name__ == "__main__":
+    main()
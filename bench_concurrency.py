@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# bench_concurrency.py
+# Wall-clock comparison of the old one-request-at-a-time loop against the
+# concurrent engine in llm_requests.py, measured against stub_openai_server.py.
+#
+#   python bench_concurrency.py --verbs 177 --latency 0.5 --concurrency 1 8 32
+import time
+import asyncio
+import argparse
+import openai
+from llm_requests import chat_completion, achat_completion, generate_in_order
+from stub_openai_server import start_stub_server
+
+
+def run_sequential(prompts):
+    # Same shape as the original process_dataset loop
+    return [chat_completion(p) for p in prompts]
+
+
+async def run_concurrent(prompts, concurrency):
+    limiter = asyncio.Semaphore(concurrency)
+    outputs = []
+    async for _, out, err in generate_in_order(prompts, achat_completion, limiter):
+        if err is not None:
+            raise err
+        outputs.append(out)
+    return outputs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sequential vs concurrent generation against a local stub.")
+    ap.add_argument("--verbs", type=int, default=60, help="Number of fake verbs to generate for.")
+    ap.add_argument("--latency", type=float, default=0.3, help="Stub latency per request (s).")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64])
+    a = ap.parse_args()
+
+    server, base = start_stub_server(latency=a.latency)
+    openai.api_base = base
+    openai.api_key = "stub"
+
+    prompts = [f'For the verb "verb{i}", create exactly 5 scenarios.' for i in range(a.verbs)]
+
+    t0 = time.perf_counter()
+    expected = run_sequential(prompts)
+    seq = time.perf_counter() - t0
+    print(f"sequential        : {seq:7.2f}s  ({a.verbs / seq:6.1f} verbs/s)")
+
+    for c in a.concurrency:
+        t0 = time.perf_counter()
+        got = asyncio.run(run_concurrent(prompts, c))
+        dt = time.perf_counter() - t0
+        assert got == expected, "concurrent outputs out of order"
+        print(f"concurrency={c:<5d}: {dt:7.2f}s  ({a.verbs / dt:6.1f} verbs/s, {seq / dt:5.1f}x)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
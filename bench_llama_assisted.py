@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# bench_llama_assisted.py
+# Assisted (speculative) decoding, llama_generation.AssistedDecoding, on CPU-sized models
+# sharing the tiny local tokenizer:
+#   target        : 16 layers, hidden 512 (stands in for the 70B model)
+#   aligned draft : the target's first 2 layers, embeddings and head. The target's later
+#                   layers are scaled down so the two mostly agree, the way a 7B draft
+#                   mostly agrees with its 70B sibling.
+#   unrelated     : the random tiny model (worst case, almost nothing accepted)
+# Greedy outputs with a draft must equal the target's own, token for token.
+#
+#   python bench_llama_assisted.py --verbs 6 --draft-tokens 2 4 8
+import copy
+import time
+import argparse
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, LlamaConfig, LlamaForCausalLM
+from llama_generation import AssistedDecoding, generate_batched
+from tiny_causal_lm import build_tiny_model, llama_prompt, repo_verbs
+
+
+def build_pair(tokenizer, hidden_size=512, layers=16, draft_layers=2, damping=0.02, seed=0):
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=hidden_size, intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers, num_attention_heads=8, num_key_value_heads=8, max_position_embeddings=2048,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+    )
+    target = LlamaForCausalLM(config).eval()
+    with torch.no_grad():
+        for layer in target.model.layers[draft_layers:]:
+            layer.self_attn.o_proj.weight.mul_(damping)
+            layer.mlp.down_proj.weight.mul_(damping)
+    draft = copy.deepcopy(target)
+    draft.model.layers = draft.model.layers[:draft_layers]
+    draft.config.num_hidden_layers = draft_layers
+    return target, draft.eval()
+
+
+def run(model, tokenizer, prompts, max_new_tokens, assisted=None):
+    t0 = time.perf_counter()
+    outs = []
+    for _, text, err in generate_batched(model, tokenizer, prompts, batch_size=1, max_new_tokens=max_new_tokens,
+                                         do_sample=False, assisted=assisted):
+        if err is not None:
+            raise err
+        outs.append(text)
+    return outs, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Assisted decoding: acceptance, speedup and greedy equivalence.")
+    ap.add_argument("--model-dir", default="/tmp/tiny-llama")
+    ap.add_argument("--verbs", type=int, default=6)
+    ap.add_argument("--max-new-tokens", type=int, default=96)
+    ap.add_argument("--draft-tokens", type=int, nargs="+", default=[2, 4, 8])
+    a = ap.parse_args()
+
+    path = build_tiny_model(a.model_dir)
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    target, draft = build_pair(tokenizer)
+    unrelated = AutoModelForCausalLM.from_pretrained(path).eval()
+    prompts = [llama_prompt(v) for v in repo_verbs()[:a.verbs]]
+
+    run(target, tokenizer, prompts[:1], 8)  # warm-up
+    expected, base = run(target, tokenizer, prompts, a.max_new_tokens)
+    print(f"target alone      : {base / len(prompts):.2f}s/verb")
+    for name, drafter in (("aligned draft", draft), ("unrelated draft", unrelated)):
+        for n in a.draft_tokens:
+            with AssistedDecoding(target, drafter, draft_tokens=n) as assisted:
+                got, dt = run(target, tokenizer, prompts, a.max_new_tokens, assisted)
+            same = sum(x == y for x, y in zip(got, expected))
+            print(f"{name:15s} k={n}: {dt / len(prompts):.2f}s/verb ({base / dt:.2f}x), "
+                  f"{assisted.acceptance:.0%} of drafted tokens accepted, "
+                  f"{assisted.tokens / max(1, assisted.target_passes):.2f} tokens/target pass; "
+                  f"greedy outputs identical {same}/{len(prompts)}")
+            assert same == len(prompts), "assisted greedy output differs from the target model's"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# bench_llama_batching.py
+# Per-verb generation (the old pipeline loop) vs llama_generation.generate_batched at a
+# few batch sizes, on the tiny local model from tiny_causal_lm.py (CPU is fine).
+# Greedy decoding, so batched outputs can be compared with the one-at-a-time ones.
+#
+#   python bench_llama_batching.py --verbs 64 --batch-size 1 8 32
+import time
+import argparse
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from llama_generation import generate_batched
+from tiny_causal_lm import build_tiny_model, llama_prompt, repo_verbs
+
+
+def run(model, tokenizer, prompts, batch_size, max_new_tokens):
+    t0 = time.perf_counter()
+    outs = []
+    for _, text, err in generate_batched(model, tokenizer, prompts, batch_size=batch_size,
+                                         max_new_tokens=max_new_tokens, do_sample=False):
+        if err is not None:
+            raise err
+        outs.append(text)
+    return outs, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Batched vs per-verb LLaMA generation on a tiny local model.")
+    ap.add_argument("--model-dir", default="/tmp/tiny-llama")
+    ap.add_argument("--verbs", type=int, default=64)
+    ap.add_argument("--max-new-tokens", type=int, default=64)
+    ap.add_argument("--batch-size", type=int, nargs="+", default=[1, 8, 32])
+    a = ap.parse_args()
+
+    torch.set_num_threads(max(1, torch.get_num_threads()))
+    path = build_tiny_model(a.model_dir)
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    model = AutoModelForCausalLM.from_pretrained(path).eval()
+    prompts = [llama_prompt(v) for v in repo_verbs()[:a.verbs]]
+
+    baseline, base_dt = None, None
+    for bs in a.batch_size:
+        outs, dt = run(model, tokenizer, prompts, bs, a.max_new_tokens)
+        if baseline is None:
+            baseline, base_dt = outs, dt
+        same = sum(x == y for x, y in zip(outs, baseline))
+        print(f"batch size {bs:<3d}: {dt:6.2f}s  ({len(prompts) / dt * 3600:8.0f} verbs/hour, "
+              f"{base_dt / dt:4.1f}x)  outputs identical to batch size {a.batch_size[0]}: {same}/{len(prompts)}")
+
+
+if __name__ == "__main__":
+    main()
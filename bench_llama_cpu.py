@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# bench_llama_cpu.py
+# CPU backend (llama_generation.cpu_int8): fp32 vs dynamic-int8 generation on a
+# LLaMA-architecture model sharing the tiny local tokenizer, at several batch sizes
+# and thread counts. Agreement with fp32 is measured two ways:
+#   greedy match : identical greedy continuations (one early flip changes the rest)
+#   top-1 agree  : int8 argmax == fp32 argmax at every position of the fp32 greedy
+#                  continuation (teacher-forced, so flips don't compound)
+#
+#   python bench_llama_cpu.py --verbs 16 --batch-sizes 1 8 --threads 1 4
+import copy
+import time
+import argparse
+
+import torch
+from transformers import AutoTokenizer, LlamaConfig, LlamaForCausalLM
+from llama_generation import cpu_int8, generate_batched, prepare_tokenizer
+from tiny_causal_lm import build_tiny_model, llama_prompt, repo_verbs
+
+
+def run(model, tokenizer, prompts, batch_size, max_new_tokens):
+    t0 = time.perf_counter()
+    outs = [text for _, text, _ in generate_batched(model, tokenizer, prompts, batch_size=batch_size,
+                                                    max_new_tokens=max_new_tokens, do_sample=False)]
+    return outs, time.perf_counter() - t0
+
+
+def top1_agreement(fp32, int8, tokenizer, prompts, texts):
+    same = total = 0
+    with torch.no_grad():
+        for prompt, text in zip(prompts, texts):
+            p = tokenizer(prompt, return_tensors="pt")["input_ids"]
+            full = torch.cat([p, tokenizer(text, add_special_tokens=False, return_tensors="pt")["input_ids"]], dim=1)
+            a = fp32(full).logits[0, p.shape[1] - 1:-1].argmax(-1)
+            b = int8(full).logits[0, p.shape[1] - 1:-1].argmax(-1)
+            same += int((a == b).sum())
+            total += a.numel()
+    return same / max(1, total)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="fp32 vs int8 CPU generation: throughput and agreement.")
+    ap.add_argument("--model-dir", default="/tmp/tiny-llama")
+    ap.add_argument("--hidden-size", type=int, default=768)
+    ap.add_argument("--layers", type=int, default=8)
+    ap.add_argument("--verbs", type=int, default=16)
+    ap.add_argument("--max-new-tokens", type=int, default=48)
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    ap.add_argument("--threads", type=int, nargs="+", default=[1])
+    a = ap.parse_args()
+
+    tokenizer = prepare_tokenizer(AutoTokenizer.from_pretrained(build_tiny_model(a.model_dir)))
+    torch.manual_seed(0)
+    fp32 = LlamaForCausalLM(LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=a.hidden_size, intermediate_size=a.hidden_size * 3,
+        num_hidden_layers=a.layers, num_attention_heads=12, num_key_value_heads=12,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id)).eval()
+    int8 = cpu_int8(copy.deepcopy(fp32), a.threads[0])
+    prompts = [llama_prompt(v) for v in repo_verbs()[:a.verbs]]
+    tokens = len(prompts) * a.max_new_tokens
+
+    for threads in a.threads:
+        torch.set_num_threads(threads)
+        for bs in a.batch_sizes:
+            ref, t_fp32 = run(fp32, tokenizer, prompts, bs, a.max_new_tokens)
+            got, t_int8 = run(int8, tokenizer, prompts, bs, a.max_new_tokens)
+            same = sum(x == y for x, y in zip(ref, got))
+            print(f"threads {threads}, batch {bs:2d}: fp32 {tokens / t_fp32:6.1f} tok/s, int8 {tokens / t_int8:6.1f} "
+                  f"tok/s ({t_fp32 / t_int8:.2f}x); greedy match {same}/{len(prompts)}")
+    agree = top1_agreement(fp32, int8, tokenizer, prompts, ref)
+    print(f"teacher-forced top-1 agreement int8 vs fp32: {agree:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# bench_llama_server.py
+# Many short generation jobs against the tiny local model:
+#   per-job load : every job loads the checkpoint, then generates (today's Slurm jobs)
+#   server       : llama_server.py loads it once; jobs run concurrently as HTTP clients
+# Greedy decoding, and the server's outputs are checked against local generation.
+#
+#   python bench_llama_server.py --jobs 6 --verbs-per-job 4
+import time
+import argparse
+import threading
+
+from llama_generation import generate_batched, generate_remote
+from llama_server import load_model, start_server
+from tiny_causal_lm import build_tiny_model, llama_prompt, llama_prompt_v2, repo_verbs
+
+GEN = {"max_new_tokens": 32, "do_sample": False}
+
+
+def collect(results):
+    outs = []
+    for _, text, err in results:
+        if err is not None:
+            raise err
+        outs.append(text)
+    return outs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-job model loading vs one long-lived llama_server.py.")
+    ap.add_argument("--model-dir", default="/tmp/tiny-llama")
+    ap.add_argument("--jobs", type=int, default=6)
+    ap.add_argument("--verbs-per-job", type=int, default=4)
+    a = ap.parse_args()
+
+    path = build_tiny_model(a.model_dir)
+    verbs = repo_verbs()[:a.jobs * a.verbs_per_job]
+    jobs = [[llama_prompt(v) for v in verbs[j::a.jobs]] for j in range(a.jobs)]
+
+    # ---- every job loads the model itself ----
+    t0 = time.perf_counter()
+    expected = []
+    for prompts in jobs:
+        model, tokenizer = load_model(path)
+        expected.append(collect(generate_batched(model, tokenizer, prompts, batch_size=len(prompts), **GEN)))
+    per_job = time.perf_counter() - t0
+    print(f"per-job load : {per_job:6.2f}s for {a.jobs} jobs")
+
+    # ---- one server, jobs as concurrent clients ----
+    t0 = time.perf_counter()
+    model, tokenizer = load_model(path)
+    load_s = time.perf_counter() - t0
+    server, url = start_server(model, tokenizer, port=0, max_batch=16)
+    got = [None] * a.jobs
+
+    def client(j):
+        got[j] = collect(generate_remote(url, prompts=jobs[j], batch_size=len(jobs[j]), **GEN))
+
+    threads = [threading.Thread(target=client, args=(j,)) for j in range(a.jobs)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    served = time.perf_counter() - t0
+    print(f"server       : {served:6.2f}s (model loaded once in {load_s:.2f}s; "
+          f"{server.RequestHandlerClass.worker.stats['groups']} coalesced generate runs for {a.jobs} jobs) "
+          f"-> {per_job / served:.1f}x")
+    assert got == expected, "server outputs differ from local generation"
+
+    # ---- prefix-cached requests through the server ----
+    prefix = llama_prompt_v2(verbs[0])[0]
+    suffixes = [llama_prompt_v2(v)[1] for v in verbs]
+    remote = collect(generate_remote(url, prefix=prefix, suffixes=suffixes, batch_size=8, **GEN))
+    local = collect(generate_batched(model, tokenizer, [prefix + s for s in suffixes], batch_size=8, **GEN))
+    same = sum(x == y for x, y in zip(remote, local))
+    print(f"prefix-cached server requests: {len(remote)} verbs, identical to uncached local prompts: "
+          f"{same}/{len(remote)} (suffix tokenized separately, so small differences are possible)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# bench_model_load.py
+# Cold-start cost of a LLaMA-architecture checkpoint saved the way model-7b is today
+# (pickled pytorch_model*.bin), loaded like llama_generator-Copy1.py used to
+# (use_safetensors=False), vs after model_snapshot.prepare_local_model() converted it
+# to safetensors. Every load runs in a fresh process, so load time and peak RSS
+# are what a new Slurm job would see.
+#
+#   python bench_model_load.py --hidden-size 1024 --layers 12
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+
+LOAD = r"""
+import sys, json, time, resource
+t0 = time.perf_counter()
+from transformers import AutoModelForCausalLM
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t1 = time.perf_counter()
+model = AutoModelForCausalLM.from_pretrained(sys.argv[1], use_safetensors=sys.argv[2] == "1", local_files_only=True)
+t2 = time.perf_counter()
+first = model(model.dummy_inputs["input_ids"][:, :4])  # touch the weights once, like a first token would
+t3 = time.perf_counter()
+print(json.dumps({"load_s": t2 - t1, "first_s": t3 - t2, "import_s": t1 - t0,
+                  "base_gb": base / 1024 ** 2, "peak_gb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** 2}))
+"""
+
+
+BUILD = r"""
+import sys, torch
+from transformers import LlamaConfig, LlamaForCausalLM
+path, hidden, layers, shards = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), sys.argv[4]
+torch.manual_seed(0)
+config = LlamaConfig(vocab_size=32000, hidden_size=hidden, intermediate_size=hidden * 3,
+                     num_hidden_layers=layers, num_attention_heads=16, num_key_value_heads=16)
+LlamaForCausalLM(config).save_pretrained(path, safe_serialization=False, max_shard_size=shards)
+"""
+
+
+def run_python(*argv):
+    # Heavy steps run in child processes: Linux carries a parent's peak RSS into the children it forks
+    return subprocess.run([sys.executable, *argv], capture_output=True, text=True, check=True).stdout
+
+
+def load_in_subprocess(path, safetensors):
+    out = run_python("-c", LOAD, path, "1" if safetensors else "0")
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pickle .bin vs safetensors cold start (fresh process per load).")
+    ap.add_argument("--dir", default="/tmp/load-bench-model")
+    ap.add_argument("--hidden-size", type=int, default=1024)
+    ap.add_argument("--layers", type=int, default=12)
+    ap.add_argument("--shards", default="200MB", help="max_shard_size for the .bin checkpoint")
+    a = ap.parse_args()
+
+    from model_snapshot import verify_snapshot, write_manifest
+
+    shutil.rmtree(a.dir, ignore_errors=True)
+    run_python("-c", BUILD, a.dir, str(a.hidden_size), str(a.layers), a.shards)
+    size_gb = sum(os.path.getsize(os.path.join(a.dir, f)) for f in os.listdir(a.dir)) / 1024 ** 3
+    print(f"checkpoint: {a.layers} layers, hidden {a.hidden_size}, {size_gb:.2f} GB of pickled .bin shards")
+
+    def show(name, r):
+        print(f"{name:22s}: load {r['load_s']:5.2f}s, first forward {r['first_s']:5.2f}s, "
+              f"peak RSS {r['peak_gb']:.2f} GB ({r['peak_gb'] - r['base_gb']:+.2f} GB over the imports)")
+
+    show("pickle .bin", load_in_subprocess(a.dir, False))
+
+    write_manifest(a.dir)  # as after a complete download
+    t0 = time.perf_counter()
+    problems = verify_snapshot(a.dir)
+    print(f"manifest check        : {(time.perf_counter() - t0) * 1000:.1f} ms, problems: {problems or 'none'}")
+    t0 = time.perf_counter()
+    print(run_python(os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_snapshot.py"), a.dir), end="")
+    print(f"one-time conversion   : {time.perf_counter() - t0:.2f}s (including interpreter start)")
+    show("safetensors (mmap)", load_in_subprocess(a.dir, True))
+    shutil.rmtree(a.dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# bench_stopping.py
+# Structure-aware stopping (scenario_stop.py): tokens and time per verb when generation
+# runs to the end vs stops after the 5th sentence vs after the rating block.
+#   1. OpenAI path: ScenarioStream against stub_openai_server.py, which streams the five
+#      scenarios, the ratings and then a --tail-words "why this one is best" essay
+#   2. LLaMA path: generate_batched on the tiny local model, forced (by a logits
+#      processor) to write the same stub response, so the SentenceStoppingCriteria sees
+#      real scenario text while the decode steps cost what they really cost
+#
+#   python bench_stopping.py --verbs 8 --tail-words 300
+import time
+import argparse
+
+import torch
+import openai
+from transformers import AutoTokenizer, AutoModelForCausalLM, LogitsProcessor, LogitsProcessorList
+
+from scenario_stream import ScenarioStream
+from stub_openai_server import start_stub_server, fake_completion
+from llama_generation import generate_batched, prepare_tokenizer, STOP_STATS
+from tiny_causal_lm import build_tiny_model, llama_prompt, repo_verbs
+
+MODES = [("full", 0, False), ("stop@5", 5, False), ("stop@5+ratings", 5, True)]
+
+
+def bench_openai(verbs, tail_words, token_latency):
+    server, base = start_stub_server(token_latency=token_latency, tail_words=tail_words)
+    openai.api_base = base
+    openai.api_key = "stub"
+    prompts = [f'For the verb "{v}", create exactly 5 scenarios.' for v in verbs]
+    print(f"OpenAI stream ({len(verbs)} verbs, {tail_words}-word tail after the ratings):")
+    for name, limit, ratings in MODES:
+        t0 = time.perf_counter()
+        tokens = sentences = 0
+        for prompt in prompts:
+            stream = ScenarioStream(prompt, limit=limit or 10 ** 9, ratings=ratings)
+            sentences += len(list(stream))
+            tokens += stream.completion_tokens
+        dt = time.perf_counter() - t0
+        print(f"  {name:15s}: {tokens / len(verbs):5.0f} tokens/verb, {dt / len(verbs):.2f}s/verb, "
+              f"{sentences / len(verbs):.0f} sentences/verb")
+    server.shutdown()
+
+
+class ForceText(LogitsProcessor):
+    """Make every row write its reference token ids (then EOS), whatever the weights say."""
+
+    def __init__(self, refs, prompt_len, eos):
+        self.refs = refs
+        self.prompt_len = prompt_len
+        self.eos = eos
+
+    def __call__(self, input_ids, scores):
+        step = input_ids.shape[1] - self.prompt_len
+        forced = torch.full_like(scores, float("-inf"))
+        for row, ref in enumerate(self.refs):
+            forced[row, ref[step] if step < len(ref) else self.eos] = 0.0
+        return forced
+
+
+def bench_llama(model_dir, verbs, tail_words, batch_size):
+    path = build_tiny_model(model_dir)
+    tokenizer = prepare_tokenizer(AutoTokenizer.from_pretrained(path))
+    model = AutoModelForCausalLM.from_pretrained(path).eval()
+    # One batch of equal-length prompts, so the forced columns line up
+    prompt = llama_prompt(verbs[0])
+    prompts = [prompt] * batch_size
+    refs = [tokenizer(fake_completion(f'verb "{v}"', tail_words=tail_words), add_special_tokens=False)["input_ids"]
+            for v in verbs[:batch_size]]
+    prompt_len = len(tokenizer(prompt)["input_ids"])
+    max_new = max(len(r) for r in refs) + 1
+    print(f"LLaMA (tiny model, batch of {batch_size}, {max_new - 1} reference tokens/verb):")
+    full_text = None
+    for name, limit, ratings in MODES:
+        STOP_STATS.__init__()
+        t0 = time.perf_counter()
+        texts = [text for _, text, _ in generate_batched(
+            model, tokenizer, prompts, batch_size=batch_size, max_new_tokens=max_new, do_sample=False,
+            stop_after=limit, stop_ratings=ratings,
+            logits_processor=LogitsProcessorList([ForceText(refs, prompt_len, tokenizer.eos_token_id)]))]
+        dt = time.perf_counter() - t0
+        tokens = sum(len(tokenizer(t, add_special_tokens=False)["input_ids"]) for t in texts)
+        full_text = full_text or texts
+        kept = all(f.startswith(t) for f, t in zip(full_text, texts))
+        print(f"  {name:15s}: {tokens / len(texts):5.0f} tokens/verb, {dt / len(texts) * 1000:6.1f} ms/verb "
+              f"(prefix of the full output: {kept})")
+        if limit:
+            STOP_STATS.report()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tokens and time saved by stopping after the scenarios.")
+    ap.add_argument("--verbs", type=int, default=8)
+    ap.add_argument("--tail-words", type=int, default=300, help="Essay words after the ratings.")
+    ap.add_argument("--token-latency", type=float, default=0.002, help="Stub seconds per streamed token.")
+    ap.add_argument("--model-dir", default="/tmp/tiny-llama")
+    a = ap.parse_args()
+
+    verbs = repo_verbs()[:a.verbs]
+    bench_openai(verbs, a.tail_words, a.token_latency)
+    bench_llama(a.model_dir, verbs, a.tail_words, a.verbs)
+
+
+if __name__ == "__main__":
+    main()
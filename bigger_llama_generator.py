@@ -2,29 +2,78 @@
 import os
 import pandas as pd
 import json
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+import time
+import argparse
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from llm_cache import add_cache_args, cache_from_args
+from llama_generation import generate_batched, generate_batched_prefix, generate_remote, PrefixCache, Throughput, STOP_STATS
+from llama_generation import AssistedDecoding, server_model
+from model_snapshot import report_load
+from scenario_stop import stop_label
 
 # ==== Config ====  
 MODEL_ID    = "meta-llama/Llama-2-70b-chat-hf"
 EXCEL_PATH  = r"/ix1/xli/dgt12//llama_job/NLP_project_verb_list_MWD.xlsx"
 OUTPUT_PATH = r"/ix1/xli/dgt12/llama_job/verb_outputs_70b.jsonl"
 
+# ==== CLI (response cache) ====
+cli = argparse.ArgumentParser(description="Generate verb scenarios with LLaMA-2.")
+cli.add_argument("--batch-size", type=int, default=1,
+                 help="Verbs generated together (prompts bucketed by length, left-padded).")
+cli.add_argument("--prompt-version", choices=["v1", "v2"], default="v1",
+                 help="v1 = original prompt; v2 = same instructions as one invariant prefix with the verb last.")
+cli.add_argument("--prefix-cache", action="store_true",
+                 help="With v2: encode the shared instruction prefix once and reuse its KV cache for every verb.")
+cli.add_argument("--server", metavar="URL", default=None,
+                 help="Send prompts to a running llama_server.py instead of loading the model in this job.")
+cli.add_argument("--stop-after", type=int, default=0, metavar="N",
+                 help="Stop a verb's generation once N complete 'Sentence:' lines are written (0 = run to 800 tokens).")
+cli.add_argument("--stop-after-ratings", action="store_true",
+                 help="With --stop-after: keep going until the rating block after the sentences is complete.")
+cli.add_argument("--grammar", action="store_true",
+                 help="Constrain decoding to the 'N. Agent: ...; Patient: ...' + 'Sentence: \"...\"' format.")
+cli.add_argument("--draft-model", default=None, metavar="PATH",
+                 help="Small model with the same tokenizer that drafts tokens for this one to verify (assisted decoding).")
+cli.add_argument("--draft-tokens", type=int, default=5, help="Tokens drafted per verification step.")
+add_cache_args(cli)
+args = cli.parse_args()
+if args.prefix_cache and args.prompt_version != "v2":
+    cli.error("--prefix-cache needs --prompt-version v2 (v1 starts with the verb, so there is no shared prefix)")
+if args.draft_model and (args.batch_size != 1 or args.server or args.prefix_cache or args.grammar):
+    cli.error("--draft-model runs one verb at a time in this job: drop --batch-size/--server/--prefix-cache/--grammar")
+cache = cache_from_args(args)
+# Key on the model that actually generates: with --server, whatever the server loaded
+CACHE_MODEL = server_model(args.server) if args.server else MODEL_ID
+# Truncated responses get their own cache entries, so they never stand in for full ones
+CACHE_MODEL += (stop_label(args.stop_after, args.stop_after_ratings) if args.stop_after else "")
+CACHE_MODEL += "+grammar" if args.grammar else ""
+ROLES = ["Agent", "Patient", "Instrument", "Location"]  # the four roles the prompt asks for
+GEN = {"max_new_tokens": 800, "do_sample": True, "temperature": 0.7,
+       "stop_after": args.stop_after, "stop_ratings": args.stop_after_ratings,
+       "grammar_roles": ROLES if args.grammar else None}
+
 # ==== Load model and tokenizer via HF cache ====
-tokenizer = AutoTokenizer.from_pretrained(
-    MODEL_ID,
-    use_fast=True,
-    use_auth_token=True
-)
-
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_ID,
-    device_map="auto",     # auto-shards across all GPUs/CPU
-    load_in_8bit=True,     # quantize to 8-bit to save VRAM
-    torch_dtype="auto",    # lets bitsandbytes pick fp16 for you
-    use_auth_token=True
-)
-
-generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
+# (skipped with --server: the server already holds the model)
+if args.server is None:
+    t0 = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(
+        MODEL_ID,
+        use_fast=True,
+        use_auth_token=True
+    )
+
+    model = AutoModelForCausalLM.from_pretrained(
+        MODEL_ID,
+        device_map="auto",     # auto-shards across all GPUs/CPU
+        load_in_8bit=True,     # quantize to 8-bit to save VRAM
+        torch_dtype="auto",    # lets bitsandbytes pick fp16 for you
+        use_auth_token=True
+    )
+    report_load(MODEL_ID, time.perf_counter() - t0)
+    if args.draft_model:
+        draft_model = AutoModelForCausalLM.from_pretrained(args.draft_model, device_map="auto", torch_dtype="auto")
+        assisted = AssistedDecoding(model, draft_model, args.draft_tokens)
+        GEN["assisted"] = assisted
 
 # ==== Load verbs ====
 df = pd.read_excel(EXCEL_PATH)
@@ -40,20 +89,71 @@ Avoid descriptive adjectives. For each scenario, provide specific, concrete exam
 Finally, evaluate which of the five examples fits the prompt best and explain why.
 """
 
-# ==== Generate per verb ====
-def generate_for_verb(verb):
-    prompt = build_prompt(verb)
-    result = generator(prompt, max_new_tokens=800, do_sample=True, temperature=0.7)[0]["generated_text"]
-    response_only = result[len(prompt):].strip()
-    return response_only
+# ==== Prompt v2 (shared prefix first, verb last) ====
+# Identical for every verb, so its key/values can be computed once (--prefix-cache)
+PROMPT_PREFIX_V2 = """
+For the target verb named at the end of this message (do not include synonyms of this verb), list five distinct, prototypical scenarios encountered in everyday life, each with a unique combination of: agent (who/what performs the action; must be specific and unique across examples), patient (who/what is the recipient of the action; must differ in each case), instrument (the means of performing the action), and location (where/direction of the action). 
+
+Avoid descriptive adjectives. For each scenario, provide specific, concrete examples for all four roles (e.g., not just "a person" but "a toddler"; not just "a room" but "a grocery store") and include a sample sentence where all roles are explicitly named (no implied roles). Avoid repeating agents and avoid generic terms (e.g., "thing," "place")—opt for vivid details. 
+
+Finally, evaluate which of the five examples fits the prompt best and explain why.
+"""
+
+def build_prompt_suffix_v2(verb):
+    return f'\nTarget verb: "{verb}"\n'
+
+def build_prompt_v2(verb):
+    return PROMPT_PREFIX_V2 + build_prompt_suffix_v2(verb)
+
+make_prompt = {"v1": build_prompt, "v2": build_prompt_v2}[args.prompt_version]
+
+# ==== Generate (batched) and save ====
+prompts = [make_prompt(verb) for verb in verbs]
+cached = {}
+for i, prompt in enumerate(prompts):
+    hit = cache.get(CACHE_MODEL, prompt, 0.7, 800, 1)
+    if hit is not None:
+        cached[i] = hit
+todo = [i for i in range(len(verbs)) if i not in cached]
+stats = Throughput()
+stats.cached = len(cached)
+# Results come back in the order of `todo`, i.e. verb order with cache hits skipped
+if args.server and args.prefix_cache:
+    fresh = generate_remote(args.server, prefix=PROMPT_PREFIX_V2,
+                            suffixes=[build_prompt_suffix_v2(verbs[i]) for i in todo],
+                            batch_size=args.batch_size, **GEN)
+elif args.server:
+    fresh = generate_remote(args.server, prompts=[prompts[i] for i in todo], batch_size=args.batch_size, **GEN)
+elif args.prefix_cache:
+    prefix_cache = PrefixCache(model, tokenizer, PROMPT_PREFIX_V2)
+    fresh = generate_batched_prefix(prefix_cache, [build_prompt_suffix_v2(verbs[i]) for i in todo],
+                                    batch_size=args.batch_size, **GEN)
+else:
+    fresh = generate_batched(model, tokenizer, [prompts[i] for i in todo], batch_size=args.batch_size, **GEN)
 
-# ==== Generate and save ====
 with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
     for i, verb in enumerate(verbs):
         print(f"[{i+1}/{len(verbs)}] Generating for: {verb}")
-        try:
-            response = generate_for_verb(verb)
-            print("Sample output:", response, "\n")  
-            f.write(json.dumps({"verb": verb, "response": response}) + "\n")
-        except Exception as e:
-            print(f"Error on '{verb}': {e}")
+        if i in cached:
+            response, err = cached[i], None
+        else:
+            _, response, err = next(fresh)
+            if err is None:
+                cache.put(CACHE_MODEL, prompts[i], 0.7, 800, 1, response)
+                stats.generated += 1
+        if err is not None:
+            print(f"Error on '{verb}': {err}")
+            continue
+        print("Sample output:", response, "\n")
+        f.write(json.dumps({"verb": verb, "response": response}) + "\n")
+
+stats.report(args.batch_size)
+if args.prefix_cache and not args.server:
+    prefix_cache.report()
+if args.stop_after and not args.server:
+    STOP_STATS.report()
+if args.draft_model:
+    assisted.report()
+    assisted.close()
+cache.report()
+cache.close()
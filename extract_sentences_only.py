@@ -1,6 +1,9 @@
 # extract_sentences_only.py
 
 import os
+import argparse
+
+from merge_verb_outputs import verb_lines
 
 INPUT_FILES = [
     "verb_outputs_all_roles.txt",
@@ -11,15 +14,19 @@ INPUT_FILES = [
 
 OUTPUT_FILE = "extracted_sentences_only.txt"
 
+ap = argparse.ArgumentParser(description="Write the Sentence: lines of the merged verb outputs to one file.")
+ap.add_argument("--verbs", nargs="+", default=None,
+                help="Only these verbs, read through each file's merge index instead of scanning it.")
+args = ap.parse_args()
+
 with open(OUTPUT_FILE, "w", encoding="utf-8") as fout:
     for filename in INPUT_FILES:
         if not os.path.exists(filename):
             print(f"[WARN] File not found: {filename}")
             continue
-        with open(filename, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip().startswith("Sentence:"):
-                    sentence = line.split("Sentence:", 1)[1].strip().strip('"')
-                    fout.write(sentence + "\n")
+        for line in verb_lines(filename, args.verbs):
+            if line.strip().startswith("Sentence:"):
+                sentence = line.split("Sentence:", 1)[1].strip().strip('"')
+                fout.write(sentence + "\n")
 
 print(f"[DONE] Sentences saved to {OUTPUT_FILE}")
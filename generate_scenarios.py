@@ -5,6 +5,10 @@ import argparse
 import pandas as pd
 import openai
 import re
+from llm_requests import chat_completion, UsageLog
+from llm_cache import add_cache_args, cache_from_args
+from request_policy import add_policy_args, policy_from_args
+from scenario_stream import ScenarioStream, StreamStats
 
 # ==== Configuration & Env Check ====  
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -47,6 +51,36 @@ Avoid repeating agents and avoid generic terms (e.g., "thing," "place")—opt fo
 Finally, state which scenario (1–5) is best, explain why, provide a 1–10 rating for each, and compute the average rating.
 """.strip()
 
+def build_prompt_v2(verb, roles):
+    # Same instructions, but every mention of the verb is moved to the short suffix so all
+    # verbs of a dataset share one identical prompt prefix (provider-side prompt caching)
+    roles_list = ", ".join(roles)
+    blocks = []
+    for i in range(1, 6):
+        parts = [f"{r}: <describe {r.lower()}>" for r in roles]
+        blocks.append(
+            f"{i}. " + "; ".join(parts) +
+            "\n   Sentence: \"<a sentence including all above roles>\""
+        )
+    body = "\n\n".join(blocks)
+    return f"""
+For the target verb named at the end of this message, list exactly five distinct very common scenarios, each with unique roles such as {roles_list}. 
+Each sentence must use the target verb in its inflected verbal form, not as a noun. 
+The verb must function as the main action of the sentence (e.g., “The samurai bowed...” is acceptable, but “The butler gave a bow...”  is not). 
+Do not use any construction that turns the verb into a noun.
+Use this format:
+{body}
+Some roles that may be used include agent (who/what performs the action; must be specific and unique across examples), 
+patient (who/what is the recipient of the action; must differ in each case), 
+instrument (the means of performing the action), and 
+location (where/direction of the action).
+Each scenario sentence must include the exact target verb as a standalone word in the sentence. Do not use a synonym (e.g., “pirouette” for “dance”). 
+Avoid descriptive adjectives. 
+Avoid repeating agents and avoid generic terms (e.g., "thing," "place")—opt for vivid details.
+Finally, state which scenario (1–5) is best, explain why, provide a 1–10 rating for each, and compute the average rating.
+Write the scenarios for the verb "{verb}".
+""".strip()
+
 # Main driver
 def main():
     parser = argparse.ArgumentParser(
@@ -56,10 +90,29 @@ def main():
         "--file", choices=INPUT_FILES.keys(),
         help="CSV key to process; if omitted, all keys are processed"
     )
+    parser.add_argument(
+        "--prompt-version", choices=["v1", "v2"], default="v1",
+        help="v1 = original prompt; v2 = same instructions as one invariant prefix with the verb last"
+    )
+    parser.add_argument(
+        "--usage-log", metavar="PATH", default=None,
+        help="Append prompt/cached/completion token usage of every API request to this JSONL"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Stream completions, write each sentence as soon as it arrives and stop after 5 scenarios"
+    )
+    add_cache_args(parser)
+    add_policy_args(parser)
     args = parser.parse_args()
+    cache = cache_from_args(args)
+    policy = policy_from_args(args)
+    usage = UsageLog(args.usage_log)
+    make_prompt = {"v1": build_prompt, "v2": build_prompt_v2}[args.prompt_version]
 
     keys = [args.file] if args.file else list(INPUT_FILES.keys())
     out_path = "generated_sentences.txt"
+    stream_stats = StreamStats()
     with open(out_path, 'w', encoding='utf-8') as fout:
         for key in keys:
             input_path = INPUT_FILES[key]
@@ -75,13 +128,30 @@ def main():
             }.get(key, ["Agent","Location"])
 
             for verb in verbs:
-                prompt = build_prompt(verb, roles)
-                resp = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role":"user","content":prompt}],
-                    max_tokens=800, temperature=0.7,
-                )
-                raw = resp.choices[0].message.content.strip()
+                prompt = make_prompt(verb, roles)
+                if args.stream:
+                    # sentences are written while the model is still generating the rest
+                    stream = ScenarioStream(prompt, limit=5, model="gpt-3.5-turbo",
+                                            max_tokens=800, temperature=0.7, cache=cache, policy=policy)
+                    try:
+                        for sentence in stream:
+                            fout.write(sentence + "\n")
+                            fout.flush()
+                        stream_stats.add(stream)
+                    except Exception as e:
+                        print(f"Error on '{verb}': {e}")
+                    continue
+                try:
+                    raw = chat_completion(
+                        prompt, model="gpt-3.5-turbo",
+                        max_tokens=800, temperature=0.7, cache=cache,
+                        policy=policy,
+                        usage=usage, label=f"{key}:{verb}",
+                    )
+                except Exception as e:
+                    # retries are exhausted (or the error is permanent): skip this verb
+                    print(f"Error on '{verb}': {e}")
+                    continue
                 # extract sentences
                 blocks = re.findall(r"(\d+\.[\s\S]*?)(?=\n\d+\.|\Z)", raw)[:5]
                 for block in blocks:
@@ -90,6 +160,12 @@ def main():
                     if sentence:
                         fout.write(sentence + "\n")
     print(f"Wrote sentences to {out_path}")
+    stream_stats.report()
+    usage.report()
+    usage.close()
+    policy.report()
+    cache.report()
+    cache.close()
 
 if __name__ == '__main__':
     main()
@@ -4,6 +4,10 @@ import sys
 import argparse
 import openai
 import json
+from llm_requests import chat_completion
+from llm_cache import add_cache_args, cache_from_args
+from request_policy import add_policy_args, policy_from_args
+from batch_api import detector_custom_id, request_line, write_requests, load_results
 
 # ==== Configuration ====
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -44,12 +48,54 @@ parser.add_argument(
     default="extracted_scenarios_with_roles_evaluator.txt",
     help="Path to output file where role-annotated results will be written."
 )
+parser.add_argument(
+    "--write-batch", metavar="PATH", default=None,
+    help="Don't call the API: write one Batch API request per scenario to this JSONL."
+)
+parser.add_argument(
+    "--force", action="store_true",
+    help="Let --write-batch overwrite an existing file."
+)
+parser.add_argument(
+    "--ingest-batch", metavar="RESULTS", default=None,
+    help="Don't call the API: write --output from a Batch API results JSONL."
+)
+add_cache_args(parser)
+add_policy_args(parser)
 args = parser.parse_args()
+cache = cache_from_args(args)
+policy = policy_from_args(args)
 
 # ==== Read Input Scenarios ====
 with open(args.input, "r", encoding="utf-8") as f:
     scenarios = [line.strip() for line in f if line.strip()]
 
+# ==== Offline Batch API mode ====
+if args.write_batch:
+    write_requests(args.write_batch, [
+        request_line(detector_custom_id(i, scenario), build_prompt(scenario),
+                     model="gpt-3.5-turbo", max_tokens=300, temperature=0)
+        for i, scenario in enumerate(scenarios, start=1)
+    ], force=args.force)
+    sys.exit(0)
+
+if args.ingest_batch:
+    results = load_results(args.ingest_batch)
+    with open(args.output, "w", encoding="utf-8") as fout:
+        for i, scenario in enumerate(scenarios, start=1):
+            output_text, err = results.get(detector_custom_id(i, scenario), (None, "missing from batch results"))
+            if err is None:
+                cache.put("gpt-3.5-turbo", build_prompt(scenario), 0, 300, 1, output_text)
+                fout.write(f"Scenario {i}: {scenario}\n")
+                fout.write(output_text + "\n\n")
+            else:
+                print(f"Error on scenario {i}: {err}")
+                fout.write(f"Scenario {i}: {scenario}\nError: {err}\n\n")
+    print(f"\nDone. Output written to {args.output}")
+    cache.report()
+    cache.close()
+    sys.exit(0)
+
 # ==== Process and Generate Role Annotations ====
 with open(args.output, "w", encoding="utf-8") as fout:
     for i, scenario in enumerate(scenarios, start=1):
@@ -57,13 +103,15 @@ with open(args.output, "w", encoding="utf-8") as fout:
         prompt = build_prompt(scenario)
 
         try:
-            response = openai.ChatCompletion.create(
+            # temperature=0 -> deterministic, so reruns are served from the cache
+            output_text = chat_completion(
+                prompt,
                 model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
                 max_tokens=300,
                 temperature=0,
+                cache=cache,
+                policy=policy,
             )
-            output_text = response.choices[0].message.content.strip()
 
             # Write output to file
             fout.write(f"Scenario {i}: {scenario}\n")
@@ -73,3 +121,6 @@ with open(args.output, "w", encoding="utf-8") as fout:
             fout.write(f"Scenario {i}: {scenario}\nError: {e}\n\n")
 
 print(f"\nDone. Output written to {args.output}")
+policy.report()
+cache.report()
+cache.close()
@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+# llama_generation.py
+# Batched generation for the LLaMA generators (llama_generator-Copy1.py,
+# bigger_llama_generator.py). Instead of one pipeline() call per verb, prompts are
+# grouped into batches of similar token length (so little compute goes to padding),
+# left-padded as decoder-only models need, generated together, and handed back in the
+# original verb order.
+#
+# PrefixCache goes one step further for prompts that share a long instruction prefix
+# (the v2 LLaMA prompt: instructions first, verb last): the prefix's key/values are
+# computed once and every verb only prefills its few suffix tokens.
+#
+# stop_after=N ends a row's generation once N complete `Sentence: "..."` lines are in
+# (stop_ratings=True: once the rating block after them is complete too), instead of
+# running to max_new_tokens through the "which one is best" essay.
+#
+# grammar_roles=[...] constrains decoding to the scenario format for that role set
+# (scenario_grammar.py), so every response parses.
+#
+# AssistedDecoding pairs the target model with a small draft model that proposes a few
+# tokens per step for the target to verify in one forward pass (speculative decoding).
+#
+# cpu_int8() prepares a model for CPU-only nodes: dynamic int8 quantization of its
+# linear layers and a thread count matched to the job's CPU allocation.
+import os
+import copy
+import json
+import time
+import urllib.request
+import urllib.error
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList, LogitsProcessor, LogitsProcessorList
+from scenario_stop import scenarios_done
+from scenario_grammar import ScenarioGrammar
+
+
+def prepare_tokenizer(tokenizer):
+    """Left padding (generation continues from the right edge) and a pad token for LLaMA."""
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def length_buckets(prompts, tokenizer, batch_size, window=8):
+    """
+    Split prompt indices into batches of similar token length. Sorting happens within
+    windows of `window` batches, so early verbs aren't held back until the end of the run.
+    """
+    lengths = [len(ids) for ids in tokenizer(prompts, add_special_tokens=True)["input_ids"]]
+    span = batch_size * max(1, window)
+    batches = []
+    for w in range(0, len(prompts), span):
+        order = sorted(range(w, min(w + span, len(prompts))), key=lambda i: -lengths[i])
+        batches.extend(order[j:j + batch_size] for j in range(0, len(order), batch_size))
+    return batches
+
+
+def _sampling(do_sample, temperature):
+    return {"do_sample": True, "temperature": temperature} if do_sample else {"do_sample": False}
+
+
+def generate_batch(model, tokenizer, prompts, max_new_tokens=800, do_sample=True, temperature=0.7,
+                   stop_after=0, stop_ratings=False, grammar_roles=None, assisted=None, **kw):
+    """Generate for a list of prompts in one call; returns the decoded continuations (prompt removed)."""
+    enc = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+    sampling = _sampling(do_sample, temperature)
+    # With left padding every row's prompt ends at the same column
+    prompt_len = enc["input_ids"].shape[1]
+    stop = _stopping(tokenizer, prompt_len, stop_after, stop_ratings, kw)
+    _grammar(tokenizer, prompt_len, max_new_tokens, grammar_roles, kw)
+    t0 = time.perf_counter()
+    gen = dict(enc, max_new_tokens=max_new_tokens, pad_token_id=tokenizer.pad_token_id, **sampling, **kw)
+    with torch.no_grad():
+        out = assisted.generate(model, **gen) if assisted is not None else model.generate(**gen)
+    new_tokens = out[:, prompt_len:]
+    if stop is not None:
+        STOP_STATS.add(stop, new_tokens, max_new_tokens, time.perf_counter() - t0)
+    return [t.strip() for t in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+
+def generate_batched(model, tokenizer, prompts, batch_size=8, **gen_kwargs):
+    """
+    Yield (index, text, error) for every prompt in INPUT order. Batches are formed by
+    length bucket, so a result is held back until everything before it is done; a batch
+    that raises (e.g. out of memory) gives its prompts an error instead of ending the run.
+    """
+    prepare_tokenizer(tokenizer)
+    batches = length_buckets(prompts, tokenizer, max(1, batch_size))
+    return _in_order(batches, lambda batch: generate_batch(model, tokenizer, [prompts[i] for i in batch],
+                                                            **gen_kwargs))
+
+
+def _in_order(batches, run_batch):
+    done = {}
+    nxt = 0
+    for batch in batches:
+        try:
+            texts = run_batch(batch)
+            for i, text in zip(batch, texts):
+                done[i] = (text, None)
+        except Exception as e:
+            for i in batch:
+                done[i] = (None, e)
+        while nxt in done:
+            yield (nxt,) + done.pop(nxt)
+            nxt += 1
+
+
+class Throughput:
+    """verbs/hour for the end-of-run [LLAMA] line (cache hits are counted separately)."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.generated = 0
+        self.cached = 0
+
+    def report(self, batch_size):
+        dt = time.perf_counter() - self.t0
+        rate = self.generated / dt * 3600 if dt and self.generated else 0.0
+        print(f"[LLAMA] generated {self.generated} verbs in {dt:.1f}s ({rate:.0f} verbs/hour, "
+              f"batch size {batch_size}); {self.cached} served from cache")
+
+
+# ==== Structure-aware stopping ====
+class SentenceStoppingCriteria(StoppingCriteria):
+    """
+    Per-row stop once the decoded continuation holds `limit` complete sentences (and,
+    with ratings=True, the rating block after them). Finished rows are padded while the
+    rest of the batch keeps going; generate() ends when every row is done.
+    """
+
+    def __init__(self, tokenizer, prompt_len, limit=5, ratings=False):
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.limit = limit
+        self.ratings = ratings
+        self.stopped_at = {}  # row -> new tokens generated when it was cut
+
+    def __call__(self, input_ids, scores, **kwargs):
+        new = input_ids[:, self.prompt_len:]
+        done = []
+        for row, text in enumerate(self.tokenizer.batch_decode(new, skip_special_tokens=True)):
+            if row not in self.stopped_at and scenarios_done(text, self.limit, self.ratings):
+                self.stopped_at[row] = new.shape[1]
+            done.append(row in self.stopped_at)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def _stopping(tokenizer, prompt_len, stop_after, stop_ratings, kw):
+    """Add the sentence criterion to generate() kwargs `kw`; returns it (None when stop_after is 0)."""
+    if not stop_after:
+        return None
+    stop = SentenceStoppingCriteria(tokenizer, prompt_len, stop_after, stop_ratings)
+    kw["stopping_criteria"] = StoppingCriteriaList(list(kw.get("stopping_criteria") or []) + [stop])
+    return stop
+
+
+class StopStats:
+    """
+    Per-run totals for the [STOP] line. Tokens saved per cut verb are counted up to
+    max_new_tokens (an upper bound: the model may have ended sooner on its own); decode
+    time saved is the batch's skipped steps at its measured per-step time, counted only
+    when the criterion (not EOS) ended the batch.
+    """
+
+    def __init__(self):
+        self.verbs = 0
+        self.cut = 0
+        self.tokens = 0
+        self.tokens_saved = 0
+        self.decode_s = 0.0
+        self.decode_saved_s = 0.0
+
+    def add(self, stop, new_tokens, max_new_tokens, decode_s):
+        rows, steps = new_tokens.shape
+        pad = stop.tokenizer.pad_token_id
+        self.verbs += rows
+        self.cut += len(stop.stopped_at)
+        for row in range(rows):
+            self.tokens += stop.stopped_at.get(row, int((new_tokens[row] != pad).sum()))
+        self.tokens_saved += sum(max_new_tokens - n for n in stop.stopped_at.values())
+        self.decode_s += decode_s
+        if steps < max_new_tokens and stop.stopped_at and max(stop.stopped_at.values()) == steps:
+            self.decode_saved_s += decode_s / max(1, steps) * (max_new_tokens - steps)
+
+    def snapshot(self):
+        return {"verbs": self.verbs, "cut": self.cut, "tokens": self.tokens, "tokens_saved": self.tokens_saved,
+                "decode_s": round(self.decode_s, 2), "decode_saved_s": round(self.decode_saved_s, 2)}
+
+    def report(self):
+        if not self.verbs:
+            return
+        print(f"[STOP] {self.cut}/{self.verbs} verbs cut after the scenarios; {self.tokens / self.verbs:.0f} "
+              f"new tokens/verb generated, up to {self.tokens_saved / self.verbs:.0f} tokens/verb saved; "
+              f"decode {self.decode_s / self.verbs:.2f}s/verb, ~{self.decode_saved_s / self.verbs:.2f}s/verb saved")
+
+
+STOP_STATS = StopStats()
+
+
+# ==== Grammar-constrained decoding ====
+class _TokenTable:
+    """What each vocabulary id appends to the text, plus the lookups the grammar masks need."""
+
+    def __init__(self, tokenizer, vocab_size):
+        # Decoding after an anchor token keeps leading spaces (SentencePiece drops them otherwise)
+        anchor = tokenizer("a", add_special_tokens=False)["input_ids"][-1]
+        base = tokenizer.decode([anchor])
+        special = set(tokenizer.all_special_ids)
+        self.strings = [""] * vocab_size
+        for tid in range(min(vocab_size, len(tokenizer))):
+            if tid in special:
+                continue
+            text = tokenizer.decode([anchor, tid])
+            # Partial UTF-8 sequences (U+FFFD) can't be checked character-wise; control bytes aren't text
+            text = text[len(base):] if text.startswith(base) else ""
+            if all(ch.isprintable() or ch == "\n" for ch in text) and "\ufffd" not in text:
+                self.strings[tid] = text
+        self.by_first = {}
+        for tid, text in enumerate(self.strings):
+            if text:
+                self.by_first.setdefault(text[0], []).append(tid)
+        self.length = torch.tensor([len(x) for x in self.strings])
+        self.leading_space = torch.tensor([x[:1].isspace() for x in self.strings])
+        self._free = {}
+
+    def free(self, forbidden):
+        """(ids made only of allowed characters as a bool tensor, ids containing a forbidden one)."""
+        if forbidden not in self._free:
+            has = [bool(text) and any(ch in forbidden for ch in text) for text in self.strings]
+            self._free[forbidden] = (torch.tensor([bool(t) and not h for t, h in zip(self.strings, has)]),
+                                     [tid for tid, h in enumerate(has) if h])
+        return self._free[forbidden]
+
+
+_TABLES = {}
+
+
+def _token_table(tokenizer, vocab_size):
+    key = (id(tokenizer), vocab_size)
+    if key not in _TABLES:
+        _TABLES[key] = _TokenTable(tokenizer, vocab_size)
+    return _TABLES[key]
+
+
+class ScenarioGrammarProcessor(LogitsProcessor):
+    """
+    Masks every token the scenario grammar can't consume, per row. When a row's
+    remaining token budget gets down to what the format still needs, it switches to
+    closing mode (free fields end as soon as allowed), so max_new_tokens never cuts a
+    scenario in half. Rows past the last sentence may only write EOS.
+    """
+
+    def __init__(self, grammar, tokenizer, prompt_len, max_new_tokens):
+        self.grammar = grammar
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.max_new_tokens = max_new_tokens
+        self.states = None
+        self.table = None
+        self.masks = {}
+
+    def mask(self, state, closing):
+        key = (state, closing)
+        if key not in self.masks:
+            g, table = self.grammar, self.table
+            free = g.free_segment(state)
+            if free is None:
+                allowed = torch.zeros(len(table.strings), dtype=torch.bool)
+                candidates = table.by_first.get(g.next_char(state), [])
+            else:
+                all_free, candidates = table.free(free.forbidden)
+                room = (max(1, state[1]) if closing else free.max_chars) - state[1]
+                allowed = all_free & (table.length <= room)
+                if state[1] == 0:
+                    allowed &= ~table.leading_space
+            for tid in candidates:
+                if g.advance(state, table.strings[tid], closing) is not None:
+                    allowed[tid] = True
+            self.masks[key] = allowed
+        return self.masks[key]
+
+    def __call__(self, input_ids, scores):
+        g = self.grammar
+        if self.table is None:
+            self.table = _token_table(self.tokenizer, scores.shape[-1])
+            self.end = torch.zeros(scores.shape[-1], dtype=torch.bool)
+            self.end[self.tokenizer.eos_token_id] = True
+        step = input_ids.shape[1] - self.prompt_len
+        if self.states is None:
+            self.states = [g.start] * input_ids.shape[0]
+        else:
+            for row, tid in enumerate(input_ids[:, -1].tolist()):
+                state = self.states[row]
+                self.states[row] = None if state is None or g.is_end(state) else \
+                    g.advance(state, self.table.strings[tid])
+        masks = []
+        for state in self.states:
+            if state is None or g.is_end(state):
+                masks.append(self.end)
+            else:
+                # One step stays reserved for EOS
+                closing = self.max_new_tokens - step <= g.needed(state) + 1
+                masks.append(self.mask(state, closing))
+        allowed = torch.stack(masks).to(scores.device)
+        return scores.masked_fill(~allowed, float("-inf"))
+
+
+def _grammar(tokenizer, prompt_len, max_new_tokens, grammar_roles, kw):
+    """Add the scenario grammar for `grammar_roles` to generate() kwargs `kw` (nothing when None)."""
+    if not grammar_roles:
+        return
+    processor = ScenarioGrammarProcessor(ScenarioGrammar(grammar_roles), tokenizer, prompt_len, max_new_tokens)
+    kw["logits_processor"] = LogitsProcessorList(list(kw.get("logits_processor") or []) + [processor])
+
+
+# ==== Assisted (speculative) decoding ====
+class AssistedDecoding:
+    """
+    A draft model (same tokenizer) proposes `draft_tokens` tokens, the target model
+    checks them all in one forward pass and keeps the longest agreeing run plus one
+    token of its own. Greedy output is identical to the target alone; sampled output
+    follows the target's distribution (speculative sampling). transformers only
+    supports this for one prompt per generate() call, so run with batch size 1.
+
+    Forward hooks count passes for the [ASSIST] line: every target pass yields one
+    token of its own, the rest of the generated tokens are accepted drafts. close()
+    (or leaving a `with` block) removes them.
+    """
+
+    def __init__(self, model, draft_model, draft_tokens=5):
+        self.draft_model = draft_model
+        self.draft_tokens = draft_tokens
+        config = draft_model.generation_config
+        config.num_assistant_tokens = draft_tokens
+        config.num_assistant_tokens_schedule = "constant"
+        config.assistant_confidence_threshold = 0.0  # always draft the full `draft_tokens`
+        self.target_passes = 0
+        self.draft_passes = 0
+        self.tokens = 0
+        self.decode_s = 0.0
+        self.active = False
+        self.hooks = [
+            model.register_forward_hook(lambda *_: self._count("target_passes")),
+            draft_model.register_forward_hook(lambda *_: self._count("draft_passes")),
+        ]
+
+    def close(self):
+        """Remove the counting hooks, so the models can be reused (or paired again) without them."""
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _count(self, name):
+        if self.active:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def generate(self, model, **kw):
+        """model.generate() with the draft model attached; records tokens and time."""
+        t0 = time.perf_counter()
+        self.active = True
+        try:
+            out = model.generate(assistant_model=self.draft_model, **kw)
+        finally:
+            self.active = False
+        self.decode_s += time.perf_counter() - t0
+        self.tokens += out.shape[1] - kw["input_ids"].shape[1]
+        return out
+
+    @property
+    def acceptance(self):
+        accepted = self.tokens - self.target_passes
+        return accepted / self.draft_passes if self.draft_passes else 0.0
+
+    def report(self):
+        if self.tokens:
+            print(f"[ASSIST] {self.tokens} tokens in {self.target_passes} target passes "
+                  f"({self.tokens / max(1, self.target_passes):.2f} tokens/pass, draft length {self.draft_tokens}); "
+                  f"{self.acceptance:.0%} of drafted tokens accepted; {self.tokens / self.decode_s:.1f} tokens/s")
+
+
+# ==== CPU backend ====
+def cpu_threads(threads=None):
+    """Threads for CPU generation: explicit, else the CPUs Slurm gave this job, else the ones we may run on."""
+    if threads:
+        return threads
+    if os.environ.get("SLURM_CPUS_PER_TASK"):
+        return int(os.environ["SLURM_CPUS_PER_TASK"])
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def cpu_int8(model, threads=None):
+    """
+    Quantize every nn.Linear (attention, MLP and LM head) to int8 weights with dynamic
+    per-batch activation scales; embeddings and norms stay fp32. Sets torch's thread
+    pool (one inter-op thread: generate() is a single chain of ops). Returns the model.
+    """
+    threads = cpu_threads(threads)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # only settable before the first parallel op
+    fp32_mb = sum(p.numel() * p.element_size() for p in model.parameters()) / 1024 ** 2
+    linear = sum(isinstance(m, torch.nn.Linear) for m in model.modules())
+    model = torch.ao.quantization.quantize_dynamic(model.float().cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    int8_mb = sum(p.numel() * p.element_size() for p in model.parameters()) / 1024 ** 2
+    int8_mb += sum(m.weight().numel() / 1024 ** 2 for m in model.modules()
+                   if isinstance(m, torch.ao.nn.quantized.dynamic.Linear))
+    print(f"[CPU] int8 dynamic quantization of {linear} linear layers ({fp32_mb:.0f} MB fp32 -> ~{int8_mb:.0f} MB), "
+          f"{threads} threads")
+    return model
+
+
+# ==== Shared-prefix KV cache ====
+class PrefixCache:
+    """
+    Key/values of a fixed prompt prefix, computed once. A prompt is then fed as
+    prefix ids + suffix ids and generate() starts from a copy of the cached prefix, so
+    only the suffix is prefilled. Suffixes of one batch must have the same token length
+    (generate_batched_prefix groups them), so no padding sits between prefix and suffix.
+    """
+
+    def __init__(self, model, tokenizer, prefix):
+        self.model = model
+        self.tokenizer = prepare_tokenizer(tokenizer)
+        self.prefix_ids = tokenizer(prefix, return_tensors="pt")["input_ids"].to(model.device)
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            self.kv = model(self.prefix_ids, use_cache=True).past_key_values
+        self.prefill_s = time.perf_counter() - t0
+        self.served = 0
+
+    @property
+    def prefix_tokens(self):
+        return self.prefix_ids.shape[1]
+
+    def suffix_ids(self, suffix):
+        return self.tokenizer(suffix, add_special_tokens=False)["input_ids"]
+
+    def input_ids(self, suffixes):
+        """Full prompt ids (prefix + suffix) for equal-length suffixes."""
+        ids = torch.tensor([self.suffix_ids(x) for x in suffixes], device=self.model.device)
+        return torch.cat([self.prefix_ids.expand(len(suffixes), -1), ids], dim=1)
+
+    def copy_kv(self, batch_size=1):
+        kv = copy.deepcopy(self.kv)
+        if batch_size > 1:
+            kv.batch_repeat_interleave(batch_size)
+        return kv
+
+    def generate(self, suffixes, max_new_tokens=800, do_sample=True, temperature=0.7, use_prefix=True,
+                 stop_after=0, stop_ratings=False, grammar_roles=None, **kw):
+        """Generate for equal-length suffixes; use_prefix=False re-encodes everything (for comparisons)."""
+        ids = self.input_ids(suffixes)
+        if use_prefix:
+            kw["past_key_values"] = self.copy_kv(len(suffixes))
+            self.served += len(suffixes)
+        stop = _stopping(self.tokenizer, ids.shape[1], stop_after, stop_ratings, kw)
+        _grammar(self.tokenizer, ids.shape[1], max_new_tokens, grammar_roles, kw)
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            out = self.model.generate(input_ids=ids, attention_mask=torch.ones_like(ids),
+                                      max_new_tokens=max_new_tokens, pad_token_id=self.tokenizer.pad_token_id,
+                                      **_sampling(do_sample, temperature), **kw)
+        new_tokens = out[:, ids.shape[1]:]
+        if stop is not None:
+            STOP_STATS.add(stop, new_tokens, max_new_tokens, time.perf_counter() - t0)
+        return [t.strip() for t in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+    def report(self):
+        if self.served:
+            print(f"[PREFIX] {self.served} verbs reused a {self.prefix_tokens}-token prefix: "
+                  f"{self.served * self.prefix_tokens} prompt tokens not re-encoded "
+                  f"(prefix prefilled once in {self.prefill_s:.2f}s)")
+
+
+def generate_batched_prefix(prefix_cache, suffixes, batch_size=8, window=8, **gen_kwargs):
+    """Like generate_batched, for prefix + suffix prompts; batches hold suffixes of one token length."""
+    lengths = [len(prefix_cache.suffix_ids(x)) for x in suffixes]
+    span = max(1, batch_size) * max(1, window)
+    batches = []
+    for w in range(0, len(suffixes), span):
+        groups = {}
+        for i in range(w, min(w + span, len(suffixes))):
+            groups.setdefault(lengths[i], []).append(i)
+        for group in groups.values():
+            batches.extend(group[j:j + batch_size] for j in range(0, len(group), max(1, batch_size)))
+    return _in_order(batches, lambda batch: prefix_cache.generate([suffixes[i] for i in batch], **gen_kwargs))
+
+
+# ==== Client for llama_server.py ====
+def server_model(url, timeout=30):
+    """The model a running llama_server.py has loaded (its GET /health), e.g. to key the response cache."""
+    with urllib.request.urlopen(url.rstrip("/") + "/health", timeout=timeout) as resp:
+        return json.loads(resp.read())["model"]
+
+
+def generate_remote(url, prompts=None, prefix=None, suffixes=None, batch_size=8, timeout=3600, **gen_kwargs):
+    """
+    Same (index, text, error) stream as generate_batched, but generated by a running
+    llama_server.py at `url`; sends `batch_size` prompts (or prefix + suffixes) per request.
+    """
+    items = suffixes if prefix is not None else prompts
+    step = max(1, batch_size)
+    for j in range(0, len(items), step):
+        body = dict(gen_kwargs)
+        if prefix is not None:
+            body.update(prefix=prefix, suffixes=items[j:j + step])
+        else:
+            body["prompts"] = items[j:j + step]
+        req = urllib.request.Request(url.rstrip("/") + "/generate", data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                texts, err = json.loads(resp.read())["texts"], None
+        except urllib.error.HTTPError as e:
+            texts, err = None, RuntimeError(f"server error {e.code}: {e.read().decode('utf-8', 'replace')}")
+        except (urllib.error.URLError, OSError) as e:
+            texts, err = None, e
+        for k in range(len(items[j:j + step])):
+            yield j + k, texts[k] if texts else None, err
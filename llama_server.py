@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# llama_server.py
+# Long-lived generation server: load a LLaMA checkpoint once and serve any number of
+# short generator runs over local HTTP, instead of every Slurm job paying the model load.
+#
+#   python llama_server.py --model /ix1/xli/dgt12/llama_job/model-7b --port 8090
+#   python llama_generator-Copy1.py --server http://127.0.0.1:8090 --batch-size 8
+#
+# Requests go into one queue drained by a single worker thread that owns the model;
+# jobs from different clients with the same generation settings that are waiting at
+# the same time are generated together (length-bucketed batches of --max-batch).
+#
+#   POST /generate {"prompts": [...], "max_new_tokens": 800, "do_sample": true, "temperature": 0.7,
+#                   "stop_after": 0, "stop_ratings": false, "grammar_roles": ["Agent", "Location"]}
+#   POST /generate {"prefix": "...", "suffixes": [...], ...}   # reuses the prefix KV cache
+#   -> {"texts": [...]}     (or {"error": "..."} with HTTP 500)
+#   GET  /health, GET /stats
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_snapshot import peak_rss_gb
+from llama_generation import generate_batched, generate_batched_prefix, PrefixCache, prepare_tokenizer, STOP_STATS
+from llama_generation import cpu_int8
+
+
+class Job:
+    def __init__(self, settings, prompts=None, prefix=None, suffixes=None):
+        self.settings = settings
+        self.prefix = prefix
+        self.items = suffixes if prefix is not None else prompts
+        self.key = (prefix, tuple(sorted(settings.items())))
+        self.texts = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GenerationWorker:
+    """Owns the model; runs queued jobs one group (same prefix + settings) at a time."""
+
+    def __init__(self, model, tokenizer, max_batch=8, max_prefixes=4):
+        self.model = model
+        self.tokenizer = prepare_tokenizer(tokenizer)
+        self.max_batch = max_batch
+        self.max_prefixes = max_prefixes
+        self.prefixes = OrderedDict()  # prefix text -> PrefixCache (LRU)
+        self.queue = queue.Queue()
+        self.stats = {"jobs": 0, "prompts": 0, "groups": 0, "busy_s": 0.0}
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def submit(self, job):
+        self.queue.put(job)
+        job.done.wait()
+        return job
+
+    def prefix_cache(self, prefix):
+        if prefix not in self.prefixes:
+            self.prefixes[prefix] = PrefixCache(self.model, self.tokenizer, prefix)
+            while len(self.prefixes) > self.max_prefixes:
+                self.prefixes.popitem(last=False)
+        self.prefixes.move_to_end(prefix)
+        return self.prefixes[prefix]
+
+    def loop(self):
+        while True:
+            jobs = [self.queue.get()]
+            # Coalesce everything already waiting with the same settings into this run
+            later = []
+            while True:
+                try:
+                    job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                (jobs if job.key == jobs[0].key else later).append(job)
+            for job in later:
+                self.queue.put(job)
+            self.run(jobs)
+
+    def run(self, jobs):
+        t0 = time.perf_counter()
+        items = [x for job in jobs for x in job.items]
+        settings = jobs[0].settings
+        try:
+            if jobs[0].prefix is not None:
+                results = generate_batched_prefix(self.prefix_cache(jobs[0].prefix), items,
+                                                  batch_size=self.max_batch, **settings)
+            else:
+                results = generate_batched(self.model, self.tokenizer, items, batch_size=self.max_batch, **settings)
+            texts = [None] * len(items)
+            errors = [None] * len(items)
+            for i, text, err in results:
+                texts[i], errors[i] = text, err
+        except Exception as e:
+            texts, errors = [None] * len(items), [e] * len(items)
+        pos = 0
+        for job in jobs:
+            n = len(job.items)
+            errs = [e for e in errors[pos:pos + n] if e is not None]
+            if errs:
+                job.error = str(errs[0])
+            else:
+                job.texts = texts[pos:pos + n]
+            pos += n
+            job.done.set()
+        self.stats["jobs"] += len(jobs)
+        self.stats["prompts"] += len(items)
+        self.stats["groups"] += 1
+        self.stats["busy_s"] += time.perf_counter() - t0
+
+
+class ServerHandler(BaseHTTPRequestHandler):
+    worker = None
+    info = {}
+
+    def log_message(self, fmt, *a):
+        pass
+
+    def send_json(self, code, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self.send_json(200, {"ok": True, "model": self.info.get("model")})
+        if self.path == "/stats":
+            return self.send_json(200, dict(self.info, queued=self.worker.queue.qsize(),
+                                            uptime_s=round(time.time() - self.info["started"], 1),
+                                            stop=STOP_STATS.snapshot(), **self.worker.stats))
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/generate":
+            return self.send_json(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            settings = {
+                "max_new_tokens": int(body.get("max_new_tokens", 800)),
+                "do_sample": bool(body.get("do_sample", True)),
+                "temperature": float(body.get("temperature", 0.7)),
+                "stop_after": int(body.get("stop_after", 0)),
+                "stop_ratings": bool(body.get("stop_ratings", False)),
+                "grammar_roles": tuple(body.get("grammar_roles") or ()) or None,
+            }
+            if "prefix" in body:
+                job = Job(settings, prefix=body["prefix"], suffixes=list(body["suffixes"]))
+            else:
+                job = Job(settings, prompts=list(body["prompts"]))
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {"error": f"bad request: {e}"})
+        self.worker.submit(job)
+        if job.error is not None:
+            return self.send_json(500, {"error": job.error})
+        self.send_json(200, {"texts": job.texts})
+
+
+def load_model(path, load_in_8bit=False, device_map=None, cpu_int8_threads=None):
+    """cpu_int8_threads: quantize for CPU serving with that many threads (0 = pick automatically)."""
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    kwargs = {"device_map": device_map} if device_map else {}
+    if load_in_8bit:
+        kwargs.update(load_in_8bit=True, torch_dtype="auto")
+    tokenizer = AutoTokenizer.from_pretrained(path, use_fast=True)
+    model = AutoModelForCausalLM.from_pretrained(path, **kwargs).eval()
+    if cpu_int8_threads is not None:
+        model = cpu_int8(model, cpu_int8_threads or None)
+    return model, tokenizer
+
+
+def start_server(model, tokenizer, host="127.0.0.1", port=8090, max_batch=8, info=None):
+    """Serve in a daemon thread. Returns (server, url)."""
+    handler = type("ConfiguredServerHandler", (ServerHandler,), {
+        "worker": GenerationWorker(model, tokenizer, max_batch=max_batch),
+        "info": dict(info or {}, started=time.time()),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Keep a LLaMA model loaded and serve generation over local HTTP.")
+    ap.add_argument("--model", required=True, help="Local checkpoint dir or HF model id.")
+    ap.add_argument("--host", default="127.0.0.1", help="Use 0.0.0.0 to accept clients from other nodes.")
+    ap.add_argument("--port", type=int, default=8090)
+    ap.add_argument("--max-batch", type=int, default=8, help="Prompts per generate() call.")
+    ap.add_argument("--load-in-8bit", action="store_true")
+    ap.add_argument("--device-map", default=None, help='e.g. "auto" to shard across GPUs.')
+    ap.add_argument("--cpu-int8", action="store_true", help="Serve from CPU with int8-quantized linear layers.")
+    ap.add_argument("--threads", type=int, default=0, help="CPU threads with --cpu-int8 (0 = job allocation).")
+    a = ap.parse_args()
+
+    t0 = time.perf_counter()
+    model, tokenizer = load_model(a.model, a.load_in_8bit, a.device_map, a.threads if a.cpu_int8 else None)
+    load_s = time.perf_counter() - t0
+    server, url = start_server(model, tokenizer, a.host, a.port, a.max_batch,
+                               info={"model": a.model + ("+int8" if a.cpu_int8 else ""), "load_s": round(load_s, 1)})
+    print(f"[SERVER] {a.model} loaded in {load_s:.1f}s (peak RSS {peak_rss_gb():.2f} GB); "
+          f"serving on {url} (max batch {a.max_batch})")
+    sys.stdout.flush()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
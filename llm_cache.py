@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# llm_cache.py
+# On-disk response cache shared by every LLM call site (OpenAI generators, the GPT role
+# detector and the LLaMA generators). Entries are keyed on a hash of
+# (model, full prompt, temperature, max_tokens, n), so an unchanged prompt is never
+# sent twice. Backed by SQLite so parallel Slurm tasks can share one file. It uses the
+# rollback journal, not WAL: the default path is under the home directory, a network
+# mount shared by every node, and WAL's shared-memory index only works within one host.
+# Hits only read: their last_used stamps are kept in memory and written in one
+# transaction every TOUCH_EVERY hits and on close, so a warm rerun doesn't take the
+# write lock once per lookup. The async generators go through aget / aput, which run the
+# SQLite calls in a worker thread so a lock wait never stalls the event loop.
+#
+# Bypass with --no-cache on the scripts that take arguments, or LLM_CACHE=off.
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "verb_llm_cache.sqlite")
+)
+DEFAULT_MAX_MB = 512
+DEFAULT_MAX_AGE_DAYS = 90
+TOUCH_EVERY = 200  # hits between last_used flushes
+
+
+def cache_key(model, prompt, temperature, max_tokens, n=1):
+    raw = json.dumps([model, prompt, temperature, max_tokens, n], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed prompt -> response store with size/age eviction and hit stats."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_mb=DEFAULT_MAX_MB,
+                 max_age_days=DEFAULT_MAX_AGE_DAYS, enabled=None):
+        if enabled is None:
+            enabled = os.getenv("LLM_CACHE", "on").lower() not in ("0", "off", "false", "no")
+        self.enabled = enabled
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.touched = {}  # key -> last hit time, not yet written
+        self.lock = threading.Lock()  # one connection, used from worker threads by aget / aput
+        self.db = None
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        # File locks work across nodes on a network filesystem; WAL would not (see top)
+        self.db.execute("PRAGMA journal_mode=DELETE")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+            " size INTEGER, created REAL, last_used REAL)"
+        )
+        self.db.commit()
+        self.evict()
+
+    def get(self, model, prompt, temperature, max_tokens, n=1):
+        if not self.enabled:
+            return None
+        key = cache_key(model, prompt, temperature, max_tokens, n)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and time.time() - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.touch([key])
+        return row[0]
+
+    def touch(self, keys):
+        """Note a hit for LRU eviction; written with the next flush (caller holds the lock)."""
+        now = time.time()
+        for key in keys:
+            self.touched[key] = now
+        if len(self.touched) >= TOUCH_EVERY:
+            self._flush_touched()
+
+    def _flush_touched(self):
+        if self.touched:
+            self.db.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                [(t, key) for key, t in self.touched.items()])
+            self.db.commit()
+            self.touched = {}
+
+    async def aget(self, model, prompt, temperature, max_tokens, n=1):
+        """get() off the event loop: a lookup may wait up to 60s for another task's write lock."""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self.get, model, prompt, temperature, max_tokens, n)
+
+    def put(self, model, prompt, temperature, max_tokens, n, response):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key(model, prompt, temperature, max_tokens, n), model, response,
+                 len(response.encode("utf-8")), now, now),
+            )
+            self.db.commit()
+
+    async def aput(self, model, prompt, temperature, max_tokens, n, response):
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.put, model, prompt, temperature, max_tokens, n, response)
+
+    def evict(self):
+        """Drop entries older than max_age, then least-recently-used ones until under max_bytes."""
+        if not self.enabled:
+            return 0
+        with self.lock:
+            self._flush_touched()
+            removed = 0
+            if self.max_age:
+                cur = self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+                removed += cur.rowcount
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in self.db.execute(
+                    "SELECT key, size FROM responses ORDER BY last_used ASC"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+            self.db.commit()
+            return removed
+
+    def stats(self):
+        entries, size = 0, 0
+        if self.enabled:
+            with self.lock:
+                entries, size = self.db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def report(self):
+        """Print the end-of-run hit/miss summary."""
+        if not self.enabled:
+            print("[CACHE] disabled (--no-cache / LLM_CACHE=off)")
+            return
+        s = self.stats()
+        print("[CACHE] hits: {}, misses: {}, hit rate: {:.1%}, entries: {}, size: {:.1f} MB ({})".format(
+            s["hits"], s["misses"], s["hit_rate"], s["entries"], s["bytes"] / 1e6, self.path))
+
+    def close(self):
+        if self.db is not None:
+            self.evict()
+            self.db.close()
+            self.db = None
+
+
+def add_cache_args(parser):
+    """Add the shared --no-cache / --cache-path / --cache-max-mb / --cache-max-age-days flags."""
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the on-disk LLM response cache (always call the model).")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH,
+                        help="SQLite file for the LLM response cache.")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_MB,
+                        help="Evict least-recently-used entries above this size.")
+    parser.add_argument("--cache-max-age-days", type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help="Evict entries older than this many days (0 = never).")
+    return parser
+
+
+def cache_from_args(args):
+    return ResponseCache(
+        path=args.cache_path,
+        max_mb=args.cache_max_mb,
+        max_age_days=args.cache_max_age_days,
+        enabled=False if args.no_cache else None,
+    )
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# llm_requests.py
+# Shared OpenAI call layer for the generator / detector scripts.
+# Works with the legacy client pinned in requirements.txt (openai==0.28).
+import json
+import time
+import asyncio
+import openai
+from request_policy import RequestPolicy
+
+# Used when a caller doesn't pass its own policy: retries + circuit breaker, no hedging
+DEFAULT_POLICY = RequestPolicy()
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English) for planning / reports."""
+    return max(1, len(text) // 4)
+
+
+class UsageLog:
+    """
+    Per-request token accounting: prompt / cached / completion tokens for every API call
+    (cache hits add nothing). Totals are kept in `.totals`; with `path`, each request is
+    also appended to a JSONL log for later analysis.
+    """
+
+    def __init__(self, path=None):
+        self.totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+        self.fout = open(path, "a", encoding="utf-8") if path else None
+
+    def record(self, model, resp, label=""):
+        u = resp.get("usage") or {}
+        details = u.get("prompt_tokens_details") or {}
+        rec = {
+            "prompt_tokens": u.get("prompt_tokens", 0),
+            "cached_tokens": details.get("cached_tokens", 0),
+            "completion_tokens": u.get("completion_tokens", 0),
+        }
+        self.totals["requests"] += 1
+        for k, v in rec.items():
+            self.totals[k] += v
+        if self.fout is not None:
+            self.fout.write(json.dumps(dict(time=time.time(), model=model, label=label, **rec)) + "\n")
+            self.fout.flush()
+
+    def report(self):
+        t = self.totals
+        if not t["requests"]:
+            return
+        cached_share = t["cached_tokens"] / t["prompt_tokens"] if t["prompt_tokens"] else 0.0
+        print("[USAGE] requests: {}, prompt tokens: {} ({} cached, {:.1%}), completion tokens: {}".format(
+            t["requests"], t["prompt_tokens"], t["cached_tokens"], cached_share, t["completion_tokens"]))
+
+    def close(self):
+        if self.fout is not None:
+            self.fout.close()
+            self.fout = None
+
+
+def chat_completion(prompt, model="gpt-3.5-turbo", max_tokens=800, temperature=0.7, n=1, cache=None,
+                    usage=None, label="", policy=None):
+    """
+    Blocking single-prompt ChatCompletion call; returns the stripped text.
+    If `cache` (an llm_cache.ResponseCache) is given, identical requests are served from disk.
+    If `usage` (a UsageLog) is given, the request's token usage is recorded under `label`.
+    Retries / circuit breaking / the shared rate governor follow `policy` (a request_policy.RequestPolicy).
+    """
+    policy = policy or DEFAULT_POLICY
+    if cache is not None:
+        hit = cache.get(model, prompt, temperature, max_tokens, n)
+        if hit is not None:
+            return hit
+    resp = policy.call(lambda: openai.ChatCompletion.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        n=n,
+        request_timeout=policy.timeout,
+    ), tokens=estimate_tokens(prompt) + max_tokens * n)
+    if usage is not None:
+        usage.record(model, resp, label)
+    out = resp.choices[0].message.content.strip()
+    if cache is not None:
+        cache.put(model, prompt, temperature, max_tokens, n, out)
+    return out
+
+
+async def achat_completion(prompt, model="gpt-3.5-turbo", max_tokens=800, temperature=0.7, n=1, cache=None,
+                           usage=None, label="", policy=None):
+    """Async version of chat_completion (uses openai.ChatCompletion.acreate); may hedge per `policy`."""
+    policy = policy or DEFAULT_POLICY
+    if cache is not None:
+        hit = await cache.aget(model, prompt, temperature, max_tokens, n)
+        if hit is not None:
+            return hit
+    resp = await policy.acall(lambda: openai.ChatCompletion.acreate(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        n=n,
+        request_timeout=policy.timeout,
+    ), tokens=estimate_tokens(prompt) + max_tokens * n)
+    if usage is not None:
+        usage.record(model, resp, label)
+    out = resp.choices[0].message.content.strip()
+    if cache is not None:
+        await cache.aput(model, prompt, temperature, max_tokens, n, out)
+    return out
+
+
+async def generate_in_order(items, worker, limiter):
+    """
+    Run `await worker(item)` for every item with at most `limiter` requests in flight
+    and yield (item, result, error) tuples in INPUT order.
+
+    `limiter` is an asyncio.Semaphore; pass the same one to several calls to cap the
+    total number of in-flight requests across datasets. A result is yielded as soon as
+    it and everything before it has finished, so output files still fill up in order.
+    """
+    async def guarded(item):
+        async with limiter:
+            try:
+                return await worker(item), None
+            except Exception as e:
+                return None, e
+
+    tasks = [asyncio.ensure_future(guarded(item)) for item in items]
+    try:
+        for item, task in zip(items, tasks):
+            result, error = await task
+            yield item, result, error
+    finally:
+        # If the consumer stops early (Ctrl-C, exception) don't leave requests running
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# merge_verb_outputs.py
+# Merge verb_outputs_<key>_chunk*.txt into one verb_outputs_<key>.txt per dataset.
+# Unlike the old shell concatenation, blocks are written in the verb order of the
+# dataset's CSV (whatever chunking / work-queue units produced them), without
+# "==== merging ... ====" banners. A verb that appears in several chunks (re-runs,
+# overlapping ranges) is kept once: the latest successful block wins, an ERROR block is
+# only kept if the verb never succeeded. Missing, failed, empty and unexpected verbs are
+# reported.
+#
+# Next to every merged file a <file>.index.json maps verb -> byte offset/length, so
+# tools can read one verb with read_verb_block() instead of rescanning the file.
+#
+#   python merge_verb_outputs.py [SRC_DIR] [OUT_DIR] [--keys all_roles ...]
+#
+# Chunks are scanned once to record block offsets and then copied block by block, so
+# memory stays at one block regardless of file size.
+import os
+import re
+import json
+import glob
+import argparse
+
+import pandas as pd
+from run_journal import HEADER_RE
+
+INPUT_FILES = {
+    "agent_location": r"./AgentLocation51.csv",
+    "agent_location_instrument": r"./AgentLocationInstrument5.csv",
+    "agent_location_patient": r"./AgentLocationPatient61.csv",
+    "all_roles": r"./all_roles60.csv",
+}
+# Banners written by the old merge_verb_outputs.sh; ends a block, never part of one
+BANNER_RE = re.compile(r"^==== merging .* ====\s*$")
+
+
+def load_verb_order(dataset_key):
+    """Verbs of the dataset in CSV order (same header skip / dropna as the generators)."""
+    return pd.read_csv(INPUT_FILES[dataset_key]).iloc[1:, 0].dropna().astype(str).tolist()
+
+
+def scan_blocks(path):
+    """Yield (verb, body_offset, body_length) for every ==== Verb: x ==== block of a file."""
+    verb, start, pos = None, 0, 0
+    with open(path, "rb") as f:
+        for raw in f:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            m = HEADER_RE.match(line)
+            if m or BANNER_RE.match(line):
+                if verb is not None:
+                    yield verb, start, pos - start
+                verb = m.group(1) if m else None
+                start = pos + len(raw)
+            pos += len(raw)
+    if verb is not None:
+        yield verb, start, pos - start
+
+
+def read_span(path, offset, length):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length).decode("utf-8", errors="replace")
+
+
+def chunk_files(src_dir, key):
+    """Chunk outputs of a dataset, oldest first, so later re-runs override earlier ones."""
+    paths = glob.glob(os.path.join(src_dir, f"verb_outputs_{key}_chunk*.txt"))
+    return sorted(paths, key=lambda p: (os.path.getmtime(p), p))
+
+
+def merge_dataset(key, src_dir, out_dir):
+    chunks = chunk_files(src_dir, key)
+    if not chunks:
+        print(f"[WARN] No chunks found for {key} (pattern: {src_dir}/verb_outputs_{key}_chunk*.txt)")
+        return None
+
+    # verb -> (path, offset, length, ok); a later ok block beats anything, ERROR never beats ok
+    best = {}
+    duplicates = 0
+    for path in chunks:
+        for verb, offset, length in scan_blocks(path):
+            head = read_span(path, offset, min(length, 64)).lstrip()
+            if not head and length > 64:
+                head = read_span(path, offset, length).lstrip()
+            ok = bool(head) and not head.startswith("ERROR:")
+            k = verb.strip().lower()
+            if k in best:
+                duplicates += 1
+                if best[k][3] and not ok:
+                    continue
+            best[k] = (path, offset, length, ok)
+
+    order = load_verb_order(key)
+    seen = set()
+    ordered = []
+    for verb in order:
+        k = verb.strip().lower()
+        if k not in seen:
+            seen.add(k)
+            ordered.append((verb, k))
+    missing = [v for v, k in ordered if k not in best]
+    unexpected = sorted(k for k in best if k not in seen)
+
+    os.makedirs(out_dir, exist_ok=True)
+    out = os.path.join(out_dir, f"verb_outputs_{key}.txt")
+    tmp = out + ".tmp"
+    index = {}
+    failed = []
+    empty = []
+    with open(tmp, "wb") as fout:
+        for verb, k in ordered + [(k, k) for k in unexpected]:
+            if k not in best:
+                continue
+            path, offset, length, ok = best[k]
+            text = read_span(path, offset, length).strip()
+            if not text:
+                empty.append(verb)
+            elif not ok:
+                failed.append(verb)
+            header = f"==== Verb: {verb} ====\n".encode("utf-8")
+            body = (text + "\n\n").encode("utf-8")
+            index[verb] = {"offset": fout.tell(), "length": len(header) + len(body), "ok": ok}
+            fout.write(header)
+            fout.write(body)
+    os.replace(tmp, out)
+    _write_index(out, index)
+
+    print(f"[OK] Wrote {out} ({len(index)} verbs from {len(chunks)} chunks, {duplicates} duplicate blocks dropped)")
+    if missing:
+        print(f"[GAP] {key}: {len(missing)} of {len(ordered)} verbs missing: {', '.join(missing)}")
+    if failed:
+        print(f"[GAP] {key}: {len(failed)} verbs only have ERROR blocks: {', '.join(failed)}")
+    if empty:
+        print(f"[GAP] {key}: {len(empty)} verbs only have empty blocks: {', '.join(empty)}")
+    if unexpected:
+        print(f"[WARN] {key}: {len(unexpected)} verbs not in {INPUT_FILES[key]} (appended at the end): "
+              f"{', '.join(unexpected)}")
+    return {"verbs": len(index), "missing": missing, "failed": failed, "empty": empty, "unexpected": unexpected}
+
+
+# ==== Index readers ====
+def index_path(merged_path):
+    return merged_path + ".index.json"
+
+
+def _write_index(merged_path, index):
+    tmp = index_path(merged_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"size": os.path.getsize(merged_path), "verbs": index}, f, ensure_ascii=False)
+    os.replace(tmp, index_path(merged_path))
+
+
+def load_index(merged_path):
+    """verb -> {"offset", "length", "ok"} for a merged file, or None if its index is missing / stale."""
+    try:
+        with open(index_path(merged_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("size") != os.path.getsize(merged_path):
+        return None  # file changed since it was merged
+    return data["verbs"]
+
+
+def read_verb_block(merged_path, verb, index=None):
+    """Body of one verb's block (without the header), or None if the verb isn't in the file."""
+    index = index if index is not None else load_index(merged_path)
+    if index is None:
+        for v, offset, length in scan_blocks(merged_path):
+            if v == verb:
+                return read_span(merged_path, offset, length).strip()
+        return None
+    entry = index.get(verb)
+    if entry is None:
+        return None
+    block = read_span(merged_path, entry["offset"], entry["length"])
+    return block.split("\n", 1)[1].strip() if "\n" in block else ""
+
+
+def verb_lines(path, verbs=None):
+    """
+    Lines of an output file for the extract tools: the whole file, or with `verbs` only
+    those verbs' blocks, read by seeking through the index (a scan per verb when the file
+    has no fresh index). Verbs that aren't in this file are skipped: the tools pass the
+    same list to every dataset's file.
+    """
+    if verbs is None:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from f
+        return
+    index = load_index(path)
+    for verb in verbs:
+        body = read_verb_block(path, verb, index)
+        if body is not None:
+            yield from body.splitlines(keepends=True)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Merge chunked verb outputs in CSV verb order with a byte-offset index.")
+    ap.add_argument("src_dir", nargs="?", default=".", help="Where the chunk files live.")
+    ap.add_argument("out_dir", nargs="?", default="outputs", help="Where to put the merged files.")
+    ap.add_argument("--keys", nargs="+", choices=list(INPUT_FILES), default=list(INPUT_FILES))
+    a = ap.parse_args()
+
+    for key in a.keys:
+        merge_dataset(key, a.src_dir, a.out_dir)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# model_snapshot.py
+# Cold start for the LLaMA jobs. A local checkpoint directory is checked against the
+# manifest written after its last complete download (file names + sizes, no hub round
+# trip), so snapshot_download only runs when something is missing. Pickled .bin
+# weights are converted once to safetensors, which from_pretrained memory-maps instead
+# of unpickling into RAM.
+#
+#   python model_snapshot.py /ihome/xli/dgt12/llama_job/model-7b --repo-id meta-llama/Llama-2-7b-chat-hf
+#   python model_snapshot.py /ihome/xli/dgt12/llama_job/model-7b --verify-hashes
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+import resource
+
+MANIFEST = "snapshot_manifest.json"
+SAFE_INDEX = "model.safetensors.index.json"
+
+
+def _sha256(path, block=1 << 24):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_manifest(local_dir, hashes=False):
+    files = {}
+    for root, dirs, names in os.walk(local_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]  # skips .cache/huggingface download state
+        for name in names:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, local_dir)
+            if rel == MANIFEST or name.startswith("."):
+                continue
+            files[rel] = {"size": os.path.getsize(path)}
+            if hashes:
+                files[rel]["sha256"] = _sha256(path)
+    with open(os.path.join(local_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"written": time.strftime("%Y-%m-%d %H:%M:%S"), "files": files}, f, indent=1, sort_keys=True)
+    return files
+
+
+def verify_snapshot(local_dir, hashes=False):
+    """List of problems with `local_dir` vs its manifest (empty = complete). No network."""
+    path = os.path.join(local_dir, MANIFEST)
+    if not os.path.exists(path):
+        return ["no manifest"]
+    with open(path, encoding="utf-8") as f:
+        files = json.load(f)["files"]
+    problems = []
+    for rel, info in files.items():
+        full = os.path.join(local_dir, rel)
+        if not os.path.exists(full):
+            problems.append(f"missing {rel}")
+        elif os.path.getsize(full) != info["size"]:
+            problems.append(f"size of {rel}: {os.path.getsize(full)} != {info['size']}")
+        elif hashes and "sha256" in info and _sha256(full) != info["sha256"]:
+            problems.append(f"checksum of {rel}")
+    return problems
+
+
+def convert_to_safetensors(local_dir):
+    """Write model-*.safetensors (+ index) next to pytorch_model*.bin, shard for shard. Returns the files written."""
+    from safetensors.torch import save_file
+    import torch
+
+    if glob.glob(os.path.join(local_dir, "*.safetensors")):
+        return []
+    bins = sorted(glob.glob(os.path.join(local_dir, "pytorch_model*.bin")))
+    weight_map, written = {}, []
+    for k, path in enumerate(bins, start=1):
+        name = "model.safetensors" if len(bins) == 1 else f"model-{k:05d}-of-{len(bins):05d}.safetensors"
+        state = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        # safetensors refuses tensors that share storage (e.g. tied embeddings): give each its own copy
+        seen, tensors = set(), {}
+        for key, t in state.items():
+            ptr = (t.untyped_storage().data_ptr(), t.storage_offset())
+            tensors[key] = t.contiguous().clone() if ptr in seen else t.contiguous()
+            seen.add(ptr)
+            weight_map[key] = name
+        tmp = os.path.join(local_dir, name + ".tmp")
+        save_file(tensors, tmp, metadata={"format": "pt"})
+        os.replace(tmp, os.path.join(local_dir, name))
+        written.append(name)
+        del state, tensors
+    if len(bins) > 1:
+        total = sum(os.path.getsize(os.path.join(local_dir, n)) for n in written)
+        with open(os.path.join(local_dir, SAFE_INDEX), "w", encoding="utf-8") as f:
+            json.dump({"metadata": {"total_size": total}, "weight_map": weight_map}, f, indent=1)
+        written.append(SAFE_INDEX)
+    return written
+
+
+def prepare_local_model(local_dir, repo_id=None, hashes=False, **download_kwargs):
+    """
+    Make `local_dir` a complete safetensors checkpoint: verify it by manifest, download
+    only when that fails (and a repo_id is given), convert .bin weights once, and
+    refresh the manifest. Returns local_dir.
+    """
+    t0 = time.perf_counter()
+    problems = verify_snapshot(local_dir, hashes)
+    if problems:
+        if repo_id is None:
+            raise FileNotFoundError(f"{local_dir} is incomplete ({'; '.join(problems[:3])}) and no repo id was given")
+        from huggingface_hub import snapshot_download
+
+        print(f"[SNAPSHOT] {local_dir}: {'; '.join(problems[:3])} -> downloading {repo_id}")
+        snapshot_download(repo_id=repo_id, local_dir=local_dir, **download_kwargs)
+    else:
+        print(f"[SNAPSHOT] {local_dir} matches its manifest; skipping the hub ({time.perf_counter() - t0:.2f}s)")
+    converted = convert_to_safetensors(local_dir)
+    if converted:
+        print(f"[SNAPSHOT] converted pickled weights to {len(converted)} safetensors file(s)")
+    if problems or converted:
+        write_manifest(local_dir, hashes)
+    return local_dir
+
+
+def peak_rss_gb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** 2
+
+
+def report_load(name, seconds):
+    print(f"[LOAD] {name} loaded in {seconds:.1f}s; peak RSS {peak_rss_gb():.2f} GB")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Verify/download a local checkpoint and convert it to safetensors.")
+    ap.add_argument("local_dir")
+    ap.add_argument("--repo-id", default=None, help="Hub repo to download from if the directory is incomplete.")
+    ap.add_argument("--verify-hashes", action="store_true", help="Also compare SHA-256 (reads every byte).")
+    a = ap.parse_args()
+    try:
+        prepare_local_model(a.local_dir, a.repo_id, a.verify_hashes)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
@@ -2,8 +2,15 @@
 import os
 import sys
 import argparse
+import asyncio
 import pandas as pd
 import openai
+from llm_requests import achat_completion, generate_in_order, UsageLog
+from llm_cache import add_cache_args, cache_from_args
+from request_policy import add_policy_args, policy_from_args
+from scenario_stream import ScenarioStream, StreamStats
+from run_journal import RunJournal
+from batch_api import generation_custom_id, request_line, write_requests, load_results
 
 # ==== Configuration ====
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -37,7 +44,51 @@ parser.add_argument(
     "--chunk-id", type=int, default=None,
     help="(Unused when running all) Optional chunk ID for logging."
 )
+parser.add_argument(
+    "--concurrency", type=int, default=8,
+    help="Max OpenAI requests in flight (shared across all datasets). 1 = old sequential behaviour."
+)
+parser.add_argument(
+    "--resume", action="store_true",
+    help="Continue a previous run from its journal: skip finished verbs, retry only missing/ERROR ones."
+)
+parser.add_argument(
+    "--flush-every", type=int, default=10,
+    help="Commit the journal and rewrite the output file atomically every N verbs."
+)
+parser.add_argument(
+    "--write-batch", metavar="PATH", default=None,
+    help="Don't call the API: write every dataset/verb prompt as a Batch API request JSONL."
+)
+parser.add_argument(
+    "--force", action="store_true",
+    help="Let --write-batch overwrite an existing file."
+)
+parser.add_argument(
+    "--ingest-batch", metavar="RESULTS", default=None,
+    help="Don't call the API: build the usual output files from a Batch API results JSONL."
+)
+parser.add_argument(
+    "--prompt-version", choices=["v1", "v2"], default="v1",
+    help="v1 = original prompt; v2 = same instructions as one invariant prefix with the verb last."
+)
+parser.add_argument(
+    "--usage-log", metavar="PATH", default=None,
+    help="Append prompt/cached/completion token usage of every API request to this JSONL."
+)
+parser.add_argument(
+    "--stop-after", type=int, default=0, metavar="N",
+    help="Stream each response and cut it once N complete Sentence: lines have arrived (0 = off)."
+)
+parser.add_argument(
+    "--stop-after-ratings", action="store_true",
+    help="With --stop-after: keep streaming until the rating block after the sentences is complete."
+)
+add_cache_args(parser)
+add_policy_args(parser)
 args = parser.parse_args()
+cache = cache_from_args(args)
+policy = policy_from_args(args)
 
 # ==== Prompt Builder ====
 def build_prompt(verb, roles):
@@ -83,6 +134,56 @@ Sentence: "In the operating room, the surgeon is cutting the abdominal tissue wi
 
 """
 
+# ==== Prompt Builder v2 (prefix-cache friendly) ====
+# Everything that doesn't depend on the verb comes first, so all requests for a dataset
+# share one long identical prefix (provider prompt caching / KV-prefix reuse); the verb
+# only appears in the short suffix at the very end.
+def build_prompt_prefix_v2(roles):
+    roles_list = ", ".join(roles)
+    return f"""You are generating role-based scenarios.
+
+For the target verb named at the end of this message, create **exactly 5 distinct, everyday scenarios**, each with unique {roles_list}.
+
+Roles:
+- **Agent** (who/what performs the action; must be specific and unique across examples; DO NOT use proper names)
+- **Patient** (who/what is the recipient of the action; must differ in each case)
+- **Instrument** (the means of performing the action)
+- **Location** (always include a **setting location**, typically introduced by 'in', 'at', or 'on'; not just a target location)
+
+**Rules:**
+- Each sentence must contain **only the target verb in progressive form** (one simple verb, do not use synonyms of the target verb, do not use two verbs in the same clause).
+- **No phrasal/compound verbs** (e.g., "fish for", "cut out," "cut off").
+- Avoid nominalization (e.g. "She didn't get much sleep last night" is bad; say instead "She is sleeping poorly").
+- Write each scenario so it could be turned directly into an illustration or photo. Use concrete, imageable details (colors, textures, objects) and avoid vague language.
+- Sentence must include **{roles_list}**.
+
+Follow this structure exactly.
+
+==== Verb: cut ====
+1. Agent: chef; Patient: carrots; Instrument: sharp knife; Location: restaurant kitchen
+Sentence: "The chef is cutting the carrots with a sharp knife at the restaurant kitchen."
+
+2. Agent: barber; Patient: customer's hair; Instrument: stainless steel scissors; Location: barbershop
+Sentence: "At the barbershop, the barber is cutting the customer's hair with stainless steel scissors."
+
+3. Agent: tailor; Patient: blue fabric; Instrument: fabric shears; Location: sewing studio
+Sentence: "The tailor is cutting the blue fabric with fabric shears in the sewing studio."
+
+4. Agent: gardener; Patient: rose bushes; Instrument: pruning shears; Location: backyard garden
+Sentence: "The gardener is cutting the rose bushes with pruning shears on the backyard patio."
+
+5. Agent: surgeon; Patient: abdominal tissue; Instrument: surgical scalpel; Location: operating room
+Sentence: "In the operating room, the surgeon is cutting the abdominal tissue with a surgical scalpel."
+
+---
+"""
+
+def build_prompt_v2(verb, roles):
+    return build_prompt_prefix_v2(roles) + f'\nNow write the 5 scenarios for the verb "{verb}".\n'
+
+make_prompt = {"v1": build_prompt, "v2": build_prompt_v2}[args.prompt_version]
+usage = UsageLog(args.usage_log)  # per-request token usage (cache hits add nothing)
+
 def roles_for(dataset_key: str):
     if dataset_key == "agent_location_instrument":
         return ["Agent", "Instrument", "Location"]
@@ -105,7 +206,9 @@ def output_path_for(dataset_key: str) -> str:
     # Fallback in case you add new keys later
     return f"/ix1/xli/dgt12/outputs/verb_outputs_{dataset_key}.txt"
 
-def process_dataset(dataset_key: str):
+MODEL, MAX_TOKENS, TEMPERATURE = "gpt-3.5-turbo", 800, 0.7
+
+def load_verbs(dataset_key: str):
     input_path = INPUT_FILES[dataset_key]
     ext = os.path.splitext(input_path)[1].lower()
     if ext == ".csv":
@@ -116,43 +219,119 @@ def process_dataset(dataset_key: str):
         sys.exit(f"Unsupported file: {input_path}")
 
     verbs = df.iloc[1:, 0].dropna().astype(str).tolist()  # skip header row 0
-    verbs = verbs[args.start:args.end]
+    return verbs[args.start:args.end]
 
+async def process_dataset(dataset_key: str, limiter: asyncio.Semaphore):
+    verbs = load_verbs(dataset_key)
     if not verbs:
         print(f"[{dataset_key}] No verbs to process in range {args.start}:{args.end}")
         return
 
     out_path = output_path_for(dataset_key)
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    roles = roles_for(dataset_key)
 
     print(f"\n=== Processing '{dataset_key}' verbs {args.start}:{args.end} "
           f"({len(verbs)} total) -> {out_path} ===\n")
 
-    with open(out_path, "w", encoding="utf-8") as fout:
-        for i, verb in enumerate(verbs, start=1):
-            print(f"[{dataset_key}] [{i}/{len(verbs)}] Generating for: {verb}")
-            try:
-                prompt = build_prompt(verb, roles_for(dataset_key))
-                resp = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=800,
-                    temperature=0.7,
-                    n=1,
-                )
-                out = resp.choices[0].message.content.strip()
-                fout.write(f"==== Verb: {verb} ====\n")
-                fout.write(out + "\n\n")
-                fout.flush()
-            except Exception as e:
-                print(f"[{dataset_key}] Error on '{verb}': {e}")
-                fout.write(f"==== Verb: {verb} ====\n")
-                fout.write(f"ERROR: {e}\n\n")
-                fout.flush()
+    async def generate(verb):
+        if args.stop_after:
+            # Streamed and cut after the scenarios (+ ratings), instead of the full 800-token answer
+            stream = ScenarioStream(make_prompt(verb, roles), limit=args.stop_after, ratings=args.stop_after_ratings,
+                                    model=MODEL, max_tokens=MAX_TOKENS, temperature=TEMPERATURE,
+                                    cache=cache, policy=policy)
+            stream_stats.add(stream)
+            return await stream.arun()
+        return await achat_completion(
+            make_prompt(verb, roles),
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            n=1,
+            cache=cache,
+            policy=policy,
+            usage=usage,
+            label=f"{dataset_key}:{verb}",
+        )
+
+    # Requests run concurrently, but blocks are journaled (and committed) in input order
+    journal = RunJournal(out_path, verbs, resume=args.resume, flush_every=args.flush_every)
+    todo = journal.pending()
+    if args.resume:
+        print(f"[{dataset_key}] [RESUME] {len(verbs) - len(todo)} verbs already done, "
+              f"{len(todo)} to (re)generate")
+    try:
+        i = 0
+        async for verb, out, err in generate_in_order(todo, generate, limiter):
+            i += 1
+            if err is None:
+                print(f"[{dataset_key}] [{i}/{len(todo)}] Generated: {verb}")
+            else:
+                print(f"[{dataset_key}] Error on '{verb}': {err}")
+            journal.record(verb, out, err)
+    finally:
+        journal.close()
 
     print(f"[{dataset_key}] Done writing: {out_path}")
 
+# ==== Offline Batch API mode ====
+def write_batch(datasets):
+    lines = []
+    for key in datasets:
+        roles = roles_for(key)
+        for i, verb in enumerate(load_verbs(key)):
+            lines.append(request_line(
+                generation_custom_id(key, args.start + i, verb), make_prompt(verb, roles),
+                model=MODEL, max_tokens=MAX_TOKENS, temperature=TEMPERATURE,
+            ))
+    write_requests(args.write_batch, lines, force=args.force)
+
+def ingest_batch(datasets):
+    results = load_results(args.ingest_batch)
+    for key in datasets:
+        verbs = load_verbs(key)
+        out_path = output_path_for(key)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        roles = roles_for(key)
+        # Going through the journal means `--resume` can later retry just the failed verbs
+        journal = RunJournal(out_path, verbs, resume=args.resume, flush_every=args.flush_every)
+        ok = failed = 0
+        done = set(journal.done())
+        for i, verb in enumerate(verbs):
+            if verb in done:
+                continue
+            cid = generation_custom_id(key, args.start + i, verb)
+            text, err = results.get(cid, (None, "missing from batch results"))
+            if text is not None:
+                cache.put(MODEL, make_prompt(verb, roles), TEMPERATURE, MAX_TOKENS, 1, text)
+                ok += 1
+            else:
+                failed += 1
+            journal.record(verb, text, err)
+        journal.close()
+        print(f"[{key}] Ingested {ok} verbs, {failed} errors -> {out_path}")
+        if ok and cache.enabled:
+            print(f"[CACHE] stored {ok} batch responses (sampled at temperature {TEMPERATURE}): reruns of these "
+                  f"verbs reuse the same sample; use --no-cache or another --cache-path for new draws")
+
 # ==== Run one or all ====
+stream_stats = StreamStats()  # only filled with --stop-after
 datasets_to_run = [args.file] if args.file else list(INPUT_FILES.keys())
-for key in datasets_to_run:
-    process_dataset(key)
+
+async def main():
+    # One semaphore for every dataset so --concurrency is a global cap
+    limiter = asyncio.Semaphore(max(1, args.concurrency))
+    await asyncio.gather(*(process_dataset(key, limiter) for key in datasets_to_run))
+
+if args.write_batch:
+    write_batch(datasets_to_run)
+elif args.ingest_batch:
+    ingest_batch(datasets_to_run)
+else:
+    asyncio.run(main())
+usage.report()
+usage.close()
+stream_stats.report()
+policy.report()
+cache.report()
+cache.close()
@@ -5,6 +5,10 @@ import argparse
 import pandas as pd
 import json
 import openai
+from llm_requests import chat_completion, UsageLog
+from llm_cache import add_cache_args, cache_from_args
+from scenario_stream import ScenarioStream, StreamStats
+from request_policy import add_policy_args, policy_from_args
 
 # ==== Configuration ====  
 # Ensure your API key is set in the environment:
@@ -28,7 +32,29 @@ parser.add_argument(
     choices=INPUT_FILES.keys(),
     help="Which CSV to process. If omitted, all files will be processed in sequence."
 )
+parser.add_argument(
+    "--prompt-version", choices=["v1", "v2"], default="v1",
+    help="v1 = original prompt; v2 = same instructions as one invariant prefix with the verb last."
+)
+parser.add_argument(
+    "--usage-log", metavar="PATH", default=None,
+    help="Append prompt/cached/completion token usage of every API request to this JSONL."
+)
+parser.add_argument(
+    "--stop-after", type=int, default=0, metavar="N",
+    help="Stream each response and cut it once N complete Sentence: lines have arrived (0 = off)."
+)
+parser.add_argument(
+    "--stop-after-ratings", action="store_true",
+    help="With --stop-after: keep streaming until the rating block after the sentences is complete."
+)
+add_cache_args(parser)
+add_policy_args(parser)
 args = parser.parse_args()
+cache = cache_from_args(args)
+policy = policy_from_args(args)
+usage = UsageLog(args.usage_log)
+stream_stats = StreamStats()  # only filled with --stop-after
 
 def build_prompt(verb, roles):
     # Compose a numbered template for exactly five scenarios
@@ -48,6 +74,29 @@ should be given to each scenario, and there should be an average among the 5 sce
 The rating should be done in reference to plausaibility of scenario, as well as whether the roles (agent, location, patient, instrument) are 
 actually being used in the scenario generation. """
 
+def build_prompt_v2(verb, roles):
+    # Same instructions with the verb moved to the very end, so every verb of a dataset
+    # shares one identical prompt prefix (provider-side prompt caching)
+    roles_list = ", ".join(roles)
+    template = [
+        f"{i}. " + "; ".join([f"{r}: <...>" for r in roles]) + "\n   Sentence: \"<a sentence that includes all above roles>\""
+        for i in range(1, 6)
+    ]
+    block = "\n\n".join(template)
+    return f"""
+List exactly five distinct scenarios for the verb named at the end of this message, each with unique {roles_list}. Use this exact format:
+
+{block}
+
+Finally, state which scenario number (1–5) is best and explain why. A number rating from a scale of 1-10 
+should be given to each scenario, and there should be an average among the 5 scenarios for each verb. 
+The rating should be done in reference to plausaibility of scenario, as well as whether the roles (agent, location, patient, instrument) are 
+actually being used in the scenario generation.
+
+Write the scenarios for the verb "{verb}"."""
+
+make_prompt = {"v1": build_prompt, "v2": build_prompt_v2}[args.prompt_version]
+
 # Main processing loop
 keys_to_process = [args.file] if args.file else list(INPUT_FILES.keys())
 for key in keys_to_process:
@@ -82,15 +131,30 @@ for key in keys_to_process:
         for i, verb in enumerate(verbs, start=1):
             print(f"[{i}/{len(verbs)}] Generating for: {verb}")
             try:
-                prompt = build_prompt(verb, roles)
-                resp = openai.ChatCompletion.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=800,
-                    temperature=0.7,
-                    n=1,
-                )
-                out = resp.choices[0].message.content.strip()
+                prompt = make_prompt(verb, roles)
+                if args.stop_after:
+                    # Streamed and cut after the scenarios (+ ratings), instead of the full 800-token answer
+                    stream = ScenarioStream(prompt, limit=args.stop_after, ratings=args.stop_after_ratings,
+                                            model="gpt-4o", max_tokens=800, temperature=0.7,
+                                            cache=cache, policy=policy)
+                    try:
+                        for _ in stream:
+                            pass
+                    finally:
+                        stream_stats.add(stream)
+                    out = stream.text.strip()
+                else:
+                    out = chat_completion(
+                        prompt,
+                        model="gpt-4o",
+                        max_tokens=800,
+                        temperature=0.7,
+                        n=1,
+                        cache=cache,
+                        policy=policy,
+                        usage=usage,
+                        label=f"{key}:{verb}",
+                    )
                 print("Full output:\n", out, "\n")
 
                 # Write a readable JSONL entry: preserve newlines in the file
@@ -102,3 +166,10 @@ for key in keys_to_process:
             except Exception as e:
                 print(f"Error on '{verb}': {e}")
     print(f"Finished processing '{base}'. Output at {OUTPUT_PATH}\n")
+
+usage.report()
+usage.close()
+stream_stats.report()
+policy.report()
+cache.report()
+cache.close()
@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 import os
+import re
 import sys
 import argparse
+import asyncio
 import pandas as pd
 import openai
+from llm_requests import achat_completion, generate_in_order, estimate_tokens, UsageLog
+from llm_cache import add_cache_args, cache_from_args
+from request_policy import add_policy_args, policy_from_args
+from scenario_stream import ScenarioStream, StreamStats
+from run_journal import RunJournal, split_verb_blocks
+from batch_api import generation_custom_id, request_line, write_requests, load_results
 
 # ==== Configuration ====
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -38,30 +46,80 @@ parser.add_argument(
     "--chunk-id", type=int, default=None,
     help="Optional chunk ID (for logging and output naming in array jobs)."
 )
+parser.add_argument(
+    "--output-dir", default="/ix1/xli/dgt12/outputs",
+    help="Directory for the verb_outputs_<file>_chunk<id>.txt files."
+)
+parser.add_argument(
+    "--concurrency", type=int, default=8,
+    help="Max OpenAI requests in flight. 1 = old sequential behaviour."
+)
+parser.add_argument(
+    "--resume", action="store_true",
+    help="Continue a previous run from its journal: skip finished verbs, retry only missing/ERROR ones."
+)
+parser.add_argument(
+    "--flush-every", type=int, default=10,
+    help="Commit the journal and rewrite the output file atomically every N verbs."
+)
+parser.add_argument(
+    "--write-batch", metavar="PATH", default=None,
+    help="Don't call the API: write this chunk's prompts as a Batch API request JSONL."
+)
+parser.add_argument(
+    "--force", action="store_true",
+    help="Let --write-batch overwrite an existing file."
+)
+parser.add_argument(
+    "--ingest-batch", metavar="RESULTS", default=None,
+    help="Don't call the API: build this chunk's output file from a Batch API results JSONL."
+)
+parser.add_argument(
+    "--pack", type=int, default=1,
+    help="Ask for K verbs per request (shares the rules/few-shot prefix); bad sections fall back to 1 verb."
+)
+parser.add_argument(
+    "--prompt-version", choices=["v1", "v2"], default="v1",
+    help="v1 = original prompt; v2 = same instructions as one invariant prefix with the verb last."
+)
+parser.add_argument(
+    "--usage-log", metavar="PATH", default=None,
+    help="Append prompt/cached/completion token usage of every API request to this JSONL."
+)
+parser.add_argument(
+    "--stop-after", type=int, default=0, metavar="N",
+    help="Stream each response and cut it once N complete Sentence: lines have arrived (0 = off)."
+)
+parser.add_argument(
+    "--stop-after-ratings", action="store_true",
+    help="With --stop-after: keep streaming until the rating block after the sentences is complete."
+)
+add_cache_args(parser)
+add_policy_args(parser)
 args = parser.parse_args()
+if args.stop_after and args.pack > 1:
+    parser.error("--stop-after works per verb; it can't be combined with --pack")
 
-# ==== Prompt Builder ====
-def build_prompt(verb, roles):
-    roles_list = ", ".join(roles)
-    return f"""
-    
-You are generating role-based scenarios. 
-
-For the verb "{verb}", create **exactly 5 distinct, everyday scenarios**, each with unique {roles_list}.
+SENTENCE_LINE_RE = re.compile(r"^\s*Sentence:", re.MULTILINE)
+cache = cache_from_args(args)
+policy = policy_from_args(args)
 
-Roles:
+# ==== Prompt Builder ====
+# One copy of the instructions and the "cut" few-shot for every variant (v1, packed, v2):
+# only how the verb is referred to and the packed header rule differ.
+SCENARIO_INSTRUCTIONS = """Roles:
 - **Agent** (who/what performs the action; must be specific and unique across examples; DO NOT use proper names)
 - **Patient** (who/what is the recipient of the action; must differ in each case)
 - **Instrument** (the means of performing the action)
 - **Location** (always include a **setting location**, typically introduced by 'in', 'at', or 'on'; not just a target location)
 
 **Rules:**
-- Each sentence must contain **only the verb "{verb}" in progressive form** (one simple verb, do not use synonyms of "{verb}", do not use two verbs in the same clause).
+- Each sentence must contain **only {verb_ref} in progressive form** (one simple verb, do not use synonyms of {synonym_ref}, do not use two verbs in the same clause).
 - **No phrasal/compound verbs** (e.g., "fish for", "cut out," "cut off").
 - Avoid nominalization (e.g. "She didn't get much sleep last night" is bad; say instead "She is sleeping poorly").
 - Write each scenario so it could be turned directly into an illustration or photo. Use concrete, imageable details (colors, textures, objects) and avoid vague language.
 - Sentence must include **{roles_list}**.
-
+{extra_rules}
 Follow this structure exactly.
 
 ==== Verb: cut ====
@@ -81,8 +139,75 @@ Sentence: "The gardener is cutting the rose bushes with pruning shears on the ba
 Sentence: "In the operating room, the surgeon is cutting the abdominal tissue with a surgical scalpel."
 
 ---
-
 """
+PACKED_HEADER_RULE = '- Start every verb\'s section with its own header line "==== Verb: <verb> ====", in the order the verbs are listed above.\n'
+
+def scenario_instructions(roles, verb_ref, synonym_ref, extra_rules=""):
+    return SCENARIO_INSTRUCTIONS.format(roles_list=", ".join(roles), verb_ref=verb_ref, synonym_ref=synonym_ref,
+                                        extra_rules=extra_rules)
+
+def build_prompt(verb, roles):
+    roles_list = ", ".join(roles)
+    return f"""
+    
+You are generating role-based scenarios. 
+
+For the verb "{verb}", create **exactly 5 distinct, everyday scenarios**, each with unique {roles_list}.
+
+""" + scenario_instructions(roles, f'the verb "{verb}"', f'"{verb}"') + "\n"
+
+# ==== Packed (multi-verb) prompt ====
+# Same rules + "cut" few-shot as build_prompt, sent once for K verbs instead of once per verb.
+def build_packed_prompt(verbs_group, roles):
+    roles_list = ", ".join(roles)
+    verb_list = ", ".join(f'"{v}"' for v in verbs_group)
+    return f"""
+    
+You are generating role-based scenarios. 
+
+For EACH of the {len(verbs_group)} verbs {verb_list}, create **exactly 5 distinct, everyday scenarios**, each with unique {roles_list}.
+
+""" + scenario_instructions(roles, "its section's verb", "that verb", PACKED_HEADER_RULE) + "\n"
+
+# ==== Prompt Builder v2 (prefix-cache friendly) ====
+# Everything that doesn't depend on the verb comes first, so all requests for a dataset
+# share one long identical prefix (provider prompt caching / KV-prefix reuse); the verb
+# only appears in the short suffix at the very end.
+def build_prompt_prefix_v2(roles):
+    roles_list = ", ".join(roles)
+    return f"""You are generating role-based scenarios.
+
+For the target verb named at the end of this message, create **exactly 5 distinct, everyday scenarios**, each with unique {roles_list}.
+
+""" + scenario_instructions(roles, "the target verb", "the target verb")
+
+def build_prompt_v2(verb, roles):
+    return build_prompt_prefix_v2(roles) + f'\nNow write the 5 scenarios for the verb "{verb}".\n'
+
+def build_packed_prompt_v2(verbs_group, roles):
+    verb_list = ", ".join(f'"{v}"' for v in verbs_group)
+    return build_prompt_prefix_v2(roles) + (
+        f"\nFor EACH of the {len(verbs_group)} verbs {verb_list}, create the 5 scenarios as above. "
+        f'Start every verb\'s section with its own header line "==== Verb: <verb> ====", '
+        f"in the order the verbs are listed.\n"
+    )
+
+PROMPT_BUILDERS = {
+    "v1": (build_prompt, build_packed_prompt),
+    "v2": (build_prompt_v2, build_packed_prompt_v2),
+}
+
+def split_packed_response(text, verbs_group):
+    """Map each verb to its section of a packed response; missing/malformed sections are left out."""
+    sections = {}
+    for verb, body in split_verb_blocks(text):
+        sections.setdefault(verb.strip().strip('"').lower(), body)
+    found = {}
+    for verb in verbs_group:
+        body = sections.get(verb.lower(), "")
+        if len(SENTENCE_LINE_RE.findall(body)) >= 5:
+            found[verb] = body
+    return found
 
 # ==== Determine role set ====
 if args.file == "agent_location_instrument":
@@ -93,6 +218,7 @@ elif args.file == "all_roles":
     roles = ["Agent", "Patient", "Instrument", "Location"]
 else:
     roles = ["Agent", "Location"]
+make_prompt, make_packed_prompt = PROMPT_BUILDERS[args.prompt_version]
 
 # ==== Load verbs ====
 input_path = INPUT_FILES[args.file]
@@ -114,35 +240,155 @@ if not verbs:
 
 # ==== Output naming ====
 chunk_suffix = f"_chunk{args.chunk_id}" if args.chunk_id is not None else f"_{args.start}-{args.end}"
-output_path = f"/ix1/xli/dgt12/outputs/verb_outputs_{args.file}{chunk_suffix}.txt"
+output_path = os.path.join(args.output_dir, f"verb_outputs_{args.file}{chunk_suffix}.txt")
+os.makedirs(args.output_dir, exist_ok=True)
+
+# ==== Offline Batch API mode ====
+if args.write_batch:
+    write_requests(args.write_batch, [
+        request_line(generation_custom_id(args.file, args.start + i, verb), make_prompt(verb, roles),
+                     model="gpt-3.5-turbo", max_tokens=800, temperature=0.7)
+        for i, verb in enumerate(verbs)
+    ], force=args.force)
+    sys.exit(0)
+
+if args.ingest_batch:
+    results = load_results(args.ingest_batch)
+    # Through the journal, so a later `--resume` run retries only the failed verbs
+    journal = RunJournal(output_path, verbs, resume=args.resume, flush_every=args.flush_every)
+    done = set(journal.done())
+    stored = 0
+    for i, verb in enumerate(verbs):
+        if verb in done:
+            continue
+        text, err = results.get(generation_custom_id(args.file, args.start + i, verb),
+                                (None, "missing from batch results"))
+        if text is not None:
+            cache.put("gpt-3.5-turbo", make_prompt(verb, roles), 0.7, 800, 1, text)
+            stored += 1
+        journal.record(verb, text, err)
+    journal.close()
+    print(f"Ingested {args.ingest_batch} -> {output_path}")
+    if stored and cache.enabled:
+        print(f"[CACHE] stored {stored} batch responses (sampled at temperature 0.7): reruns of these verbs "
+              f"reuse the same sample; use --no-cache or another --cache-path for new draws")
+    cache.report()
+    cache.close()
+    sys.exit(0)
 
 # ==== Generate scenarios ====
 print(f"\n=== Processing '{args.file}' verbs {args.start}:{args.end} "
       f"({len(verbs)} total) -> {output_path} ===\n")
 
-with open(output_path, "w", encoding="utf-8") as fout:
-    for i, verb in enumerate(verbs, start=1):
-        print(f"[{i}/{len(verbs)}] Generating for: {verb}")
+usage = UsageLog(args.usage_log)  # per-request token usage (cache hits add nothing)
+fallbacks = []  # verbs whose packed section was missing/malformed
+stream_stats = StreamStats()  # only filled with --stop-after
+
+async def generate(verb):
+    if args.stop_after:
+        # Streamed and cut after the scenarios (+ ratings), instead of the full 800-token answer
+        stream = ScenarioStream(make_prompt(verb, roles), limit=args.stop_after, ratings=args.stop_after_ratings,
+                                model="gpt-3.5-turbo", max_tokens=800, temperature=0.7, cache=cache, policy=policy)
+        stream_stats.add(stream)
+        return await stream.arun()
+    return await achat_completion(
+        make_prompt(verb, roles),
+        model="gpt-3.5-turbo",
+        max_tokens=800,
+        temperature=0.7,
+        n=1,
+        cache=cache,
+        policy=policy,
+        usage=usage,
+        label=verb,
+    )
+
+async def generate_group(group):
+    """One packed request for the group; verbs missing from the reply get their own request."""
+    found = {}
+    if len(group) > 1:
         try:
-            prompt = build_prompt(verb, roles)
-            resp = openai.ChatCompletion.create(
+            text = await achat_completion(
+                make_packed_prompt(group, roles),
                 model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=800,
+                max_tokens=min(4096, 800 * len(group)),
                 temperature=0.7,
                 n=1,
+                cache=cache,
+                policy=policy,
+                usage=usage,
+                label=",".join(group),
             )
-            out = resp.choices[0].message.content.strip()
+            found = split_packed_response(text, group)
+        except Exception as e:
+            print(f"Packed request for {group} failed ({e}); falling back to one verb per request")
+    missing = [v for v in group if v not in found]
+    if len(group) > 1:
+        fallbacks.extend(missing)
+    # One after the other: the group holds a single --concurrency slot
+    single = {}
+    for v in missing:
+        try:
+            single[v] = await generate(v)
+        except Exception as e:
+            single[v] = e
+    results = []
+    for verb in group:
+        if verb in found:
+            results.append((verb, found[verb], None))
+        elif isinstance(single[verb], Exception):
+            results.append((verb, None, single[verb]))
+        else:
+            results.append((verb, single[verb], None))
+    return results
 
-            # Write with a clear section header
-            fout.write(f"==== Verb: {verb} ====\n")
-            fout.write(out + "\n\n")
-            fout.flush()
+def report_usage(todo, groups):
+    n = len(todo)
+    if not n:
+        return
+    if args.pack > 1:
+        unpacked = sum(estimate_tokens(make_prompt(v, roles)) for v in todo)
+        packed = sum(estimate_tokens(make_packed_prompt(g, roles)) for g in groups)
+        print(f"[PACK] K={args.pack}: {len(groups)} packed requests + {len(fallbacks)} single-verb "
+              f"fallbacks for {n} verbs (one verb per request would be {n} requests)")
+        print(f"[PACK] est. prompt tokens/verb: {unpacked / n:.0f} unpacked -> {packed / n:.0f} packed")
+    t = usage.totals
+    if t["requests"]:
+        print(f"[USAGE] tokens/verb: prompt {t['prompt_tokens'] / n:.0f} "
+              f"({t['cached_tokens'] / n:.0f} cached), completion {t['completion_tokens'] / n:.0f}")
+    usage.report()
+    usage.close()
 
-        except Exception as e:
-            print(f"Error on '{verb}': {e}")
-            fout.write(f"==== Verb: {verb} ====\n")
-            fout.write(f"ERROR: {e}\n\n")
-            fout.flush()
+async def run_verbs():
+    limiter = asyncio.Semaphore(max(1, args.concurrency))
+    # Journal-backed output: blocks are committed in input order every --flush-every verbs
+    journal = RunJournal(output_path, verbs, resume=args.resume, flush_every=args.flush_every)
+    todo = journal.pending()
+    if args.resume:
+        print(f"[RESUME] {len(verbs) - len(todo)} verbs already done, {len(todo)} to (re)generate")
+    pack = max(1, args.pack)
+    groups = [todo[j:j + pack] for j in range(0, len(todo), pack)]
+    try:
+        i = 0
+        # Requests run concurrently, but blocks come back (and are journaled) in input order
+        async for group, results, err in generate_in_order(groups, generate_group, limiter):
+            if err is not None:
+                results = [(verb, None, err) for verb in group]
+            for verb, out, verr in results:
+                i += 1
+                if verr is None:
+                    print(f"[{i}/{len(todo)}] Generated: {verb}")
+                else:
+                    print(f"Error on '{verb}': {verr}")
+                journal.record(verb, out, verr)
+    finally:
+        journal.close()
+    report_usage(todo, groups)
+
+asyncio.run(run_verbs())
 
 print(f"Done writing: {output_path}")
+stream_stats.report()
+policy.report()
+cache.report()
+cache.close()
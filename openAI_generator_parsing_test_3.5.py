@@ -5,7 +5,13 @@ import pandas as pd
 import json
 import openai
 import re
-from transition_amr_parser.parse import AMRParser
+from llm_requests import chat_completion, UsageLog
+from llm_cache import add_cache_args, cache_from_args
+from request_policy import add_policy_args, policy_from_args
+from scenario_stream import ScenarioStream, StreamStats
+from pipeline import pipelined, PipelineStats
+from amr_cache import add_amr_cache_args, amr_cache_from_args, parse_cached
+from amr_parsing import add_server_args, client_from_args
 
 # ==== Configuration & Env Check ====  
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -20,8 +26,9 @@ INPUT_FILES = {
     "all_roles": "/ix1/xli/dgt12/all_roles60.csv",
 }
 
-# Initialize the AMR parser (path or name of pretrained model)
-amr_parser = AMRParser.from_pretrained('AMR3-structbart-L')  # use correct model name or path
+# AMR parser (path or name of pretrained model): a running amr_server.py, or loaded here on the
+# first sentence missing from the AMR cache
+AMR_MODEL = 'AMR3-structbart-L'  # use correct model name or path
 
 # CLI arguments
 parser = argparse.ArgumentParser(
@@ -31,7 +38,32 @@ parser.add_argument(
     "--file", choices=INPUT_FILES.keys(),
     help="Key of CSV to process (agent_location, agent_instrument, agent_patient, all_roles)"
 )
+parser.add_argument(
+    "--prompt-version", choices=["v1", "v2"], default="v1",
+    help="v1 = original prompt; v2 = same instructions as one invariant prefix with the verb last."
+)
+parser.add_argument(
+    "--usage-log", metavar="PATH", default=None,
+    help="Append prompt/cached/completion token usage of every API request to this JSONL."
+)
+parser.add_argument(
+    "--stream", action="store_true",
+    help="Stream completions and stop after 5 scenarios."
+)
+parser.add_argument(
+    "--pipeline-depth", type=int, default=4,
+    help="Verbs GPT may generate ahead of AMR validation (bounded queue between the two stages)."
+)
+add_cache_args(parser)
+add_amr_cache_args(parser)
+add_server_args(parser)
+add_policy_args(parser)
 args = parser.parse_args()
+cache = cache_from_args(args)
+amr_cache = amr_cache_from_args(args)
+amr_parser = client_from_args(args, AMR_MODEL)
+policy = policy_from_args(args)
+usage = UsageLog(args.usage_log)
 
 # Prompt builder
 
@@ -53,7 +85,96 @@ For the verb \"{verb}\", list exactly five distinct scenarios, each with unique
 Finally, state which scenario (1–5) is best, explain why, provide a 1–10 rating for each, and compute the average rating.
 """.strip()
 
+def build_prompt_v2(verb, roles):
+    # Verb moved to the end so every verb of a dataset shares one identical prompt prefix
+    roles_list = ", ".join(roles)
+    blocks = []
+    for i in range(1,6):
+        parts = [f"{r}: <describe {r.lower()}>" for r in roles]
+        blocks.append(
+            f"{i}. " + "; ".join(parts) +
+            "\n   Sentence: \"<a sentence including all above roles>\""
+        )
+    body = "\n\n".join(blocks)
+    return f"""
+List exactly five distinct scenarios for the verb named at the end of this message, each with unique {roles_list}. Use this format:
+
+{body}
+
+Finally, state which scenario (1–5) is best, explain why, provide a 1–10 rating for each, and compute the average rating.
+
+Write the scenarios for the verb \"{verb}\".
+""".strip()
+
+make_prompt = {"v1": build_prompt, "v2": build_prompt_v2}[args.prompt_version]
+
+def validate_sentences(sentences, roles):
+    # parse and print AMR: the AMR cache first, then the daemon or the local parser, all of a verb's sentences at once
+    validated = []
+    for i, amr_graph, error in parse_cached(amr_cache, sentences, lambda missing: amr_parser.parse(missing, graphs=True),
+                                            AMR_MODEL, graphs=True):
+        sentence = sentences[i]
+        if error is None:
+            print("AMR graph for:", sentence)
+            graph_text = amr_graph.penman
+            print(graph_text)
+        else:
+            print(f"AMR parse error for '{sentence}': {error}")
+            graph_text = ''
+
+        # check role presence (the role's name in the graph text, as this script always has)
+        presence = {r: (r.lower() in graph_text.lower()) for r in roles}
+        print("Roles present:", presence)
+        validated.append({'sentence': sentence, 'roles_present': presence})
+    return validated
+
+def scenario_sentences(text):
+    # split on scenario headings 1.,2.,…
+    scenarios = re.findall(r"(\d+\.[\s\S]*?)(?=\n\d+\.|\Z)", text)[:5]
+    sentences = []
+    for scen in scenarios:
+        # find the sentence line
+        m = re.search(r'Sentence:\s*"([^"]+)"', scen)
+        sentence = m.group(1) if m else ''
+
+        if not sentence:
+            print("Skipping empty or malformed sentence block.")
+            continue
+        sentences.append(sentence)
+    return sentences
+
+def generate(key, verb, roles):
+    # Generation stage: runs in the pipeline's thread, ahead of the AMR validation of earlier verbs.
+    # Returns (response, sentences, error); a failed stream keeps what it produced before the error.
+    print(f"Generating '{verb}'")
+    prompt = make_prompt(verb, roles)
+    if args.stream:
+        # sentences are collected as they arrive; the stream stops after 5 scenarios
+        stream = ScenarioStream(prompt, limit=5, model="gpt-3.5-turbo",
+                                max_tokens=800, temperature=0.7, cache=cache, policy=policy)
+        sentences = []
+        try:
+            for sentence in stream:
+                sentences.append(sentence)
+            stream_stats.add(stream)
+            return stream.text.strip(), sentences, None
+        except Exception as e:
+            # retries are exhausted (or the error is permanent): record it, keep going
+            return stream.text.strip(), sentences, e
+
+    text = chat_completion(
+        prompt, model="gpt-3.5-turbo",
+        max_tokens=800, temperature=0.7, n=1, cache=cache,
+        policy=policy,
+        usage=usage, label=f"{key}:{verb}",
+    )
+    print("GPT →", text.replace("\n"," | "))
+    return text, scenario_sentences(text), None
+
 # Main driver
+stream_stats = StreamStats()
+pipeline_stats = PipelineStats()
+
 def main():
     keys = [args.file] if args.file else list(INPUT_FILES.keys())
     for key in keys:
@@ -72,52 +193,40 @@ def main():
         df = pd.read_csv(input_path) if ext == ".csv" else pd.read_excel(input_path)
         verbs = df.iloc[1:,0].dropna().astype(str).tolist()
 
+        # GPT generates up to --pipeline-depth verbs ahead while this loop AMR-validates and writes, in verb order
+        results = pipelined(verbs, lambda verb: generate(key, verb, roles), depth=args.pipeline_depth,
+                            stats=pipeline_stats)
         with open(output_path, 'w', encoding='utf-8') as fout:
-            for idx, verb in enumerate(verbs, start=1):
-                print(f"[{idx}/{len(verbs)}] Generating '{verb}'")
-                prompt = build_prompt(verb, roles)
-                resp = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role":"user","content":prompt}],
-                    max_tokens=800, temperature=0.7, n=1
-                )
-                text = resp.choices[0].message.content.strip()
-                print("GPT →", text.replace("\n"," | "))
-
-                # split on scenario headings 1.,2.,…
-                scenarios = re.findall(r"(\d+\.[\s\S]*?)(?=\n\d+\.|\Z)", text)[:5]
-                validated = []
-                for scen in scenarios:
-                    # find the sentence line
-                    m = re.search(r'Sentence:\s*"([^"]+)"', scen)
-                    sentence = m.group(1) if m else ''
-
-                    if not sentence:
-                        print("Skipping empty or malformed sentence block.")
-                        continue
-
-                    # parse and print AMR
-                    try:
-                        tokens, _ = amr_parser.tokenize(sentence)
-                        annots, machines = amr_parser.parse_sentence(tokens)
-                        amr_graph = machines.get_amr().to_penman(jamr=False, isi=True)
-                        print("AMR graph for:", sentence)
-                        print(amr_graph)
-                    except Exception as e:
-                        print(f"AMR parse error for '{sentence}': {e}")
-                        amr_graph = ''
-
-                    # check role presence
-                    presence = {r: (r.lower() in amr_graph.lower()) for r in roles}
-                    print("Roles present:", presence)
-                    validated.append({'sentence': sentence, 'roles_present': presence})
-
+            for idx, (verb, generated, err) in enumerate(results, start=1):
+                print(f"[{idx}/{len(verbs)}] Validating '{verb}'")
+                if generated is None:
+                    # retries are exhausted (or the error is permanent): record it, keep going
+                    print(f"Error on '{verb}': {err}")
+                    line = json.dumps({'verb': verb, 'error': str(err)}, ensure_ascii=False)
+                    fout.write(line + "\n\n")
+                    continue
+
+                text, sentences, err = generated
+                entry = {'verb': verb}
+                if err is not None:
+                    print(f"Error on '{verb}': {err}")
+                    entry['error'] = str(err)
                 # write JSONL record
-                entry = {'verb': verb, 'response': text, 'validation': validated}
+                entry.update({'response': text, 'validation': validate_sentences(sentences, roles)})
                 line = json.dumps(entry, ensure_ascii=False).replace('\\n','\n')
                 fout.write(line + "\n\n")
 
         print(f"Finished '{key}'\n")
+    pipeline_stats.report()
+    stream_stats.report()
+    usage.report()
+    usage.close()
+    policy.report()
+    cache.report()
+    cache.close()
+    amr_parser.close()
+    amr_cache.report()
+    amr_cache.close()
 
 if __name__=='__main__':
     main()
@@ -1,39 +1,44 @@
-import sys
 import json
-from transition_amr_parser.parse import AMRParser
-
-# Initialize the AMR parser
-amr_parser = AMRParser.from_pretrained('AMR3-structbart-L')
-
-if len(sys.argv) != 2:
-    print("Usage: python parse_amr_sentences.py <sentences_file>")
-    sys.exit(1)
-
-sent_file = sys.argv[1]
+import argparse
+from amr_parsing import ParseStats, add_server_args, client_from_args
+from amr_cache import add_amr_cache_args, amr_cache_from_args, parse_cached
+
+cli = argparse.ArgumentParser(description="Parse sentences to AMR and flag the roles present.")
+cli.add_argument("sentences_file")
+cli.add_argument("--batch-size", type=int, default=1,
+                 help="Sentences parsed together (grouped by token length); 1 = one at a time.")
+add_amr_cache_args(cli)
+add_server_args(cli)
+args = cli.parse_args()
+amr_cache = amr_cache_from_args(args)
+
+# AMR parser: a running amr_server.py, or loaded here -- only if some sentence isn't in the AMR cache
+amr_parser = client_from_args(args, 'AMR3-structbart-L', batch_size=args.batch_size)
+
+sent_file = args.sentences_file
 output_file = sent_file.rsplit('.', 1)[0] + '_amr_output.txt'
 
-with open(sent_file, 'r', encoding='utf-8') as f_in, open(output_file, 'w', encoding='utf-8') as f_out:
-    for line in f_in:
-        sentence = line.strip()
-        if not sentence:
-            continue
+with open(sent_file, 'r', encoding='utf-8') as f_in:
+    sentences = [line.strip() for line in f_in if line.strip()]
+stats = ParseStats()
+
+with open(output_file, 'w', encoding='utf-8') as f_out:
+    # graphs=True: roles are read off the parser's graph; penman text is only produced for the output
+    for i, amr_graph, error in parse_cached(amr_cache, sentences, lambda missing: amr_parser.parse(missing, graphs=True),
+                                            'AMR3-structbart-L', graphs=True):
+        sentence = sentences[i]
+        stats.add(error)
 
         f_out.write(f"\nSentence: {sentence}\n")
         print(f"\nSentence: {sentence}")
         try:
-            tokens, _ = amr_parser.tokenize(sentence)
-            annots, machines = amr_parser.parse_sentence(tokens)
-            amr_graph = machines.get_amr().to_penman(jamr=False, isi=True)
+            if error is not None:
+                raise error
 
-            f_out.write(amr_graph + "\n")
-            print(amr_graph)
+            f_out.write(amr_graph.penman + "\n")
+            print(amr_graph.penman)
 
-            roles = {
-                "Agent":      ":ARG0" in amr_graph,
-                "Patient":    ":ARG1" in amr_graph,
-                "Instrument": ":instrument" in amr_graph,
-                "Location":   ":location" in amr_graph,
-            }
+            roles = amr_graph.roles()
 
             role_str = f"Roles present: {roles}\n"
             f_out.write(role_str)
@@ -43,3 +48,7 @@ with open(sent_file, 'r', encoding='utf-8') as f_in, open(output_file, 'w', enco
             err_msg = f"Error parsing '{sentence}': {e}\n"
             f_out.write(err_msg)
             print(err_msg)
+
+stats.report(args.batch_size)
+amr_cache.report()
+amr_cache.close()
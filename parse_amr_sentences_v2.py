@@ -1,8 +1,13 @@
 # parse_amr_sentences_v2_debug.py  (no f-strings)
 # RUn this by saying python -u parse_amr_sentences_v2.py extracted_sentences_with_verbs.txt 2>&1 | tee amr_run.log to also get error logs
-import sys, os, traceback
-import penman
-from transition_amr_parser.parse import AMRParser
+# Add --batch-size 32 to parse length-bucketed batches instead of one sentence at a time,
+# and --workers N to parse in N processes forked after the model is loaded (shared weights).
+# Graphs are cached on disk (amr_cache.py): sentences parsed before skip the model, and if
+# every sentence hits, the model isn't loaded at all. --no-amr-cache always parses.
+# With amr_server.py running, the rest is parsed there instead of loading the model here.
+import sys, os, argparse, traceback
+from amr_parsing import ParseStats, add_server_args, client_from_args
+from amr_cache import add_amr_cache_args, amr_cache_from_args, parse_cached
 
 def parse_line(line):
     if "|" not in line:
@@ -16,22 +21,13 @@ def is_animate_heuristic(word):
         "agent","nurse","student","officer","mother","father","adult","human"
     ])
 
-def roles_from_amr(amr_graph_str):
-    roles = {"Agent": False, "Patient": False, "Instrument": False, "Location": False}
-    g = penman.decode(amr_graph_str)
+def roles_from_amr(g):
+    # g: amr_parsing.AMRGraph -- concepts and edges straight from the parser, no penman round trip
+    roles = g.roles()
 
-    var2concept, edges = {}, {}
-    for s, r, t in g.triples:
-        if r == ":instance":
-            var2concept[s] = t
-        else:
-            edges.setdefault(s, []).append((r, t))
-
-    for _, r, _ in g.triples:
-        if r == ":ARG0": roles["Agent"] = True
-        elif r == ":ARG1": roles["Patient"] = True
-        elif r == ":instrument": roles["Instrument"] = True
-        elif r == ":location": roles["Location"] = True
+    var2concept, edges = g.concepts, {}
+    for s, r, t in g.edges:
+        edges.setdefault(s, []).append((r, t))
 
     def dfs_ARG1_chain(var, depth, seen):
         if var in seen or depth > 4:
@@ -46,12 +42,32 @@ def roles_from_amr(amr_graph_str):
                     return True
         return False
 
-    if not roles["Agent"] and g.triples:
-        root_var = g.triples[0][0]
+    if not roles["Agent"] and g.top is not None:
+        root_var = g.top
         if dfs_ARG1_chain(root_var, 0, set()):
             roles["Agent"] = True
     return roles
 
+def write_block(fout, verb, sentence, amr, error):
+    fout.write("==== Verb: {} ====\n".format(verb))
+    fout.write("Sentence: {}\n".format(sentence))
+    fout.write("Detector: AMR\n")
+    if error is None:
+        try:
+            roles = roles_from_amr(amr)
+        except Exception as e:
+            error = e
+    if error is not None:
+        fout.write("Agent: False\nPatient: False\nInstrument: False\nLocation: False\n")
+        fout.write("[ERROR] {}\n\n".format(error))
+        return False
+    fout.write("Agent: {}\n".format(roles["Agent"]))
+    fout.write("Patient: {}\n".format(roles["Patient"]))
+    fout.write("Instrument: {}\n".format(roles["Instrument"]))
+    fout.write("Location: {}\n".format(roles["Location"]))
+    fout.write("AMR:\n{}\n\n".format(amr.penman))
+    return True
+
 def main():
     try:
         print("[BOOT] __name__ = {}".format(__name__)); sys.stdout.flush()
@@ -59,10 +75,21 @@ def main():
         print("[BOOT] CWD  = {}".format(os.getcwd())); sys.stdout.flush()
 
         if len(sys.argv) < 2:
-            print("Usage: python parse_amr_sentences_v2_debug.py <verb_sentence_file>"); sys.stdout.flush()
+            print("Usage: python parse_amr_sentences_v2_debug.py <verb_sentence_file> [--batch-size N]"); sys.stdout.flush()
             sys.exit(1)
 
-        in_path = sys.argv[1]
+        ap = argparse.ArgumentParser(description="AMR role detector over 'verb | sentence' lines.")
+        ap.add_argument("in_path")
+        ap.add_argument("--batch-size", type=int, default=1,
+                        help="Sentences parsed together (grouped by token length); 1 = one at a time.")
+        ap.add_argument("--workers", type=int, default=1,
+                        help="Parsing processes forked after the model is loaded (share its memory).")
+        ap.add_argument("--chunk-size", type=int, default=16, help="Sentences handed to a worker at a time.")
+        add_amr_cache_args(ap)
+        add_server_args(ap)
+        args = ap.parse_args()
+        amr_cache = amr_cache_from_args(args)
+        in_path = args.in_path
         print("[INFO] Input (given): {}".format(in_path)); sys.stdout.flush()
         in_abs = os.path.abspath(in_path)
         print("[INFO] Input (abs)  : {}".format(in_abs)); sys.stdout.flush()
@@ -79,51 +106,47 @@ def main():
             f.write("[RUN-START]\n")
         print("[INFO] Output file created/cleared."); sys.stdout.flush()
 
-        print("[INFO] Loading AMR model AMR3-structbart-L ..."); sys.stdout.flush()
-        parser = AMRParser.from_pretrained("AMR3-structbart-L")
-        print("[INFO] Model loaded."); sys.stdout.flush()
-
         total = 0; written = 0; skipped = 0
 
-        with open(in_path, "r", encoding="utf-8") as fin, \
-             open(out_path, "a", encoding="utf-8") as fout:
-
+        # Read everything first: sentences are parsed in batches, malformed lines keep their place
+        entries = []
+        with open(in_path, "r", encoding="utf-8") as fin:
             for raw in fin:
                 raw = raw.strip()
                 if not raw:
                     continue
                 total += 1
                 verb, sentence = parse_line(raw)
-                if not verb or not sentence:
+                entries.append((raw, verb, sentence) if verb and sentence else (raw, None, None))
+        good = [e for e in entries if e[1]]
+        # Only used if some sentence isn't in the AMR cache: the daemon, else the model loaded here
+        parser = client_from_args(args, "AMR3-structbart-L", batch_size=args.batch_size,
+                                  workers=args.workers, chunk_size=args.chunk_size)
+        # graphs=True: roles come from the parser's graph objects; penman text only for the cache and the output
+        results = parse_cached(amr_cache, [e[2] for e in good], lambda missing: parser.parse(missing, graphs=True),
+                               "AMR3-structbart-L", graphs=True)
+        stats = ParseStats()
+
+        with open(out_path, "a", encoding="utf-8") as fout:
+            done = 0
+            for raw, verb, sentence in entries:
+                if not verb:
                     skipped += 1
                     fout.write("\n[SKIP] Malformed line: {}\n".format(raw))
                     continue
 
-                if total % 25 == 0:
-                    print("[INFO] processed {} lines...".format(total)); sys.stdout.flush()
-
-                try:
-                    tokens, _ = parser.tokenize(sentence)
-                    annots, machines = parser.parse_sentence(tokens)
-                    amr_penman = machines.get_amr().to_penman(jamr=False, isi=True)
-                    roles = roles_from_amr(amr_penman)
-
-                    fout.write("==== Verb: {} ====\n".format(verb))
-                    fout.write("Sentence: {}\n".format(sentence))
-                    fout.write("Detector: AMR\n")
-                    fout.write("Agent: {}\n".format(roles["Agent"]))
-                    fout.write("Patient: {}\n".format(roles["Patient"]))
-                    fout.write("Instrument: {}\n".format(roles["Instrument"]))
-                    fout.write("Location: {}\n".format(roles["Location"]))
-                    fout.write("AMR:\n{}\n\n".format(amr_penman))
+                _, amr, error = next(results)
+                stats.add(error)
+                if write_block(fout, verb, sentence, amr, error):
                     written += 1
-
-                except Exception as e:
-                    fout.write("==== Verb: {} ====\n".format(verb))
-                    fout.write("Sentence: {}\n".format(sentence))
-                    fout.write("Detector: AMR\n")
-                    fout.write("Agent: False\nPatient: False\nInstrument: False\nLocation: False\n")
-                    fout.write("[ERROR] {}\n\n".format(e))
+                done += 1
+                if done % 25 == 0:
+                    print("[INFO] processed {} lines...".format(done)); sys.stdout.flush()
+
+        stats.report(args.batch_size)
+        parser.close()
+        amr_cache.report()
+        amr_cache.close()
 
         print("[DONE] Lines read: {}, written: {}, skipped: {}.".format(total, written, skipped)); sys.stdout.flush()
         print("[DONE] Output saved to: {}".format(out_abs)); sys.stdout.flush()
@@ -1,7 +1,7 @@
-import sys
 import json
-from transition_amr_parser.parse import AMRParser
-import penman
+import argparse
+from amr_parsing import ParseStats, add_server_args, client_from_args
+from amr_cache import add_amr_cache_args, amr_cache_from_args, parse_cached
 import re
 from pathlib import Path
 
@@ -22,16 +22,13 @@ EXTRACT_CONCEPTS = True
 concept_dump_file = "potential_agents.jsonl"
 
 def extract_concept_candidates(g):
-    var_to_concept = {}
+    var_to_concept = g.concepts
     edges = {}
-    for src, rel, tgt in g.triples:
-        if rel == ":instance":
-            var_to_concept[src] = tgt
-        else:
-            edges.setdefault(src, []).append((rel, tgt))
+    for src, rel, tgt in g.edges:
+        edges.setdefault(src, []).append((rel, tgt))
 
     candidates = []
-    root_var = g.triples[0][0]
+    root_var = g.top
     visited = set()
 
     def recurse(var, depth=0):
@@ -48,24 +45,9 @@ def extract_concept_candidates(g):
     recurse(root_var)
     return candidates
 
-def fallback_roles_recursive(amr_graph_str, sentence):
-    g = penman.decode(amr_graph_str)
-    roles_present = {
-        "Agent": False,
-        "Patient": False,
-        "Instrument": False,
-        "Location": False
-    }
-
-    for _, role, _ in g.triples:
-        if role == ":ARG0":
-            roles_present["Agent"] = True
-        elif role == ":ARG1":
-            roles_present["Patient"] = True
-        elif role == ":instrument":
-            roles_present["Instrument"] = True
-        elif role == ":location":
-            roles_present["Location"] = True
+def fallback_roles_recursive(g, sentence):
+    # g: amr_parsing.AMRGraph, read off the parser's graph (or decoded once from cached penman)
+    roles_present = g.roles()
 
     # No Agent → extract candidates
     if not roles_present["Agent"] and EXTRACT_CONCEPTS:
@@ -80,31 +62,39 @@ def fallback_roles_recursive(amr_graph_str, sentence):
 
     return roles_present
 
-# Initialize the AMR parser
-amr_parser = AMRParser.from_pretrained('AMR3-structbart-L')
+cli = argparse.ArgumentParser(description="Parse sentences to AMR; recursive agent fallback and concept dump.")
+cli.add_argument("sentences_file")
+cli.add_argument("--batch-size", type=int, default=1,
+                 help="Sentences parsed together (grouped by token length); 1 = one at a time.")
+add_amr_cache_args(cli)
+add_server_args(cli)
+args = cli.parse_args()
+amr_cache = amr_cache_from_args(args)
 
-if len(sys.argv) != 2:
-    print("Usage: python parse_amr_sentences.py <sentences_file>")
-    sys.exit(1)
+# AMR parser: a running amr_server.py, or loaded here -- only if some sentence isn't in the AMR cache
+amr_parser = client_from_args(args, 'AMR3-structbart-L', batch_size=args.batch_size)
 
-sent_file = sys.argv[1]
+sent_file = args.sentences_file
 output_file = sent_file.rsplit('.', 1)[0] + '_amr_output_v2.txt'
 
-with open(sent_file, 'r', encoding='utf-8') as f_in, open(output_file, 'w', encoding='utf-8') as f_out:
-    for line in f_in:
-        sentence = line.strip()
-        if not sentence:
-            continue
+with open(sent_file, 'r', encoding='utf-8') as f_in:
+    sentences = [line.strip() for line in f_in if line.strip()]
+stats = ParseStats()
+
+with open(output_file, 'w', encoding='utf-8') as f_out:
+    for i, amr_graph, error in parse_cached(amr_cache, sentences, lambda missing: amr_parser.parse(missing, graphs=True),
+                                            'AMR3-structbart-L', graphs=True):
+        sentence = sentences[i]
+        stats.add(error)
 
         f_out.write(f"\nSentence: {sentence}\n")
         print(f"\nSentence: {sentence}")
         try:
-            tokens, _ = amr_parser.tokenize(sentence)
-            annots, machines = amr_parser.parse_sentence(tokens)
-            amr_graph = machines.get_amr().to_penman(jamr=False, isi=True)
+            if error is not None:
+                raise error
 
-            f_out.write(amr_graph + "\n")
-            print(amr_graph)
+            f_out.write(amr_graph.penman + "\n")
+            print(amr_graph.penman)
 
             roles = fallback_roles_recursive(amr_graph, sentence)
 
@@ -116,3 +106,7 @@ with open(sent_file, 'r', encoding='utf-8') as f_in, open(output_file, 'w', enco
             err_msg = f"Error parsing '{sentence}': {e}\n"
             f_out.write(err_msg)
             print(err_msg)
+
+stats.report(args.batch_size)
+amr_cache.report()
+amr_cache.close()
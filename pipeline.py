@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# pipeline.py
+# Two-stage producer/consumer flow for the generate-then-validate scripts: a background
+# thread runs the first stage (the GPT call) item after item while the caller's loop
+# runs the second (AMR parsing, writing) on earlier items, so a run takes about
+# max(generation, parsing) instead of their sum. A bounded queue between the stages
+# keeps generation at most `depth` items ahead: when parsing is the slow stage, the
+# producer waits instead of piling up responses.
+#
+#   for verb, (text, sentences), err in pipelined(verbs, generate, depth=4, stats=stats):
+#       ...                                   # runs while later verbs are being generated
+import sys
+import time
+import queue
+import threading
+
+
+class PipelineStats:
+    """Where each stage spent its time, for the end-of-run [PIPELINE] line."""
+
+    def __init__(self):
+        self.items = 0
+        self.produce_s = 0.0    # first stage working
+        self.full_s = 0.0       # first stage blocked on a full queue (second stage is the bottleneck)
+        self.empty_s = 0.0      # second stage waiting for the first
+        self.t0 = None
+        self.t1 = None
+
+    def report(self):
+        if self.t0 is None:
+            return
+        wall = (self.t1 or time.perf_counter()) - self.t0
+        consume = max(0.0, wall - self.empty_s)
+        print("[PIPELINE] {} items in {:.1f}s: generation busy {:.1f}s, validation busy {:.1f}s "
+              "(sequential would be ~{:.1f}s); generation waited {:.1f}s on a full queue, "
+              "validation {:.1f}s on generation".format(
+                  self.items, wall, self.produce_s, consume, self.produce_s + consume, self.full_s, self.empty_s))
+        sys.stdout.flush()
+
+
+def pipelined(items, produce, depth=4, stats=None):
+    """
+    Yield (item, result, error) in INPUT order with result = produce(item) computed in
+    a background thread, at most `depth` items ahead of the consumer. An exception
+    raised by produce is yielded as the error of its item; the thread goes on with the
+    next one. Leaving the loop early stops the thread after its current item.
+    """
+    stats = stats if stats is not None else PipelineStats()
+    q = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    done = object()
+
+    def put(entry):
+        t0 = time.perf_counter()
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        stats.full_s += time.perf_counter() - t0
+
+    def run():
+        for item in items:
+            if stop.is_set():
+                return
+            t0 = time.perf_counter()
+            try:
+                entry = (item, produce(item), None)
+            except Exception as e:
+                entry = (item, None, e)
+            stats.produce_s += time.perf_counter() - t0
+            put(entry)
+        put(done)
+
+    if stats.t0 is None:
+        stats.t0 = time.perf_counter()
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            entry = q.get()
+            stats.empty_s += time.perf_counter() - t0
+            if entry is done:
+                break
+            stats.items += 1
+            yield entry
+    finally:
+        stop.set()
+        stats.t1 = time.perf_counter()
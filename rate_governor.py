@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# rate_governor.py
+# Shared request/token governor for every process that uses one API key. All generator
+# and detector processes (Slurm array tasks, local runs) point --governor at the same
+# SQLite file on shared storage; before each request goes out, RequestPolicy asks the
+# governor for room in the last-60s window:
+#   - requests per minute (--rpm) and tokens per minute (--tpm) across all processes
+#   - a hard token budget per run label (--token-budget), checked before sending
+# A request reserves its estimated tokens (prompt estimate + max_tokens); once the
+# response arrives the reservation is corrected to the real usage.
+#
+# The file is shared by tasks on different nodes, so it uses SQLite's rollback journal
+# (file locks) rather than WAL, whose shared-memory index only works within one host.
+#
+# Live readout of what everyone is consuming:
+#   python rate_governor.py --governor /ix1/xli/dgt12/outputs/governor.sqlite status --watch 5
+import os
+import time
+import asyncio
+import sqlite3
+import argparse
+import threading
+
+WINDOW = 60.0
+
+
+class BudgetExceededError(Exception):
+    """The run's token budget would be exceeded; not retried (classified as permanent)."""
+
+
+class RateGovernor:
+    def __init__(self, path, rpm=0, tpm=0, token_budget=0, run="default"):
+        self.path = path
+        self.rpm = rpm
+        self.tpm = tpm
+        self.token_budget = token_budget
+        self.run = run
+        self.waited = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        # BEGIN IMMEDIATE below must exclude other nodes too: file locks, not WAL (see top)
+        self.db.execute("PRAGMA journal_mode=DELETE")
+        self.lock = threading.Lock()  # one transaction at a time on the shared connection (async runs use threads)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS window (id INTEGER PRIMARY KEY, ts REAL, tokens INTEGER,"
+            " run TEXT, pid INTEGER, settled INTEGER DEFAULT 0)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS totals (run TEXT PRIMARY KEY, requests INTEGER, tokens INTEGER)"
+        )
+
+    def _try_acquire(self, tokens):
+        """One attempt: returns (ticket, 0) on success or (None, seconds to wait)."""
+        with self.lock:
+            return self._try_acquire_locked(tokens)
+
+    def _try_acquire_locked(self, tokens):
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM window WHERE ts < ?", (now - 2 * WINDOW,))
+            if self.token_budget:
+                spent = self.db.execute(
+                    "SELECT COALESCE(SUM(tokens), 0) FROM totals WHERE run = ?", (self.run,)
+                ).fetchone()[0]
+                if spent + tokens > self.token_budget:
+                    raise BudgetExceededError(
+                        f"token budget of run '{self.run}' exhausted: {spent} used (incl. in flight) "
+                        f"+ {tokens} requested > {self.token_budget}")
+            n, used, oldest = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0), MIN(ts) FROM window WHERE ts >= ?",
+                (now - WINDOW,),
+            ).fetchone()
+            # An empty window always admits, so one request larger than the TPM can't stall forever
+            if n and ((self.rpm and n + 1 > self.rpm) or (self.tpm and used + tokens > self.tpm)):
+                self.db.execute("COMMIT")
+                return None, min(5.0, max(0.05, oldest + WINDOW - now))
+            cur = self.db.execute(
+                "INSERT INTO window (ts, tokens, run, pid) VALUES (?, ?, ?, ?)", (now, tokens, self.run, os.getpid())
+            )
+            self.db.execute(
+                "INSERT INTO totals VALUES (?, 1, ?) ON CONFLICT(run) DO UPDATE SET "
+                "requests = requests + 1, tokens = tokens + excluded.tokens", (self.run, tokens)
+            )
+            self.db.execute("COMMIT")
+            return (cur.lastrowid, tokens), 0.0
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def acquire(self, tokens):
+        """Block until the request fits in the shared RPM/TPM window; returns a ticket for settle()."""
+        while True:
+            ticket, wait = self._try_acquire(tokens)
+            if ticket is not None:
+                return ticket
+            self.waited += wait
+            time.sleep(wait)
+
+    async def aacquire(self, tokens):
+        # The transaction can wait up to 60s for another node's lock: keep it off the event loop
+        while True:
+            ticket, wait = await asyncio.to_thread(self._try_acquire, tokens)
+            if ticket is not None:
+                return ticket
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+    def settle(self, ticket, actual_tokens):
+        """Replace a reservation's estimate with the real usage (0 if the request failed)."""
+        row_id, reserved = ticket
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("UPDATE window SET tokens = ?, settled = 1 WHERE id = ?", (actual_tokens, row_id))
+            self.db.execute("UPDATE totals SET tokens = tokens + ? WHERE run = ?", (actual_tokens - reserved, self.run))
+            self.db.execute("COMMIT")
+
+    async def asettle(self, ticket, actual_tokens):
+        await asyncio.to_thread(self.settle, ticket, actual_tokens)
+
+    def snapshot(self):
+        now = time.time()
+        n, used, in_flight = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COALESCE(SUM(settled = 0), 0) FROM window WHERE ts >= ?",
+            (now - WINDOW,),
+        ).fetchone()
+        runs = self.db.execute("SELECT run, requests, tokens FROM totals ORDER BY run").fetchall()
+        return {"rpm": n, "tpm": used, "in_flight": in_flight, "runs": runs}
+
+    def report(self):
+        s = self.snapshot()
+        spent = dict((r, t) for r, _, t in s["runs"]).get(self.run, 0)
+        budget = f" of {self.token_budget} budget ({spent / self.token_budget:.0%})" if self.token_budget else ""
+        print("[GOVERNOR] run '{}': {} tokens{}; {:.1f}s of request time spent waiting for rate limits "
+              "(last 60s, all processes: {} requests, {} tokens)".format(
+                  self.run, spent, budget, self.waited, s["rpm"], s["tpm"]))
+
+    def close(self):
+        self.db.close()
+
+
+def print_status(gov):
+    s = gov.snapshot()
+    limits = lambda used, limit: f"{used}/{limit}" if limit else str(used)
+    print("[GOVERNOR] {}  last 60s: {} requests, {} tokens, {} in flight".format(
+        time.strftime("%H:%M:%S"), limits(s["rpm"], gov.rpm), limits(s["tpm"], gov.tpm), s["in_flight"]))
+    for run, requests, tokens in s["runs"]:
+        budget = f" / {gov.token_budget} ({tokens / gov.token_budget:.0%})" if gov.token_budget else ""
+        print(f"[GOVERNOR]   run '{run}': {requests} requests, {tokens} tokens{budget}")
+
+
+def add_governor_args(parser):
+    """Shared --governor / --rpm / --tpm / --token-budget / --run-label flags."""
+    parser.add_argument("--governor", metavar="PATH", default=os.getenv("LLM_GOVERNOR_PATH"),
+                        help="SQLite file on shared storage used by every process on this API key.")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute across all processes (0 = no limit).")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute across all processes (0 = no limit).")
+    parser.add_argument("--token-budget", type=int, default=0,
+                        help="Hard cap on total tokens for this --run-label (0 = no cap).")
+    parser.add_argument("--run-label", default="default", help="Budget bucket shared by the processes of one run.")
+    return parser
+
+
+def governor_from_args(args):
+    if not args.governor:
+        return None
+    return RateGovernor(args.governor, rpm=args.rpm, tpm=args.tpm, token_budget=args.token_budget,
+                        run=args.run_label)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Live readout of a shared rate governor.")
+    add_governor_args(ap)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("status", help="Show the last-60s rate and per-run token totals.")
+    p.add_argument("--watch", type=float, default=0, help="Refresh every N seconds.")
+    p = sub.add_parser("reset", help="Forget the totals of --run-label (starts its budget over).")
+    a = ap.parse_args()
+    if not a.governor:
+        ap.error("--governor (or LLM_GOVERNOR_PATH) is required")
+
+    gov = governor_from_args(a)
+    if a.cmd == "reset":
+        gov.db.execute("DELETE FROM totals WHERE run = ?", (a.run_label,))
+        print(f"[GOVERNOR] reset run '{a.run_label}'")
+    else:
+        while True:
+            print_status(gov)
+            if not a.watch:
+                break
+            time.sleep(a.watch)
+    gov.close()
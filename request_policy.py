@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+# request_policy.py
+# Resilience layer used by llm_requests.py for every OpenAI call:
+#   - errors are classified as rate_limit / timeout / transient / permanent
+#   - retryable errors are retried with full-jitter exponential backoff, honouring Retry-After
+#   - a circuit breaker stops all callers from hammering a degraded endpoint
+#   - (async, optional) a hedged second request is sent when one runs past the observed p95
+#   - (optional) every attempt first waits for room in a shared rate_governor.RateGovernor
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import openai
+from rate_governor import add_governor_args, governor_from_args
+
+RATE_LIMIT = "rate_limit"
+TIMEOUT = "timeout"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+
+class CircuitOpenError(Exception):
+    """Raised (and retried) while the breaker is open; `retry_after` is the remaining cool-down."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"circuit breaker open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def classify_error(e):
+    if isinstance(e, CircuitOpenError):
+        return TRANSIENT
+    if isinstance(e, openai.error.RateLimitError):
+        # An exhausted quota won't come back by waiting
+        return PERMANENT if getattr(e, "code", None) == "insufficient_quota" else RATE_LIMIT
+    if isinstance(e, (openai.error.Timeout, asyncio.TimeoutError, TimeoutError)):
+        return TIMEOUT
+    if isinstance(e, (openai.error.APIConnectionError, openai.error.ServiceUnavailableError,
+                      openai.error.TryAgain, ConnectionError)):
+        return TRANSIENT
+    if isinstance(e, openai.error.APIError) and (getattr(e, "http_status", None) or 500) >= 500:
+        return TRANSIENT
+    return PERMANENT
+
+
+def retry_after_seconds(e):
+    """Server-requested wait from a Retry-After / retry-after-ms header, if any."""
+    if isinstance(e, CircuitOpenError):
+        return e.retry_after
+    headers = getattr(e, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers.get("retry-after-ms")) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive retryable failures; while open, calls fail fast with
+    CircuitOpenError for `cooldown` seconds. After that a single probe call is let through
+    (half-open): success closes the breaker, a retryable failure re-opens it, a permanent
+    error (the endpoint answered) closes it, and a probe that never finished (cancelled,
+    interrupted) hands the probe to the next caller.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.opens = 0
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError while open; returns True if this caller is the half-open probe."""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self.probing:
+                raise CircuitOpenError(max(remaining, 0.5))
+            self.probing = True  # half-open: this caller is the probe
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self, kind, probe=False):
+        with self.lock:
+            if probe:
+                self.probing = False
+            if kind == PERMANENT:
+                if probe:
+                    # The endpoint answered; it's this request that is bad
+                    self.failures = 0
+                    self.opened_at = None
+                return
+            self.failures += 1
+            if probe or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.opens += 1
+
+    def release(self, probe):
+        """The probe ended without an outcome: let the next caller probe."""
+        if probe:
+            with self.lock:
+                self.probing = False
+
+    @contextmanager
+    def guard(self, probe):
+        """success / failure / release of before_call()'s `probe` for whatever the body does."""
+        try:
+            yield
+        except Exception as e:
+            self.failure(classify_error(e), probe)
+            raise
+        except BaseException:  # cancelled (e.g. the losing hedge's owner), Ctrl-C
+            self.release(probe)
+            raise
+        self.success()
+
+
+class LatencyTracker:
+    """Rolling window of successful request latencies."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def p95(self):
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class RequestPolicy:
+    def __init__(self, max_attempts=6, backoff_base=1.0, backoff_cap=60.0, timeout=120.0,
+                 breaker_threshold=5, breaker_cooldown=30.0, hedge=False, governor=None):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.hedge = hedge
+        self.governor = governor
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.latency = LatencyTracker()
+        self.stats = {RATE_LIMIT: 0, TIMEOUT: 0, TRANSIENT: 0, PERMANENT: 0,
+                      "gave_up": 0, "hedges": 0, "hedge_wins": 0}
+
+    def backoff(self, attempt, e):
+        """Full-jitter exponential backoff, but never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+        server = retry_after_seconds(e)
+        return max(delay, server) if server is not None else delay
+
+    def _failed(self, e, attempt):
+        kind = classify_error(e)
+        self.stats[kind] += 1
+        if kind == PERMANENT or attempt == self.max_attempts:
+            self.stats["gave_up"] += 1
+            return None
+        return self.backoff(attempt, e)
+
+    def _settle(self, ticket, result):
+        """Correct a governor reservation with the response's real token usage (0 on failure)."""
+        if ticket is not None:
+            self.governor.settle(ticket, self._used(ticket, result))
+
+    async def _asettle(self, ticket, result):
+        if ticket is not None:
+            await self.governor.asettle(ticket, self._used(ticket, result))
+
+    @staticmethod
+    def _used(ticket, result):
+        usage = result.get("usage") if isinstance(result, dict) else None
+        return usage["total_tokens"] if usage else (0 if result is None else ticket[1])
+
+    def call(self, fn, tokens=0):
+        """Run fn() (a blocking API call) with retries and the circuit breaker; `tokens` is the governor estimate."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self._attempt(fn, tokens)
+            except Exception as e:
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def _attempt(self, fn, tokens):
+        # The breaker first: an attempt it rejects must not take a governor slot
+        probe = self.breaker.before_call()
+        try:
+            ticket = self.governor.acquire(tokens) if self.governor is not None else None
+        except BaseException:
+            self.breaker.release(probe)  # refused by the governor: says nothing about the endpoint
+            raise
+        result = None
+        try:
+            with self.breaker.guard(probe):
+                t0 = time.perf_counter()
+                result = fn()
+        finally:
+            self._settle(ticket, result)
+        self.latency.add(time.perf_counter() - t0)
+        return result
+
+    async def acall(self, make_coro, tokens=0):
+        """Async version of call(); `make_coro()` must return a fresh coroutine per attempt."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await self._aattempt(make_coro, tokens)
+            except Exception as e:
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def _aattempt(self, make_coro, tokens):
+        probe = self.breaker.before_call()
+        try:
+            ticket = await self.governor.aacquire(tokens) if self.governor is not None else None
+        except BaseException:
+            self.breaker.release(probe)
+            raise
+        handed_over = False
+        try:
+            with self.breaker.guard(probe):
+                handed_over = True  # from here on the primary request settles the ticket
+                return await self._hedged(make_coro, tokens, ticket)
+        finally:
+            if not handed_over:
+                await self._asettle(ticket, None)
+
+    async def _timed(self, make_coro, tokens, ticket=None):
+        """`ticket`: a reservation already made by the caller; None reserves one here."""
+        if ticket is None and self.governor is not None:
+            ticket = await self.governor.aacquire(tokens)
+        t0 = time.perf_counter()
+        try:
+            result = await make_coro()
+        except BaseException:  # includes the cancelled loser of a hedge
+            # synchronous: a second cancel must not interrupt giving the reservation back
+            self._settle(ticket, None)
+            raise
+        await self._asettle(ticket, result)
+        self.latency.add(time.perf_counter() - t0)
+        return result
+
+    async def _hedged(self, make_coro, tokens=0, ticket=None):
+        p95 = self.latency.p95() if self.hedge else None
+        first = asyncio.ensure_future(self._timed(make_coro, tokens, ticket))
+        if p95 is None:
+            return await first
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=p95)
+            if done:
+                return first.result()
+
+            # Primary is in the slow tail: race an identical backup request against it
+            self.stats["hedges"] += 1
+            second = asyncio.ensure_future(self._timed(make_coro, tokens))
+            tasks.append(second)
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also when we are cancelled while waiting: no request may outlive its caller
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def report(self):
+        s = self.stats
+        p95 = self.latency.p95()
+        print("[REQUESTS] retried errors: rate_limit={}, timeout={}, transient={}; permanent={}; "
+              "gave up on {}; breaker opened {}x; hedges {} (won {}); p95 latency {}".format(
+                  s[RATE_LIMIT], s[TIMEOUT], s[TRANSIENT], s[PERMANENT], s["gave_up"],
+                  self.breaker.opens, s["hedges"], s["hedge_wins"],
+                  f"{p95:.2f}s" if p95 is not None else "n/a"))
+        if self.governor is not None:
+            self.governor.report()
+
+
+def add_policy_args(parser):
+    """Shared --max-attempts / --request-timeout / --breaker-* / --hedge flags."""
+    parser.add_argument("--max-attempts", type=int, default=6,
+                        help="Attempts per request for rate-limit/timeout/5xx errors (1 = no retries).")
+    parser.add_argument("--request-timeout", type=float, default=120.0,
+                        help="Seconds before a single API request counts as timed out.")
+    parser.add_argument("--breaker-threshold", type=int, default=5,
+                        help="Consecutive failures that open the circuit breaker.")
+    parser.add_argument("--breaker-cooldown", type=float, default=30.0,
+                        help="Seconds the breaker stays open before a probe request.")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a backup request when one runs past the observed p95 latency (async runs).")
+    add_governor_args(parser)
+    return parser
+
+
+def policy_from_args(args):
+    return RequestPolicy(
+        max_attempts=args.max_attempts,
+        timeout=args.request_timeout,
+        breaker_threshold=args.breaker_threshold,
+        breaker_cooldown=args.breaker_cooldown,
+        hedge=args.hedge,
+        governor=governor_from_args(args),
+    )
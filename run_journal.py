@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# run_journal.py
+# Write-ahead journal for the verb generators so a preempted / timed-out Slurm task can
+# be resumed. Every finished verb is appended to <output>.journal.jsonl; the output file
+# itself is rebuilt from the journal and swapped into place atomically on each group
+# flush, so it is never half-written. With resume=True, verbs that already succeeded are
+# skipped and only missing or ERROR verbs are sent again.
+import os
+import re
+import json
+
+HEADER_RE = re.compile(r"^==== Verb:\s*(.+?)\s*====\s*$")
+
+
+def split_verb_blocks(text):
+    """Split ==== Verb: x ==== text into a list of (verb, body) pairs."""
+    blocks = []
+    verb, lines = None, []
+    for line in text.splitlines(keepends=True):
+        m = HEADER_RE.match(line.rstrip("\n"))
+        if m:
+            if verb is not None:
+                blocks.append((verb, "".join(lines).strip()))
+            verb, lines = m.group(1), []
+        elif verb is not None:
+            lines.append(line)
+    if verb is not None:
+        blocks.append((verb, "".join(lines).strip()))
+    return blocks
+
+
+def parse_verb_blocks(path):
+    """Read a ==== Verb: x ==== text file into a list of (verb, body) pairs."""
+    with open(path, "r", encoding="utf-8") as f:
+        return split_verb_blocks(f.read())
+
+
+def _fsync_write(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RunJournal:
+    def __init__(self, output_path, verbs, resume=False, flush_every=10):
+        self.output_path = output_path
+        self.journal_path = output_path + ".journal.jsonl"
+        self.verbs = list(verbs)
+        self.flush_every = max(1, flush_every)
+        self.entries = {}  # verb -> {"status": "ok"|"error", "text": str}
+        self.unflushed = 0
+
+        if resume:
+            self._load()
+        elif os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.fjournal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _load(self):
+        if os.path.exists(self.journal_path):
+            self._drop_torn_tail()
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[rec["verb"]] = {"status": rec["status"], "text": rec["text"]}
+        elif os.path.exists(self.output_path):
+            # Output from a run that predates the journal: trust its non-ERROR blocks
+            for verb, body in parse_verb_blocks(self.output_path):
+                if body.startswith("ERROR:"):
+                    self.entries[verb] = {"status": "error", "text": body[len("ERROR:"):].strip()}
+                elif body:
+                    self.entries[verb] = {"status": "ok", "text": body}
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                for verb, entry in self.entries.items():
+                    f.write(json.dumps(dict(verb=verb, **entry), ensure_ascii=False) + "\n")
+
+    def _drop_torn_tail(self):
+        """Cut a torn last line (a task killed mid-write), so the next append starts on a line of its own."""
+        with open(self.journal_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def done(self):
+        return [v for v in self.verbs if self.entries.get(v, {}).get("status") == "ok"]
+
+    def pending(self):
+        """Verbs still to generate: never attempted, or attempted and errored."""
+        return [v for v in self.verbs if self.entries.get(v, {}).get("status") != "ok"]
+
+    def record(self, verb, text=None, error=None):
+        entry = {"status": "ok", "text": text} if error is None else {"status": "error", "text": str(error)}
+        self.entries[verb] = entry
+        self.fjournal.write(json.dumps(dict(verb=verb, **entry), ensure_ascii=False) + "\n")
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def render(self):
+        parts = []
+        for verb in self.verbs:
+            entry = self.entries.get(verb)
+            if entry is None:
+                continue
+            parts.append(f"==== Verb: {verb} ====\n")
+            if entry["status"] == "ok":
+                parts.append(entry["text"] + "\n\n")
+            else:
+                parts.append(f"ERROR: {entry['text']}\n\n")
+        return "".join(parts)
+
+    def flush(self):
+        """Group commit: make the journal durable, then atomically replace the output file."""
+        self.fjournal.flush()
+        os.fsync(self.fjournal.fileno())
+        _fsync_write(self.output_path, self.render())
+        self.unflushed = 0
+
+    def close(self):
+        self.flush()
+        self.fjournal.close()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# scenario_grammar.py
+# The scenario output format as a small left-to-right automaton, for constrained
+# decoding (llama_generation.ScenarioGrammarProcessor masks every token the automaton
+# can't consume). For roles ["Agent", "Location"] and 2 scenarios the only texts it
+# accepts look like
+#
+#   1. Agent: <field>; Location: <field>
+#   Sentence: "<sentence>"
+#
+#   2. Agent: <field>; Location: <field>
+#   Sentence: "<sentence>"
+#
+# then EOS. That is exactly what extract_sentences_and_roles.py and generate_scenarios.py
+# parse. A field is 1..field_chars characters without ; : " or a newline and doesn't
+# start with whitespace; a sentence is 1..sentence_chars characters without " or a newline.
+from collections import namedtuple
+
+FIELD_FORBIDDEN = frozenset(';:"\n')
+SENTENCE_FORBIDDEN = frozenset('"\n')
+
+Free = namedtuple("Free", "forbidden max_chars")
+
+
+class ScenarioGrammar:
+    """
+    States are (segment, offset): the position inside a literal, or the characters
+    written so far into a free segment. advance() returns None for text the format
+    doesn't allow. With closing=True, free segments get no more characters than their
+    minimum (one), which is how the decoder finishes inside its token budget.
+    """
+
+    def __init__(self, roles, scenarios=5, field_chars=48, sentence_chars=200):
+        self.roles = tuple(roles)
+        self.scenarios = scenarios
+        segments = []
+        for i in range(1, scenarios + 1):
+            for j, role in enumerate(self.roles):
+                lead = (("\n\n" if i > 1 else "") + f"{i}. ") if j == 0 else "; "
+                segments += [lead + f"{role}: ", Free(FIELD_FORBIDDEN, field_chars)]
+            segments += ['\nSentence: "', Free(SENTENCE_FORBIDDEN, sentence_chars), '"']
+        # Adjacent literals are merged ('"' + "\n\n2. Agent: ")
+        self.segments = []
+        for seg in segments:
+            if isinstance(seg, str) and self.segments and isinstance(self.segments[-1], str):
+                self.segments[-1] += seg
+            else:
+                self.segments.append(seg)
+        # Characters still needed to finish from the start of each segment (free segments: one)
+        self._needed = [0] * (len(self.segments) + 1)
+        for k in range(len(self.segments) - 1, -1, -1):
+            seg = self.segments[k]
+            self._needed[k] = self._needed[k + 1] + (len(seg) if isinstance(seg, str) else 1)
+
+    start = (0, 0)
+
+    def is_end(self, state):
+        return state[0] == len(self.segments)
+
+    def needed(self, state):
+        """Fewest characters (so also tokens) that can still complete the text from `state`."""
+        seg, off = state
+        if self.is_end(state):
+            return 0
+        if isinstance(self.segments[seg], str):
+            return self._needed[seg] - off
+        return self._needed[seg + 1] + (0 if off else 1)
+
+    def advance(self, state, text, closing=False):
+        seg, off = state
+        for ch in text:
+            while True:
+                if seg == len(self.segments):
+                    return None  # nothing may follow the last sentence
+                cur = self.segments[seg]
+                if isinstance(cur, str):
+                    if cur[off] != ch:
+                        return None
+                    off += 1
+                    if off == len(cur):
+                        seg, off = seg + 1, 0
+                    break
+                if ch not in cur.forbidden:
+                    if not closing:
+                        limit = cur.max_chars
+                    else:  # the field we started in keeps what it has; later ones get one character
+                        limit = max(1, state[1]) if seg == state[0] else 1
+                    if (off == 0 and ch.isspace()) or off + 1 > limit:
+                        return None
+                    off += 1
+                    break
+                # A forbidden character ends the free segment and must start the next literal
+                if off == 0:
+                    return None
+                seg, off = seg + 1, 0
+        return seg, off
+
+    def free_segment(self, state):
+        """The Free segment `state` is in, or None inside a literal / at the end."""
+        seg = state[0]
+        if seg < len(self.segments) and not isinstance(self.segments[seg], str):
+            return self.segments[seg]
+        return None
+
+    def next_char(self, state):
+        """Next required character inside a literal (None in a free segment or at the end)."""
+        seg, off = state
+        if seg < len(self.segments) and isinstance(self.segments[seg], str):
+            return self.segments[seg][off]
+        return None
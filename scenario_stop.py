@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# scenario_stop.py
+# When is a scenario response "done"? Shared by the OpenAI streaming path
+# (scenario_stream.py) and the LLaMA stopping criterion (llama_generation.py): after
+# `limit` complete `Sentence: "..."` lines, or, with ratings=True, after the rating block
+# that follows them (the first complete line mentioning an average, e.g.
+# "Average rating: 8.2"). Everything the models write past that point (the "which one
+# is best and why" essay) is dropped by the downstream tools anyway.
+import re
+
+SENTENCE_RE = re.compile(r'Sentence:\s*"([^"]+)"')
+# A finished line (newline seen) with "average" and a number, after the last sentence
+RATINGS_DONE_RE = re.compile(r"(?i)\baverage\b[^\n]*\d[^\n]*\n")
+
+
+class ScenarioParser:
+    """Incremental parser: feed() text deltas, get back the sentences they completed."""
+
+    def __init__(self, limit=5, ratings=False):
+        self.limit = limit
+        self.ratings = ratings
+        self.buf = ""
+        self.pos = 0
+        self.sentences = []
+        self.ratings_done = False
+
+    def feed(self, delta):
+        self.buf += delta
+        new = []
+        while len(self.sentences) < self.limit:
+            # The closing quote is part of the pattern, so a half-streamed sentence never matches
+            m = SENTENCE_RE.search(self.buf, self.pos)
+            if not m:
+                break
+            self.pos = m.end()
+            self.sentences.append(m.group(1))
+            new.append(m.group(1))
+        if self.ratings and len(self.sentences) >= self.limit and not self.ratings_done:
+            self.ratings_done = RATINGS_DONE_RE.search(self.buf, self.pos) is not None
+        return new
+
+    @property
+    def done(self):
+        return len(self.sentences) >= self.limit and (self.ratings_done or not self.ratings)
+
+
+def scenarios_done(text, limit=5, ratings=False):
+    """One-shot check of a whole text (used per decoding step by the LLaMA stopping criterion)."""
+    parser = ScenarioParser(limit, ratings)
+    parser.feed(text)
+    return parser.done
+
+
+def stop_label(limit, ratings=False):
+    """Cache-model suffix for truncated responses, so they never stand in for full ones."""
+    return f"+stop@{limit}" + ("+ratings" if ratings else "")
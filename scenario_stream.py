@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# scenario_stream.py
+# Streaming generation with incremental scenario extraction: completed
+# `Sentence: "..."` lines are handed out as soon as their closing quote arrives, and the
+# stream is cancelled once `limit` sentences are in (or, with ratings=True, once the
+# rating block after them is complete), so we never pay for (or wait on) the
+# "which one is best and why" tail.
+import time
+import openai
+from llm_requests import estimate_tokens, DEFAULT_POLICY
+from scenario_stop import ScenarioParser, stop_label
+
+
+class ScenarioStream:
+    """
+    Iterate the scenario sentences of one streamed ChatCompletion:
+
+        stream = ScenarioStream(prompt, limit=5, cache=cache)
+        for sentence in stream:
+            ...                      # runs while the model is still writing
+        stream.text                  # everything received before the stream was cut
+
+    Truncated responses are cached under "<model>+stop@<limit>" so they never stand in
+    for a full response in the normal (non-streaming) cache entries.
+
+    The async generators use `await stream.arun()` instead of iterating.
+    """
+
+    def __init__(self, prompt, limit=5, model="gpt-3.5-turbo", max_tokens=800, temperature=0.7, cache=None,
+                 policy=None, ratings=False):
+        self.prompt = prompt
+        self.limit = limit
+        self.ratings = ratings
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.cache = cache
+        self.policy = policy or DEFAULT_POLICY
+        self.text = ""
+        self.sentences = []
+        self.first_sentence_s = None
+        self.elapsed_s = None
+        self.stopped_early = False
+        self.from_cache = False
+
+    @property
+    def completion_tokens(self):
+        """Approximate completion tokens actually received (streams carry no usage block)."""
+        return estimate_tokens(self.text) if self.text else 0
+
+    def __iter__(self):
+        t0 = time.perf_counter()
+        parser = ScenarioParser(self.limit, self.ratings)
+        cache_model = self.model + stop_label(self.limit, self.ratings)
+        resp = None
+        cached = None
+        if self.cache is not None:
+            cached = self.cache.get(cache_model, self.prompt, self.temperature, self.max_tokens, 1)
+        if cached is not None:
+            self.from_cache = True
+            deltas = [cached]
+        else:
+            # Retries cover opening the stream; a stream that dies midway is not restarted
+            resp = self.policy.call(lambda: openai.ChatCompletion.create(
+                model=self.model,
+                messages=[{"role": "user", "content": self.prompt}],
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=True,
+                request_timeout=self.policy.timeout,
+            ), tokens=estimate_tokens(self.prompt) + self.max_tokens)  # streams carry no usage: the estimate stays
+            deltas = (chunk.choices[0].delta.get("content") or "" for chunk in resp)
+
+        finished = False
+        try:
+            for delta in deltas:
+                self.text += delta
+                for sentence in parser.feed(delta):
+                    if self.first_sentence_s is None:
+                        self.first_sentence_s = time.perf_counter() - t0
+                    self.sentences.append(sentence)
+                    yield sentence
+                if parser.done:
+                    self.stopped_early = True
+                    break
+            finished = True
+        finally:
+            if resp is not None and hasattr(resp, "close"):
+                resp.close()  # drops the HTTP stream -> server stops generating
+            self.elapsed_s = time.perf_counter() - t0
+
+        if finished and not self.from_cache and self.cache is not None:
+            self.cache.put(cache_model, self.prompt, self.temperature, self.max_tokens, 1, self.text.strip())
+
+    async def arun(self):
+        """Async counterpart of iterating (for the concurrent generators); returns the received text."""
+        t0 = time.perf_counter()
+        parser = ScenarioParser(self.limit, self.ratings)
+        cache_model = self.model + stop_label(self.limit, self.ratings)
+        cached = None
+        if self.cache is not None:
+            cached = await self.cache.aget(cache_model, self.prompt, self.temperature, self.max_tokens, 1)
+        if cached is not None:
+            self.from_cache = True
+            self.text = cached
+            self.sentences = parser.feed(cached)
+            self.elapsed_s = time.perf_counter() - t0
+            return cached
+
+        resp = await self.policy.acall(lambda: openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=[{"role": "user", "content": self.prompt}],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True,
+            request_timeout=self.policy.timeout,
+        ), tokens=estimate_tokens(self.prompt) + self.max_tokens)
+        try:
+            async for chunk in resp:
+                delta = chunk.choices[0].delta.get("content") or ""
+                self.text += delta
+                for sentence in parser.feed(delta):
+                    if self.first_sentence_s is None:
+                        self.first_sentence_s = time.perf_counter() - t0
+                    self.sentences.append(sentence)
+                if parser.done:
+                    self.stopped_early = True
+                    break
+        finally:
+            if hasattr(resp, "aclose"):
+                await resp.aclose()  # drops the HTTP stream -> server stops generating
+            self.elapsed_s = time.perf_counter() - t0
+
+        self.text = self.text.strip()
+        if self.cache is not None:
+            await self.cache.aput(cache_model, self.prompt, self.temperature, self.max_tokens, 1, self.text)
+        return self.text
+
+
+class StreamStats:
+    """Per-run summary of time-to-first-sentence and completion tokens received."""
+
+    def __init__(self):
+        self.streams = []
+
+    def add(self, stream):
+        self.streams.append(stream)
+
+    def report(self):
+        live = [s for s in self.streams if not s.from_cache]
+        if not live:
+            return
+        ttfs = [s.first_sentence_s for s in live if s.first_sentence_s is not None]
+        cut = [s for s in live if s.stopped_early]
+        print("[STREAM] {} streamed verbs, {} cut after the last scenario; mean time to first sentence "
+              "{:.2f}s, mean total {:.2f}s, ~{:.0f} completion tokens/verb received".format(
+                  len(live), len(cut),
+                  sum(ttfs) / len(ttfs) if ttfs else float("nan"),
+                  sum(s.elapsed_s for s in live) / len(live),
+                  sum(s.completion_tokens for s in live) / len(live)))
+        if cut:
+            # Upper bound: the model may have ended before max_tokens on its own
+            print("[STOP] cut verbs left up to ~{:.0f} of their {} max_tokens ungenerated".format(
+                sum(s.max_tokens - s.completion_tokens for s in cut) / len(cut), cut[0].max_tokens))
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# stub_openai_server.py
+# Tiny local stand-in for the OpenAI /v1/chat/completions endpoint, used to time and
+# check the generators without spending API credits.
+#
+#   python stub_openai_server.py --port 8765 --latency 0.5
+#   export OPENAI_API_BASE=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VERB_RE = re.compile(r'verb "([^"]+)"')
+PACKED_RE = re.compile(r"For EACH of the \d+ verbs (.+?), create")
+
+
+def fake_completion(prompt, drop_packed_every=0, tail_words=0):
+    """
+    Scenario text in the same shape the real models return; `tail_words` appends an
+    explanation essay after the ratings, like the real "which one is best" answers.
+    """
+    m = PACKED_RE.search(prompt)
+    if m:
+        # Packed prompt: one ==== Verb: ==== section per verb, optionally dropping some
+        verbs = re.findall(r'"([^"]+)"', m.group(1))
+        return "\n\n".join(
+            f"==== Verb: {v} ====\n" + fake_completion(f'verb "{v}"')
+            for i, v in enumerate(verbs, start=1)
+            if not (drop_packed_every and i % drop_packed_every == 0)
+        )
+    m = VERB_RE.search(prompt)
+    verb = m.group(1) if m else "act"
+    blocks = []
+    for i in range(1, 6):
+        blocks.append(
+            f"{i}. Agent: agent {i}; Patient: patient {i}; Instrument: tool {i}; Location: place {i}\n"
+            f"Sentence: \"Agent {i} is {verb}ing patient {i} with tool {i} in place {i}.\""
+        )
+    text = "\n\n".join(blocks) + "\n\nBest scenario: 1. Ratings: 9, 8, 8, 7, 7. Average: 7.8"
+    if tail_words:
+        text += "\n\nExplanation: " + " ".join(f"reason{i % 50}" for i in range(tail_words)) + "."
+    return text
+
+
+def cached_prefix_tokens(prompt, seen, block=64):
+    """
+    Emulate a block-level prompt prefix cache (vLLM / OpenAI style): tokens of the longest
+    prefix shared with an earlier prompt, rounded down to whole blocks. (OpenAI also
+    requires a prompt of >= 1024 tokens before anything is cached; not modelled here.)
+    """
+    best = 0
+    for other in seen:
+        n = len(os.path.commonprefix([prompt, other]))
+        best = max(best, n)
+    return (best // 4) // block * block
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    token_latency = 0.0  # simulated decode time per completion token (~4 chars)
+    drop_packed_every = 0
+    tail_words = 0
+    seen_prompts = None  # recent prompts, for the prefix-cache emulation
+    seen_lock = threading.Lock()
+    # Fault injection (fractions of requests); see add_fault_args
+    faults = None
+    rng = None
+    started = 0.0
+    counts = None
+
+    def pick_fault(self):
+        f = self.faults or {}
+        with self.seen_lock:
+            self.counts["requests"] += 1
+            elapsed = time.time() - self.started
+            if f.get("outage_start") is not None and \
+                    f["outage_start"] <= elapsed < f["outage_start"] + f.get("outage_seconds", 0):
+                self.counts["outage"] += 1
+                return "outage"
+            r = self.rng.random()
+        for name in ("rate_limit", "server_error", "unavailable", "slow"):
+            r -= f.get(name, 0.0)
+            if r < 0:
+                with self.seen_lock:
+                    self.counts[name] += 1
+                return name
+        return None
+
+    def send_error_json(self, code, message, extra_headers=None):
+        data = json.dumps({"error": {"message": message, "type": "stub_error", "code": None}}).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        fault = self.pick_fault()
+        if fault == "rate_limit":
+            return self.send_error_json(429, "Rate limit reached (stub)",
+                                        {"Retry-After": str(self.faults.get("retry_after", 0.2))})
+        if fault == "server_error":
+            return self.send_error_json(500, "Internal server error (stub)")
+        if fault in ("unavailable", "outage"):
+            return self.send_error_json(503, "The server is overloaded (stub)")
+        time.sleep(self.latency + (self.faults.get("slow_seconds", 2.0) if fault == "slow" else 0.0))
+
+        content = fake_completion(prompt, self.drop_packed_every, self.tail_words)
+        with self.seen_lock:
+            cached = cached_prefix_tokens(prompt, self.seen_prompts)
+            self.seen_prompts.append(prompt)
+            del self.seen_prompts[:-64]
+        if body.get("stream"):
+            return self.stream_content(body, content)
+        time.sleep(self.token_latency * len(content) / 4)
+        payload = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                for i in range(body.get("n", 1) or 1)
+            ],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "prompt_tokens_details": {"cached_tokens": cached},
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        }
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream_content(self, body, content):
+        """Server-sent events, one word per chunk, like the real streaming endpoint."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        deltas = [{"role": "assistant", "content": ""}] + [
+            {"content": piece} for piece in re.findall(r"\S+\s*|\s+", content)
+        ]
+        try:
+            for delta in deltas:
+                time.sleep(self.token_latency * len(delta["content"]) / 4)
+                chunk = {
+                    "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled the stream
+
+    def log_message(self, fmt, *args):
+        pass  # keep benchmark output readable
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # default of 5 drops connections under high concurrency
+
+
+def start_stub_server(port=0, latency=0.0, drop_packed_every=0, token_latency=0.0, faults=None, seed=0,
+                      tail_words=0):
+    """
+    Start the stub in a daemon thread. Returns (server, api_base).
+
+    `faults` injects failures, e.g. {"rate_limit": 0.05, "server_error": 0.05, "unavailable": 0.05,
+    "slow": 0.05, "slow_seconds": 2.0, "retry_after": 0.2, "outage_start": 3, "outage_seconds": 2}.
+    Per-kind counts are kept in server.counts.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "latency": latency, "token_latency": token_latency,
+        "drop_packed_every": drop_packed_every, "tail_words": tail_words, "seen_prompts": [],
+        "faults": faults or {}, "rng": random.Random(seed), "started": time.time(),
+        "counts": dict.fromkeys(["requests", "rate_limit", "server_error", "unavailable", "slow", "outage"], 0),
+    })
+    server = StubServer(("127.0.0.1", port), handler)
+    server.counts = handler.counts
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local stub of the OpenAI chat completions endpoint.")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.5, help="Seconds to sleep per request.")
+    ap.add_argument("--token-latency", type=float, default=0.0,
+                    help="Seconds of simulated decode time per completion token.")
+    ap.add_argument("--drop-packed-every", type=int, default=0,
+                    help="In packed (multi-verb) replies, omit every Nth verb's section.")
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of requests answered 429.")
+    ap.add_argument("--server-error", type=float, default=0.0, help="Fraction answered 500.")
+    ap.add_argument("--unavailable", type=float, default=0.0, help="Fraction answered 503.")
+    ap.add_argument("--slow", type=float, default=0.0, help="Fraction delayed by --slow-seconds.")
+    ap.add_argument("--slow-seconds", type=float, default=2.0)
+    ap.add_argument("--outage-start", type=float, default=None, help="Seconds after start of a 503 outage.")
+    ap.add_argument("--outage-seconds", type=float, default=0.0)
+    ap.add_argument("--tail-words", type=int, default=0, help="Explanation words written after the ratings.")
+    a = ap.parse_args()
+    faults = {"rate_limit": a.rate_limit, "server_error": a.server_error, "unavailable": a.unavailable,
+              "slow": a.slow, "slow_seconds": a.slow_seconds,
+              "outage_start": a.outage_start, "outage_seconds": a.outage_seconds}
+    server, base = start_stub_server(a.port, a.latency, a.drop_packed_every, a.token_latency, faults,
+                                     tail_words=a.tail_words)
+    print(f"Stub OpenAI endpoint at {base} (latency {a.latency}s). Ctrl-C to stop.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,11 +1,19 @@
-from transition_amr_parser.parse import AMRParser
-
-# this will download “AMR3-structbart-L” into your Torch cache
-parser = AMRParser.from_pretrained("AMR3-structbart-L")
-
-def parse_amr(text):
-    tok, _ = parser.tokenize(text)
-    _, mac = parser.parse_sentence(tok)
-    return mac.get_amr().to_penman(jamr=False, isi=True)
-
-print(parse_amr("The toddler pushes the cart in the supermarket."))
+from amr_cache import ParseCache
+from amr_parsing import AMRClient
+
+# graphs already parsed by any of the AMR scripts come from the on-disk cache (AMR_CACHE=off to bypass);
+# the rest go to a running amr_server.py, and only without one is “AMR3-structbart-L” loaded here
+# (downloaded into your Torch cache the first time)
+cache = ParseCache()
+parser = AMRClient("AMR3-structbart-L")
+
+def parse_amr(text):
+    graph = cache.get("AMR3-structbart-L", text)
+    if graph is None:
+        graph = parser.parse_one(text)
+        cache.put("AMR3-structbart-L", text, graph)
+    return graph
+
+print(parse_amr("The toddler pushes the cart in the supermarket."))
+cache.report()
+cache.close()
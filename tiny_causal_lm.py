@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# tiny_causal_lm.py
+# Builds a tiny, randomly initialised LLaMA-architecture model plus a byte-level BPE
+# tokenizer trained on our own prompts, saved like a Hugging Face checkpoint. The LLaMA
+# benchmarks use it to exercise the real generate() / KV-cache code paths on CPU in
+# seconds, without downloading weights. Its text is noise; timings and equivalence
+# checks are what it's for.
+#
+#   python tiny_causal_lm.py /tmp/tiny-llama
+import os
+import sys
+import glob
+
+import pandas as pd
+
+
+def llama_prompt(verb):
+    """Same instructions as build_prompt() in the LLaMA generators."""
+    return f"""
+For the verb "{verb}" (do not include synonyms of this verb), list five distinct, prototypical scenarios encountered in everyday life, each with a unique combination of: agent (who/what performs the action; must be specific and unique across examples), patient (who/what is the recipient of the action; must differ in each case), instrument (the means of performing the action), and location (where/direction of the action).
+
+Avoid descriptive adjectives. For each scenario, provide specific, concrete examples for all four roles (e.g., not just "a person" but "a toddler"; not just "a room" but "a grocery store") and include a sample sentence where all roles are explicitly named (no implied roles). Avoid repeating agents and avoid generic terms (e.g., "thing," "place")—opt for vivid details.
+
+Finally, evaluate which of the five examples fits the prompt best and explain why.
+"""
+
+
+def llama_prompt_v2(verb):
+    """(prefix, suffix) of the v2 prompt (PROMPT_PREFIX_V2 / build_prompt_suffix_v2 in the LLaMA generators)."""
+    prefix = llama_prompt("\0").replace('For the verb "\0"', "For the target verb named at the end of this message")
+    return prefix, f'\nTarget verb: "{verb}"\n'
+
+
+def repo_verbs():
+    """Verbs of every dataset CSV in the repo, in file order, de-duplicated."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    verbs = []
+    for path in sorted(glob.glob(os.path.join(here, "*.csv"))):
+        verbs.extend(pd.read_csv(path).iloc[1:, 0].dropna().astype(str).tolist())
+    return list(dict.fromkeys(verbs))
+
+
+def build_tiny_model(out_dir, hidden_size=128, layers=4, vocab_size=2000, seed=0):
+    """Create (or reuse) the tiny checkpoint in out_dir; returns out_dir."""
+    if os.path.exists(os.path.join(out_dir, "config.json")):
+        return out_dir
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    corpus = [llama_prompt(v) for v in repo_verbs()]
+    corpus += ['Sentence: "The chef is cutting the carrots with a knife in the kitchen."',
+               "Agent: chef; Patient: carrots; Instrument: knife; Location: kitchen"]
+    tok = Tokenizer(models.BPE(unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    tok.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=vocab_size, special_tokens=["<unk>", "<s>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="<unk>", bos_token="<s>", eos_token="</s>",
+                                        model_input_names=["input_ids", "attention_mask"])
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=hidden_size, intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers, num_attention_heads=4, num_key_value_heads=4,
+        max_position_embeddings=2048, bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+    )
+    model = LlamaForCausalLM(config)
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)
+    model.save_pretrained(out_dir)
+    return out_dir
+
+
+if __name__ == "__main__":
+    path = build_tiny_model(sys.argv[1] if len(sys.argv) > 1 else "tiny-llama")
+    print(f"Tiny model saved to {path}")
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# work_queue.py
+# Shared work queue for the OpenAI generation runs, replacing the fixed --start/--end
+# slicing in openai_gen_array.slurm. `init` splits every dataset's verb list into small
+# units (dataset, start, end); any number of workers (Slurm array tasks or local
+# processes) then `work`: claim the next unit, run openAI_generator_batch.py on it, mark
+# it done and claim again. A fast worker simply takes more units, so the run ends about
+# one unit after the slowest verb instead of after the slowest fixed chunk.
+#
+# Claims are leases: a running worker renews its lease while the generator runs, and a
+# unit whose lease expired (worker killed / preempted / timed out) is handed to the next
+# worker that asks. The generator always runs with --resume, so a re-claimed unit only
+# regenerates verbs its previous owner had not journaled yet.
+#
+#   python work_queue.py --queue q.sqlite init agent_location all_roles   # 8 verbs per unit
+#   python work_queue.py --queue q.sqlite work          # start as many of these as you like
+#   python work_queue.py --queue q.sqlite status
+#   python work_queue.py --queue q.sqlite requeue [--all]   # before submitting the array again
+#
+# `init` never touches units that are already queued, so once a run has finished every
+# unit is done or failed and a new array would exit straight away. `requeue` puts the
+# failed units back (--all: the done ones too, e.g. after a prompt change; the generator
+# still resumes from each unit's journal, so delete the outputs for a fresh draw).
+#
+# Backed by SQLite in rollback-journal mode; every claim is one BEGIN IMMEDIATE
+# transaction, so two workers can never take the same unit. Not WAL: the queue sits on
+# /ix1 and is shared by tasks on different nodes, and WAL's shared-memory index only
+# works between processes of one host. The rollback journal uses plain file locks.
+import os
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import subprocess
+
+import pandas as pd
+from run_journal import parse_verb_blocks
+
+# Same files as openAI_generator_batch.py
+INPUT_FILES = {
+    "agent_location": r"./AgentLocation51.csv",
+    "agent_location_instrument": r"./AgentLocationInstrument5.csv",
+    "agent_location_patient": r"./AgentLocationPatient61.csv",
+    "all_roles": r"./all_roles60.csv",
+}
+GENERATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openAI_generator_batch.py")
+
+TODO = "todo"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def count_verbs(dataset_key):
+    """Number of verbs openAI_generator_batch.py sees for this dataset (same header skip / dropna)."""
+    return len(pd.read_csv(INPUT_FILES[dataset_key]).iloc[1:, 0].dropna())
+
+
+class WorkQueue:
+    def __init__(self, path, lease_seconds=600.0, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # isolation_level=None: transactions are explicit (BEGIN IMMEDIATE) below
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # File locks work across nodes on the shared filesystem; WAL would not (see top)
+        self.db.execute("PRAGMA journal_mode=DELETE")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            " id INTEGER PRIMARY KEY, dataset TEXT, start INTEGER, end INTEGER,"
+            " status TEXT, worker TEXT, lease_until REAL, attempts INTEGER DEFAULT 0,"
+            " started REAL, finished REAL, error TEXT, UNIQUE (dataset, start))"
+        )
+
+    def add(self, dataset_key, n_verbs, unit_size):
+        """Split verbs [0, n_verbs) into units. Idempotent: units already queued are kept as they are."""
+        self.db.execute("BEGIN IMMEDIATE")
+        before = self.db.total_changes
+        for start in range(0, n_verbs, unit_size):
+            self.db.execute(
+                "INSERT OR IGNORE INTO units (dataset, start, end, status) VALUES (?, ?, ?, ?)",
+                (dataset_key, start, min(start + unit_size, n_verbs), TODO),
+            )
+        self.db.execute("COMMIT")
+        return self.db.total_changes - before
+
+    def requeue(self, statuses=(FAILED,)):
+        """Put units with these statuses back in the queue with a fresh attempt count; returns how many."""
+        cur = self.db.execute(
+            "UPDATE units SET status = ?, worker = NULL, lease_until = NULL, attempts = 0, error = NULL"
+            " WHERE status IN ({})".format(",".join("?" * len(statuses))),
+            (TODO,) + tuple(statuses),
+        )
+        return cur.rowcount
+
+    def claim(self, worker):
+        """Lease the next unit that is queued or whose lease expired; None if there is none right now."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute(
+                "UPDATE units SET status = ?, error = 'lease expired on last attempt'"
+                " WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+            row = self.db.execute(
+                "SELECT id, dataset, start, end, attempts FROM units"
+                " WHERE (status = ? OR (status = ? AND lease_until < ?)) AND attempts < ?"
+                " ORDER BY attempts, id LIMIT 1",
+                (TODO, LEASED, now, self.max_attempts),
+            ).fetchone()
+            if row is not None:
+                self.db.execute(
+                    "UPDATE units SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1,"
+                    " started = ? WHERE id = ?",
+                    (LEASED, worker, now + self.lease_seconds, now, row[0]),
+                )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"id": row[0], "dataset": row[1], "start": row[2], "end": row[3], "attempt": row[4] + 1}
+
+    def renew(self, unit, worker):
+        """Extend our lease; False if the unit was meanwhile re-claimed by someone else."""
+        cur = self.db.execute(
+            "UPDATE units SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+            (time.time() + self.lease_seconds, unit["id"], worker, LEASED),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, unit, worker, error=None):
+        """Mark our unit done, or put it back in the queue (failed for good after max_attempts)."""
+        if error is None:
+            status = DONE
+        else:
+            status = FAILED if unit["attempt"] >= self.max_attempts else TODO
+        self.db.execute(
+            "UPDATE units SET status = ?, finished = ?, error = ?, lease_until = NULL"
+            " WHERE id = ? AND worker = ?",
+            (status, time.time(), error, unit["id"], worker),
+        )
+        return status
+
+    def outstanding(self):
+        """Units still to run or running (leases included, since they may expire and come back)."""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM units WHERE status = ? OR (status = ? AND attempts < ?)"
+            " OR (status = ? AND lease_until >= ?)",
+            (TODO, LEASED, self.max_attempts, LEASED, time.time()),
+        ).fetchone()[0]
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+
+    def report(self):
+        c = self.counts()
+        print("[QUEUE] {} units: {} done, {} leased, {} queued, {} failed ({})".format(
+            sum(c.values()), c.get(DONE, 0), c.get(LEASED, 0), c.get(TODO, 0), c.get(FAILED, 0), self.path))
+        for dataset, start, end, worker, error in self.db.execute(
+            "SELECT dataset, start, end, worker, error FROM units WHERE status = ? ORDER BY id", (FAILED,)
+        ):
+            print(f"[QUEUE] failed: {dataset} {start}:{end} (last worker {worker}): {error}")
+        slow = self.db.execute(
+            "SELECT dataset, start, end, finished - started AS secs FROM units"
+            " WHERE status = ? ORDER BY secs DESC LIMIT 3", (DONE,)
+        ).fetchall()
+        if slow:
+            print("[QUEUE] slowest units: " + ", ".join(f"{d} {s}:{e} {t:.0f}s" for d, s, e, t in slow))
+
+    def close(self):
+        self.db.close()
+
+
+# ==== Worker ====
+def unit_errors(output_dir, unit):
+    """Verbs of a finished unit that ended up as ERROR blocks in its output file."""
+    path = os.path.join(output_dir, f"verb_outputs_{unit['dataset']}_chunk{unit['start']}.txt")
+    if not os.path.exists(path):
+        return ["<no output file>"]
+    return [verb for verb, body in parse_verb_blocks(path) if body.startswith("ERROR:")]
+
+
+def run_unit(queue, unit, worker, output_dir, extra_args):
+    cmd = [sys.executable, GENERATOR,
+           "--file", unit["dataset"], "--start", str(unit["start"]), "--end", str(unit["end"]),
+           "--chunk-id", str(unit["start"]), "--output-dir", output_dir, "--resume"] + extra_args
+    proc = subprocess.Popen(cmd)
+    heartbeat = max(1.0, queue.lease_seconds / 3)
+    while True:
+        try:
+            rc = proc.wait(timeout=heartbeat)
+            break
+        except subprocess.TimeoutExpired:
+            if not queue.renew(unit, worker):
+                # Our lease ran out (e.g. the node stalled) and another worker owns it now
+                proc.kill()
+                proc.wait()
+                return "lost lease"
+    if rc != 0:
+        return f"generator exited with {rc}"
+    bad = unit_errors(output_dir, unit)
+    return f"{len(bad)} verbs ended in ERROR: {', '.join(bad[:5])}" if bad else None
+
+
+def work(queue, worker, output_dir, extra_args, poll=30.0):
+    ran = 0
+    while True:
+        unit = queue.claim(worker)
+        if unit is None:
+            if not queue.outstanding():
+                break
+            # Others still hold leases; wait in case one of them dies and its unit comes back
+            time.sleep(poll)
+            continue
+        print(f"[QUEUE] {worker}: {unit['dataset']} {unit['start']}:{unit['end']} (attempt {unit['attempt']})")
+        t0 = time.time()
+        error = run_unit(queue, unit, worker, output_dir, extra_args)
+        status = queue.complete(unit, worker, error)
+        print(f"[QUEUE] {worker}: {unit['dataset']} {unit['start']}:{unit['end']} -> {status} "
+              f"in {time.time() - t0:.0f}s" + (f" ({error})" if error else ""))
+        ran += 1
+    print(f"[QUEUE] {worker}: no work left after {ran} units")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Lease-based work queue for openAI_generator_batch.py.")
+    ap.add_argument("--queue", required=True, help="SQLite file shared by all workers.")
+    ap.add_argument("--lease-seconds", type=float, default=600.0,
+                    help="A unit whose worker stops renewing for this long is handed out again.")
+    ap.add_argument("--max-attempts", type=int, default=3, help="Give up on a unit after this many claims.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("init", help="Queue every verb of the given datasets (safe to run from every task).")
+    p.add_argument("datasets", nargs="*", choices=list(INPUT_FILES), default=list(INPUT_FILES))
+    p.add_argument("--unit-size", type=int, default=8,
+                   help="Verbs per unit. Each unit starts one generator process (interpreter, pandas, "
+                        "openai, cache); 8 spreads that start-up over several verbs and leaves room for "
+                        "--pack, while a run still ends at most one small unit after the slowest verb.")
+    p = sub.add_parser("work", help="Claim and run units until the queue is drained.")
+    p.add_argument("--worker", default=f"{socket.gethostname()}:{os.getpid()}")
+    p.add_argument("--output-dir", default="/ix1/xli/dgt12/outputs")
+    p.add_argument("--poll", type=float, default=30.0, help="Seconds between claims while others hold leases.")
+    p.add_argument("generator_args", nargs=argparse.REMAINDER,
+                   help="Extra openAI_generator_batch.py flags after `--` (e.g. -- --pack 4 --prompt-version v2).")
+    sub.add_parser("status", help="Print queue counts, failed and slowest units.")
+    p = sub.add_parser("requeue", help="Queue failed units again, with fresh attempts (before a new submission).")
+    p.add_argument("--all", action="store_true", help="Requeue done units too, not only failed ones.")
+    a = ap.parse_args()
+
+    queue = WorkQueue(a.queue, a.lease_seconds, a.max_attempts)
+    if a.cmd == "init":
+        for key in a.datasets:
+            n = count_verbs(key)
+            print(f"[QUEUE] {key}: {n} verbs, {queue.add(key, n, max(1, a.unit_size))} new units")
+    elif a.cmd == "work":
+        extra = [x for x in a.generator_args if x != "--"]
+        work(queue, a.worker, a.output_dir, extra, a.poll)
+    elif a.cmd == "requeue":
+        n = queue.requeue((FAILED, DONE) if a.all else (FAILED,))
+        print(f"[QUEUE] requeued {n} {'done and failed' if a.all else 'failed'} units")
+    queue.report()
+    queue.close()